@@ -25,19 +25,34 @@
 
 import inspect
 import logging
-import requests
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from dateutil import parser
 
+from grimoire.elk.elastic import ElasticSearch
 from grimoire.ocean.conf import ConfOcean
 from grimoire.utils import get_elastic
 from grimoire.utils import get_connectors, get_connector_from_name
 
+REPO_WORKERS = 4  # repositories fed at the same time
+BACKEND_WORKERS = {"gerrit": 2}  # max repositories fed at the same time per backend
+
 def feed_backend(url, clean, fetch_cache, backend_name, backend_params,
-                 es_index=None, es_index_enrich=None, project=None):
-    """ Feed Ocean with backend data """
+                 es_index=None, es_index_enrich=None, project=None,
+                 bulk_workers=0, dead_letter_file=None, compress=False,
+                 bulk_load=False, force_merge=False, checkpoints=False,
+                 skip_unchanged=False, enrich_params=None, set_conf=True):
+    """ Feed Ocean with backend data
+
+    With enrich_params, the fetched items are also enriched in the same
+    pipeline (fused feed and enrich). It is a dict with the params for
+    get_enrich_backend and events_enrich.
+
+    With set_conf False, ConfOcean must be already configured. It is
+    shared by all the threads feeding repositories.
+    """
 
     backend = None
     repo = {}    # repository data to be stored in conf
@@ -52,6 +67,8 @@ def feed_backend(url, clean, fetch_cache, backend_name, backend_params,
     connector = get_connector_from_name(backend_name)
     klass = connector[3]  # BackendCmd for the connector
 
+    elastic_ocean = None
+    enrich = None
     try:
         backend_cmd = klass(*backend_params)
 
@@ -62,11 +79,35 @@ def feed_backend(url, clean, fetch_cache, backend_name, backend_params,
 
         if not es_index:
             es_index = backend_name + "_" + backend.origin
-        elastic_ocean = get_elastic(url, es_index, clean, ocean_backend)
+        elastic_ocean = get_elastic(url, es_index, clean, ocean_backend,
+                                    bulk_workers, dead_letter_file, compress,
+                                    bulk_load, force_merge)
 
         ocean_backend.set_elastic(elastic_ocean)
 
-        ConfOcean.set_elastic(elastic_ocean)
+        if set_conf:
+            ConfOcean.set_elastic(elastic_ocean)
+
+        if checkpoints:
+            # Same id used for the repo in ConfOcean
+            ocean_backend.checkpoint_id = es_index + "_" + backend.origin
+        ocean_backend.skip_unchanged = skip_unchanged
+
+        if enrich_params is not None:
+            enrich_params = dict(enrich_params)
+            events_enrich = enrich_params.pop('events_enrich', False)
+            enrich_index = es_index_enrich
+            if not enrich_index:
+                enrich_index = es_index + "_enrich"
+            if events_enrich:
+                enrich_index += "_events"
+            enrich = get_enrich_backend(url, clean, backend_name, enrich_index,
+                                        bulk_workers=bulk_workers,
+                                        dead_letter_file=dead_letter_file,
+                                        compress=compress, bulk_load=bulk_load,
+                                        force_merge=force_merge, **enrich_params)
+            ocean_backend.set_enrich(enrich, events_enrich)
+            logging.info("Enriching in %s while feeding", enrich.elastic.index_url)
 
         repo['repo_update_start'] = datetime.now().isoformat()
 
@@ -114,6 +155,15 @@ def feed_backend(url, clean, fetch_cache, backend_name, backend_params,
         repo['error'] = str(ex)
     else:
         repo['success'] = True
+    finally:
+        # Stop the bulk writers also after errors
+        if elastic_ocean:
+            repo['bulk_stats'] = elastic_ocean.close_bulk()
+        if enrich:
+            enrich.close_processes()
+            bulk_stats = enrich.elastic.close_bulk()
+            logging.info("Enriched items in bulk: %i ok, %i failed, %i retried",
+                         bulk_stats['ok'], bulk_stats['failed'], bulk_stats['retried'])
 
     repo['repo_update'] = datetime.now().isoformat()
     repo['index'] = es_index
@@ -129,6 +179,71 @@ def feed_backend(url, clean, fetch_cache, backend_name, backend_params,
 
     logging.info("Done %s " % (backend_name))
 
+    return repo
+
+
+def feed_repos(url, clean, repos, workers=REPO_WORKERS, backend_workers=None,
+               **feed_params):
+    """ Feed Ocean with several repositories at the same time
+
+    The repositories are fed in threads sharing the HTTP sessions to ES.
+    A repository is not started while its backend has the max number of
+    repositories being fed, so the other backends can use the workers.
+
+    :param repos: list of repos as stored in ConfOcean (backend_name,
+                  backend_params, index, index_enrich and project)
+    :param workers: repositories fed at the same time
+    :param backend_workers: dict with the max repositories fed at the
+                            same time per backend, added to BACKEND_WORKERS
+    :param feed_params: extra params for feed_backend
+    :returns: number of repositories fed without errors
+    """
+
+    limits = dict(BACKEND_WORKERS)
+    if backend_workers:
+        limits.update(backend_workers)
+    limits = {name: max(1, limit) for name, limit in limits.items()}
+
+    if ConfOcean.elastic is None:
+        # Configured once here, the feeding threads don't change it
+        ConfOcean.set_elastic(get_elastic(url, ConfOcean.get_index()))
+
+    pending = list(repos)
+    running = {}  # future -> backend name
+    ok = 0
+
+    logging.info("Feeding %i repositories with %i workers", len(pending), workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            busy = list(running.values())
+            for repo in list(pending):
+                if len(running) >= workers:
+                    break
+                name = repo['backend_name']
+                if name in limits and busy.count(name) >= limits[name]:
+                    continue
+                future = executor.submit(feed_backend, url, clean, False, name,
+                                         repo['backend_params'], repo.get('index'),
+                                         repo.get('index_enrich'), repo.get('project'),
+                                         set_conf=False, **feed_params)
+                running[future] = name
+                busy.append(name)
+                pending.remove(repo)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                try:
+                    if future.result()['success']:
+                        ok += 1
+                except Exception as ex:
+                    logging.error("Error feeding repository: %s", ex)
+
+    logging.info("Fed %i repositories (%i with errors)", ok, len(repos) - ok)
+
+    return ok
+
 
 def get_items_from_uuid(uuid, enrich_backend, ocean_backend):
     """ Get all items that include uuid """
@@ -158,7 +273,7 @@ def get_items_from_uuid(uuid, enrich_backend, ocean_backend):
     url_search = enrich_backend.elastic.index_url+"/_search"
     url_search +="?size=1000"  # TODO get all items
 
-    r = requests.post(url_search, data=query)
+    r = enrich_backend.elastic.requests.post(url_search, data=query)
 
     eitems = r.json()['hits']['hits']
 
@@ -187,7 +302,7 @@ def get_items_from_uuid(uuid, enrich_backend, ocean_backend):
     items_ids_query = items_ids_query[:-1]  # remove last , for last item
 
     query = '{"docs" : [%s]}' % (items_ids_query)
-    r = requests.post(url_mget, data=query)
+    r = ocean_backend.elastic.requests.post(url_mget, data=query)
 
     res_items = r.json()['docs']
 
@@ -202,7 +317,11 @@ def refresh_projects(enrich_backend):
     logging.debug("Refreshing project field in %s", enrich_backend.elastic.index_url)
     total = 0
 
-    eitems = enrich_backend.fetch()
+    fields = enrich_backend.get_fields_project()
+    if fields is not None:
+        fields = fields + ['origin', enrich_backend.get_field_unique_id()]
+
+    eitems = enrich_backend.fetch(fields)
     for eitem in eitems:
         new_project = enrich_backend.get_item_project(eitem)
         eitem.update(new_project)
@@ -215,12 +334,17 @@ def refresh_identities(enrich_backend):
     logging.debug("Refreshing identities fields from %s", enrich_backend.elastic.index_url)
     total = 0
 
-    for eitem in enrich_backend.fetch():
-        roles = None
-        try:
-            roles = enrich_backend.roles
-        except AttributeError:
-            pass
+    roles = None
+    try:
+        roles = enrich_backend.roles
+    except AttributeError:
+        pass
+
+    # Only the SH ids and the date are needed to refresh the identities
+    fields = [enrich_backend.get_field_unique_id(), enrich_backend.get_field_date()]
+    fields += [rol + "_id" for rol in (roles or [enrich_backend.get_field_author()])]
+
+    for eitem in enrich_backend.fetch(fields):
         new_identities = enrich_backend.get_item_sh_from_id(eitem, roles)
         eitem.update(new_identities)
         yield eitem
@@ -238,7 +362,9 @@ def load_identities(ocean_backend, enrich_backend):
     items_count = 0
     new_identities = []
 
-    for item in ocean_backend:
+    fields = enrich_backend.get_fields_identities()
+
+    for item in ocean_backend.fetch(fields):
         items_count += 1
         # Get identities from new items to be added to SortingHat
         identities = enrich_backend.get_identities(item)
@@ -257,15 +383,49 @@ def load_identities(ocean_backend, enrich_backend):
 
     return items_count
 
-def enrich_items(items, enrich_backend, events=False):
+def enrich_items(items, enrich_backend, events=False, workers=0):
+    """ Enrich the items. With workers > 1 the ocean backend items are read
+        in slices which are enriched in parallel.
+    """
     total = 0
 
-    if not events:
-        total= enrich_backend.enrich_items(items)
-    else:
-        total = enrich_backend.enrich_events(items)
+    with enrich_backend.elastic.bulk_load_mode():
+        if workers > 1:
+            total = enrich_slices(items, enrich_backend, events, workers)
+        elif not events:
+            total= enrich_backend.enrich_items(items)
+        else:
+            total = enrich_backend.enrich_events(items)
     return total
 
+def enrich_slices(ocean_backend, enrich_backend, events, workers):
+    """ Enrich in workers threads the slices of the ocean backend items """
+
+    version = ocean_backend.elastic.get_major_version()
+    if not version or version < 5:
+        logging.warning("Sliced scroll needs ElasticSearch >= 5. Enriching with one worker.")
+        if not events:
+            return enrich_backend.enrich_items(ocean_backend)
+        return enrich_backend.enrich_events(ocean_backend)
+
+    def enrich_slice(items):
+        if enrich_backend.enrich_processes > 1:
+            # The items are enriched in the enrich processes, shared by the slices
+            slice_backend = enrich_backend
+        else:
+            # The enrich backends are not thread safe: one per slice
+            slice_backend = enrich_backend.clone()
+        if not events:
+            return slice_backend.enrich_items(items)
+        return slice_backend.enrich_events(items)
+
+    logging.info("Enriching %s in %i slices", ocean_backend.elastic.index_url, workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        totals = executor.map(enrich_slice, ocean_backend.slices(workers))
+        # Errors in any slice are raised here
+        return sum(total for total in totals if total)
+
 def get_last_enrich(backend_cmd, enrich_backend):
     last_enrich = None
 
@@ -342,6 +502,30 @@ def do_studies(enrich_backend, no_incremental=False):
         logging.error("Problem executing study %s", study)
         traceback.print_exc()
 
+def get_enrich_backend(url, clean, backend_name, enrich_index,
+                       db_projects_map=None, json_projects_map=None,
+                       db_sortinghat=None, db_user=None, db_password=None,
+                       db_host=None, github_token=None, url_enrich=None,
+                       bulk_workers=0, dead_letter_file=None, compress=False,
+                       bulk_load=False, force_merge=False, enrich_processes=0):
+    """ Enrich backend for backend_name using the enrich_index """
+
+    connector = get_connector_from_name(backend_name)
+
+    enrich_backend = connector[2](db_sortinghat, db_projects_map, json_projects_map,
+                                  db_user, db_password, db_host)
+    if url_enrich:
+        url = url_enrich
+    elastic_enrich = get_elastic(url, enrich_index, clean, enrich_backend,
+                                 bulk_workers, dead_letter_file, compress,
+                                 bulk_load, force_merge)
+    enrich_backend.set_elastic(elastic_enrich)
+    if github_token and backend_name == "git":
+        enrich_backend.set_github_token(github_token)
+    enrich_backend.enrich_processes = enrich_processes
+
+    return enrich_backend
+
 def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
                    ocean_index_enrich = None,
                    db_projects_map=None, json_projects_map=None,
@@ -350,7 +534,11 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
                    github_token=None, studies=False, only_studies=False,
                    url_enrich=None, events_enrich=False,
                    db_user=None, db_password=None, db_host=None,
-                   do_refresh_projects=False, do_refresh_identities=False):
+                   do_refresh_projects=False, do_refresh_identities=False,
+                   bulk_workers=0, dead_letter_file=None, compress=False,
+                   bulk_load=False, force_merge=False, scroll_size=None,
+                   scroll_prefetch=False, workers=0, cursor="scroll",
+                   cursor_state=None, enrich_processes=0):
     """ Enrich Ocean index """
 
 
@@ -368,6 +556,7 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
     connector = get_connector_from_name(backend_name)
     klass = connector[3]  # BackendCmd for the connector
 
+    enrich_backend = None
     try:
         backend = None
         backend_cmd = None
@@ -385,17 +574,22 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
         if events_enrich:
             enrich_index += "_events"
 
-        enrich_backend = connector[2](db_sortinghat, db_projects_map, json_projects_map,
-                                      db_user, db_password, db_host)
-        if url_enrich:
-            elastic_enrich = get_elastic(url_enrich, enrich_index, clean, enrich_backend)
-        else:
-            elastic_enrich = get_elastic(url, enrich_index, clean, enrich_backend)
-        enrich_backend.set_elastic(elastic_enrich)
-        if github_token and backend_name == "git":
-            enrich_backend.set_github_token(github_token)
-
-        ocean_backend = get_ocean_backend(backend_cmd, enrich_backend, no_incremental)
+        enrich_backend = get_enrich_backend(url, clean, backend_name, enrich_index,
+                                            db_projects_map, json_projects_map,
+                                            db_sortinghat, db_user, db_password,
+                                            db_host, github_token, url_enrich,
+                                            bulk_workers, dead_letter_file, compress,
+                                            bulk_load, force_merge, enrich_processes)
+        elastic_enrich = enrich_backend.elastic
+        elastic_enrich.scroll_size = scroll_size
+        elastic_enrich.scroll_prefetch = scroll_prefetch
+        elastic_enrich.cursor = cursor
+        elastic_enrich.cursor_state = cursor_state
+
+        # The last enrichment of all the origins in the index is got at once
+        # and shared with the enrichments of other repos in the same run
+        with ElasticSearch.cache_last_by_origin():
+            ocean_backend = get_ocean_backend(backend_cmd, enrich_backend, no_incremental)
 
         if only_studies:
             logging.info("Running only studies (no SH and no enrichment)")
@@ -404,15 +598,21 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
             logging.info("Refreshing project field in enriched index")
             field_id = enrich_backend.get_field_unique_id()
             eitems = refresh_projects(enrich_backend)
-            enrich_backend.elastic.bulk_upload_sync(eitems, field_id)
+            # The items only have the fetched and refreshed fields
+            enrich_backend.elastic.bulk_upload_sync(eitems, field_id, update=True)
         elif do_refresh_identities:
             logging.info("Refreshing identities fields in enriched index")
             field_id = enrich_backend.get_field_unique_id()
             eitems = refresh_identities(enrich_backend)
-            enrich_backend.elastic.bulk_upload_sync(eitems, field_id)
+            enrich_backend.elastic.bulk_upload_sync(eitems, field_id, update=True)
         else:
             clean = False  # Don't remove ocean index when enrich
-            elastic_ocean = get_elastic(url, ocean_index, clean, ocean_backend)
+            elastic_ocean = get_elastic(url, ocean_index, clean, ocean_backend,
+                                        compress=compress)
+            elastic_ocean.scroll_size = scroll_size
+            elastic_ocean.scroll_prefetch = scroll_prefetch
+            elastic_ocean.cursor = cursor
+            elastic_ocean.cursor_state = cursor_state
             ocean_backend.set_elastic(elastic_ocean)
 
             logging.info("Adding enrichment data to %s", enrich_backend.elastic.index_url)
@@ -428,11 +628,13 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
             else:
                 # Enrichment for the new items once SH update is finished
                 if not events_enrich:
-                    enrich_count = enrich_items(ocean_backend, enrich_backend)
+                    enrich_count = enrich_items(ocean_backend, enrich_backend,
+                                                workers=workers)
                     if enrich_count:
                         logging.info("Total items enriched %i ", enrich_count)
                 else:
-                    enrich_count = enrich_items(ocean_backend, enrich_backend, events=True)
+                    enrich_count = enrich_items(ocean_backend, enrich_backend, events=True,
+                                                workers=workers)
                     if enrich_count:
                         logging.info("Total events enriched %i ", enrich_count)
                 if studies:
@@ -445,5 +647,12 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
                           backend_name, backend.origin, ex)
         else:
             logging.error("Error enriching ocean %s", ex)
+    finally:
+        # Stop the bulk writers also after errors
+        if enrich_backend:
+            enrich_backend.close_processes()
+            bulk_stats = enrich_backend.elastic.close_bulk()
+            logging.info("Enriched items in bulk: %i ok, %i failed, %i retried",
+                         bulk_stats['ok'], bulk_stats['failed'], bulk_stats['retried'])
 
     logging.info("Done %s ", backend_name)
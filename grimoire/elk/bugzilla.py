@@ -28,7 +28,7 @@ import logging
 
 from datetime import datetime
 
-from dateutil import parser
+from .dates import parse_date
 
 from .enrich import Enrich, metadata
 
@@ -72,6 +72,9 @@ class BugzillaEnrich(Enrich):
 
         return identity
 
+    def get_fields_project(self):
+        return ["product"]
+
     def get_project_repository(self, eitem):
         repo = eitem['origin']
         product = eitem['product']
@@ -151,7 +154,7 @@ class BugzillaEnrich(Enrich):
                 eitem["reporter_email"] = issue["reporter"][0]["__text__"]
                 eitem["author_email"] = issue["reporter"][0]["__text__"]
 
-        date_ts = parser.parse(issue['creation_ts'][0]['__text__'])
+        date_ts = parse_date(issue['creation_ts'][0]['__text__'])
         eitem['creation_date'] = date_ts.strftime('%Y-%m-%dT%H:%M:%S')
 
 
@@ -166,7 +169,7 @@ class BugzillaEnrich(Enrich):
 
 
         # Fix dates
-        date_ts = parser.parse(issue['delta_ts'][0]['__text__'])
+        date_ts = parse_date(issue['delta_ts'][0]['__text__'])
         eitem['changeddate_date'] = date_ts.isoformat()
         eitem['delta_ts'] = date_ts.strftime('%Y-%m-%dT%H:%M:%S')
 
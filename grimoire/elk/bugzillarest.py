@@ -24,7 +24,7 @@
 #
 
 from time import time
-from dateutil import parser
+from .dates import parse_date
 import json
 import logging
 
@@ -67,6 +67,9 @@ class BugzillaRESTEnrich(Enrich):
         identity['name'] = user['real_name']
         return identity
 
+    def get_fields_project(self):
+        return ["product"]
+
     def get_project_repository(self, eitem):
         repo = eitem['origin']
         product = eitem['product']
@@ -108,9 +111,9 @@ class BugzillaRESTEnrich(Enrich):
         eitem["product"]  = issue['product']
 
         # Fix dates
-        date_ts = parser.parse(issue['creation_time'])
+        date_ts = parse_date(issue['creation_time'])
         eitem['creation_ts'] = date_ts.strftime('%Y-%m-%dT%H:%M:%S')
-        date_ts = parser.parse(issue['last_change_time'])
+        date_ts = parse_date(issue['last_change_time'])
         eitem['changeddate_date'] = date_ts.isoformat()
         eitem['delta_ts'] = date_ts.strftime('%Y-%m-%dT%H:%M:%S')
 
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Fast parsing of the dates found in the items
+#
+# Copyright (C) 2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#   Alvaro del Castillo San Felix <acs@bitergia.com>
+#
+
+import datetime
+import re
+
+from functools import lru_cache
+
+from dateutil import parser, tz
+
+DATES_CACHE_SIZE = 16384  # parsed date strings kept in memory
+
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+_DAY = r'(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)'
+_MONTH = r'(?P<month>' + '|'.join(MONTHS) + ')'
+_TIME = r'(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})'
+
+# 2016-04-27T07:36:19Z, 2016-05-16 07:44:00 -0400, 2016-07-26T14:25:28.000-0700
+ISO_DATE = re.compile(r'^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})'
+                      r'(?:[T ](?P<hour>\d{2}):(?P<minute>\d{2})'
+                      r'(?::(?P<second>\d{2})(?:[.,](?P<fraction>\d+))?)?'
+                      r' ?(?P<tz>Z|[+-]\d{2}(?::?\d{2})?)?)?$')
+# Mon, 1 Dec 2014 21:52:45 +0100 (email)
+RFC2822_DATE = re.compile(r'^(?:' + _DAY + r', )?(?P<day>\d{1,2}) ' + _MONTH +
+                          r' (?P<year>\d{4}) ' + _TIME + r' (?P<tz>[+-]\d{4})$')
+# Fri Jul 1 17:48:15 2016 +0200 (git)
+GIT_DATE = re.compile(r'^' + _DAY + ' ' + _MONTH + r' (?P<day>\d{1,2}) ' +
+                      _TIME + r' (?P<year>\d{4}) (?P<tz>[+-]\d{4})$')
+# Thu Jul 21 06:47:23 +0000 2016 (twitter)
+TWITTER_DATE = re.compile(r'^' + _DAY + ' ' + _MONTH + r' (?P<day>\d{1,2}) ' +
+                          _TIME + r' (?P<tz>[+-]\d{4}) (?P<year>\d{4})$')
+
+
+def parse_date(value):
+    """ Parse a date the same way dateutil.parser.parse does, but faster
+
+    ISO 8601, RFC 2822 (email), git and twitter dates are parsed with
+    strict regular expressions. The rest of strings are parsed with
+    dateutil. Numbers are unix timestamps, returned in UTC. The parsed
+    strings are cached, as the same dates appear several times in the
+    items (creation and update dates, dates shared by several items).
+
+    :param value: date string, unix timestamp or datetime
+    :returns: a datetime object, with tzinfo if the date has a time zone
+    """
+
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, str):
+        return _parse_str(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        dt = datetime.datetime.utcfromtimestamp(value)
+        return dt.replace(tzinfo=tz.tzutc())
+    return parser.parse(value)
+
+
+def _get_tz(offset):
+    """ tzinfo for a Z, +HH, +HHMM or +HH:MM offset, like dateutil """
+
+    if offset == 'Z':
+        return tz.tzutc()
+    sign = -1 if offset[0] == '-' else 1
+    offset = offset[1:].replace(':', '')
+    seconds = sign * (int(offset[0:2]) * 3600 + int(offset[2:4] or 0) * 60)
+    if seconds == 0:
+        return tz.tzutc()
+    return tz.tzoffset(None, seconds)
+
+
+def _build_date(fields, month):
+    """ datetime from the fields matched in a date string """
+
+    microsecond = 0
+    if fields.get('fraction'):
+        # dateutil truncates to microseconds
+        microsecond = int(fields['fraction'][:6].ljust(6, '0'))
+    tzinfo = _get_tz(fields['tz']) if fields['tz'] else None
+    return datetime.datetime(int(fields['year']), month, int(fields['day']),
+                             int(fields['hour'] or 0), int(fields['minute'] or 0),
+                             int(fields['second'] or 0), microsecond, tzinfo)
+
+
+@lru_cache(maxsize=DATES_CACHE_SIZE)
+def _parse_str(value):
+    """ Parse a date string using the fast paths if possible """
+
+    try:
+        match = ISO_DATE.match(value)
+        if match:
+            fields = match.groupdict()
+            return _build_date(fields, int(fields['month']))
+        for regex in (RFC2822_DATE, GIT_DATE, TWITTER_DATE):
+            match = regex.match(value)
+            if match:
+                fields = match.groupdict()
+                return _build_date(fields, MONTHS[fields['month']])
+    except ValueError:
+        # Out of range values: dateutil decides what to do with them
+        pass
+    return parser.parse(value)
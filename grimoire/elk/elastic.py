@@ -23,19 +23,34 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-from datetime import datetime
 from dateutil import parser
 import json
 import logging
+import queue
+import random
 import requests
+import threading
 
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 from time import time, sleep
 
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-
+from .session import MAINTENANCE_TIMEOUT, SessionFactory
 from .utils import unixtime_to_datetime
 
 WAIT_INDEX_CREATION = 2  # number of seconds to wait for index creation
+MIN_ITEMS_BULK = 10  # minimum number of items in a bulk request
+MAX_ITEMS_BULK = 5000  # maximum number of items in a bulk request
+MAX_BYTES_BULK = 10 * 1024 * 1024  # max size of a bulk request (10 MB)
+TARGET_SECONDS_BULK = 2  # expected time for a bulk request to complete
+MAX_PENDING_BULK = 2  # bulk requests queued per writer thread
+ORIGINS_PAGE = 1000  # origins per page in the last value per origin query
+MAX_ORIGINS = 10000  # max origins if composite aggregations are not supported
+MAX_RETRIES_BULK = 5  # max retries for the items rejected in a bulk request
+RETRY_WAIT_BULK = 0.5  # initial seconds to wait before retrying items
+MAX_RETRY_WAIT_BULK = 30  # max seconds to wait before retrying items
+RETRY_STATUS_BULK = [429, 503]  # items status that can be retried
 
 class ElasticConnectException(Exception):
     message = "Can't connect to ElasticSearch"
@@ -43,30 +58,219 @@ class ElasticConnectException(Exception):
 class ElasticWriteException(Exception):
     message = "Can't write to ElasticSearch"
 
+def encode_bulk_item(_id, item, update=False):
+    """ Encode the bulk index action and the document for an item
+
+    The lines are encoded once in UTF-8. Lone surrogates, not valid
+    in UTF-8, are written as JSON unicode escapes.
+
+    :param _id: ElasticSearch id for the item
+    :param item: dict with the document to be indexed
+    :param update: update only the fields in item of the indexed document
+    :returns: bytes with the action and document lines
+    """
+
+    _id = json.dumps(str(_id), ensure_ascii=False)
+    if update:
+        bulk_item = '{"update" : {"_id" : %s } }\n' % _id
+        item = {"doc": item}
+    else:
+        bulk_item = '{"index" : {"_id" : %s } }\n' % _id
+    bulk_item += json.dumps(item, ensure_ascii=False) + "\n"  # Bulk document
+
+    return bulk_item.encode('utf-8', 'backslashreplace')
+
+
+class BulkBatcher(object):
+    """ Pack bulk index actions and send them when the pack is full
+
+    A pack is full when it reaches the max number of items or the max
+    number of bytes configured in the ElasticSearch object. After each
+    bulk request the number of items is adapted to its latency.
+    """
+
+    def __init__(self, elastic, url):
+        self.elastic = elastic
+        self.url = url
+        self.bulk = []  # bulk action and document lines (bytes) per item
+        self.bulk_bytes = 0
+        self.current = 0  # items in the current pack
+        self.total = 0  # total items sent
+        self.callbacks = []  # called once the current pack is written
+
+    def add(self, _id, item, update=False):
+        """ Add an item to be indexed with _id
+
+        :param update: update only the fields in item of the indexed document
+        """
+
+        self.add_encoded(encode_bulk_item(_id, item, update))
+
+    def add_encoded(self, bulk_item):
+        """ Add an item already encoded with encode_bulk_item """
+
+        self.bulk.append(bulk_item)
+        self.bulk_bytes += len(bulk_item)
+        self.current += 1
+
+        if self.current >= self.elastic.max_items_bulk or \
+           self.bulk_bytes >= self.elastic.max_bytes_bulk:
+            self.flush(wait=False)
+
+    def on_written(self, callback):
+        """ Call callback once all the items added until now are written """
+
+        if self.current > 0:
+            self.callbacks.append(callback)
+        else:
+            self.elastic.on_bulk_written(callback)
+
+    def flush(self, wait=True):
+        """ Send the pending items and return the total items sent
+
+        :param wait: wait until all queued bulk requests are completed
+        """
+
+        if self.current > 0:
+            self.elastic.send_bulk(self.url, self.bulk)
+            self.total += self.current
+
+            self.bulk = []
+            self.bulk_bytes = 0
+            self.current = 0
+
+            for callback in self.callbacks:
+                self.elastic.on_bulk_written(callback)
+            self.callbacks = []
+
+        if wait:
+            self.elastic.flush_bulk()
+
+        return self.total
+
+
+class BulkWriter(object):
+    """ Send bulk requests to ElasticSearch from background threads
+
+    The queue of bulk requests is bounded so producers are blocked
+    when all the writer threads are busy.
+    """
+
+    def __init__(self, elastic, workers):
+        self.elastic = elastic
+        self.queue = queue.Queue(maxsize=workers * MAX_PENDING_BULK)
+        self.threads = []
+
+        for i in range(0, workers):
+            thread = threading.Thread(target=self.__worker, daemon=True,
+                                      name="bulk-writer-%i" % i)
+            thread.start()
+            self.threads.append(thread)
+
+    def __worker(self):
+        while True:
+            bulk = self.queue.get()
+            try:
+                if bulk is None:
+                    break
+                (url, bulk_items, bulk_id) = bulk
+                try:
+                    self.elastic._put_bulk(url, bulk_items)
+                except Exception as ex:
+                    logging.error("Error in bulk request to %s: %s", url, ex)
+                    self.elastic.update_bulk_stats(failed=len(bulk_items))
+                else:
+                    self.elastic._bulk_written(bulk_id)
+            finally:
+                self.queue.task_done()
+
+    def send(self, url, bulk_items, bulk_id):
+        """ Queue a bulk request. Blocks if the queue is full. """
+        self.queue.put((url, bulk_items, bulk_id))
+
+    def flush(self):
+        """ Wait for the queued bulk requests and return the stats """
+        self.queue.join()
+        return self.elastic.get_bulk_stats()
+
+    def close(self):
+        """ Send the queued bulk requests and stop the writer threads """
+        stats = self.flush()
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return stats
+
+
 class ElasticSearch(object):
 
+    # Last date and offset per origin, cached when working with many origins
+    last_by_origin_cache = None
+    last_by_origin_users = 0  # nested with blocks using the cache
+    last_by_origin_lock = threading.Lock()
+
     @classmethod
     def safe_index(cls, unique_id):
         """ Return a valid elastic index generated from unique_id """
         return unique_id.replace("/","_").lower()
 
+    @classmethod
+    @contextmanager
+    def cache_last_by_origin(cls):
+        """ Get the last date and offset for all the origins in an index at once
+
+        The values are cached until the end of the outer with block. Useful
+        when updating lots of origins which share the same indexes.
+        """
+        with cls.last_by_origin_lock:
+            if cls.last_by_origin_users == 0:
+                cls.last_by_origin_cache = {}
+            cls.last_by_origin_users += 1
+        try:
+            yield
+        finally:
+            with cls.last_by_origin_lock:
+                cls.last_by_origin_users -= 1
+                if cls.last_by_origin_users == 0:
+                    cls.last_by_origin_cache = None
+
     def __init__(self, url, index, mappings = None, clean = False,
-                 insecure=True, analyzers=None):
-        ''' clean: remove already existing index
+                 insecure=True, analyzers=None, bulk_workers=0,
+                 dead_letter_file=None, compress=False, bulk_load=False,
+                 force_merge=False, session=None):
+        ''' url: ES url, or urls for several nodes separated by commas
+            clean: remove already existing index
             insecure: support https with invalid certificates
+            bulk_workers: threads sending bulk requests in background
+            dead_letter_file: file to store the items that can not be indexed
+            compress: send gzip compressed bulk and search requests
+            bulk_load: tune the settings of new indexes during the load
+            force_merge: force merge new indexes after the bulk load
+            session: HTTP session, by default the shared one from SessionFactory
         '''
 
-        self.url = url
+        # Several nodes could be used, separated by commas
+        nodes = [node.strip().rstrip("/") for node in url.split(",")]
+        # The first node is the base url. The session uses all the nodes.
+        self.url = nodes[0]
         # Valid index for elastic
         self.index = self.safe_index(index)
         self.index_url = self.url+"/"+self.index
-        self.max_items_bulk = 100
-        self.wait_bulk_seconds = 2  # time to wait to complete a bulk operation
-
-        self.requests = requests.Session()
-        if insecure:
-            requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-            self.requests.verify = False
+        self.max_items_bulk = 100  # adapted using the bulk requests latency
+        self.max_bytes_bulk = MAX_BYTES_BULK
+        self.scroll_size = None  # items per page when reading, None for default
+        self.scroll_prefetch = False  # read the next page in background
+        self.cursor = "scroll"  # read items with "scroll" or "search_after"
+        self.cursor_state = None  # file to resume search_after reads
+        self.bulk_load = bulk_load
+        self.force_merge = force_merge
+        self.new_index = False  # index created (or cleaned) now
+
+        if session:
+            self.requests = session
+        else:
+            self.requests = SessionFactory.get_session(compress, insecure, nodes)
 
         try:
             r = self.requests.get(self.index_url)
@@ -77,92 +281,374 @@ class ElasticSearch(object):
         if r.status_code != 200:
             # Index does no exists
             r = self.requests.put(self.index_url, data=analyzers)
-            if r.status_code != 200:
+            if r.status_code == 200:
+                logging.info("Created index " + self.index_url)
+                self.new_index = True
+            elif self.requests.get(self.index_url).status_code == 200:
+                # Created at the same time by other feed sharing the index
+                logging.debug("Index %s already created", self.index_url)
+            else:
                 logging.error("Can't create index %s (%s)",
                               self.index_url, r.status_code)
                 raise ElasticWriteException()
-            else:
-                logging.info("Created index " + self.index_url)
         else:
             if clean:
                 self.requests.delete(self.index_url)
                 self.requests.put(self.index_url, data=analyzers)
                 logging.info("Deleted and created index " + self.index_url)
+                self.new_index = True
         if mappings:
             self.create_mappings(mappings)
 
-    def _safe_put_bulk(self, url, bulk_json):
-        """ Bulk PUT controlling unicode issues """
+        self.dead_letter_file = dead_letter_file
+        self.bulk_lock = threading.Lock()
+        self.bulk_stats = {"bulks": 0, "ok": 0, "failed": 0, "retried": 0}
+        self.bulk_sent = 0  # bulk requests sent, used as their id
+        self.bulk_done = 0  # all bulk requests up to this one are written
+        self.bulk_written = set()  # bulk requests written after bulk_done
+        self.bulk_callbacks = deque()  # (bulk request, callback) waiting for it
+        self.bulk_callbacks_lock = threading.Lock()  # callbacks run in order
+
+        self.bulk_writer = None
+        if bulk_workers > 0:
+            self.bulk_writer = BulkWriter(self, bulk_workers)
+
+    def _safe_put_bulk(self, url, bulk_data):
+        """ Bulk PUT of a body already encoded in UTF-8 """
+
+        # Only the fields needed to check the items status
+        params = {"filter_path": "errors,items.*.status,items.*.error"}
+        headers = {"Content-Type": "application/x-ndjson; charset=utf-8"}
+
+        return self.requests.put(url, data=bulk_data, params=params,
+                                 headers=headers)
+
+    def adapt_bulk_size(self, bulk_time, items, rejected=False):
+        """ Adapt the items in bulk packs using the last bulk request stats
+
+        :param bulk_time: seconds used to complete the bulk request
+        :param items: number of items in the bulk request
+        :param rejected: ES rejected items because it is overloaded
+        """
+
+        # The bulk writer threads adapt the size at the same time
+        with self.bulk_lock:
+            max_items = self.max_items_bulk
+
+            if rejected:
+                max_items = int(max_items / 2)
+            elif bulk_time > TARGET_SECONDS_BULK:
+                max_items = int(max_items * TARGET_SECONDS_BULK / bulk_time)
+            elif items >= max_items and bulk_time < TARGET_SECONDS_BULK / 2:
+                # Only grow if the pack was full in items, not in bytes
+                max_items = max_items * 2
+
+            max_items = min(max(max_items, MIN_ITEMS_BULK), MAX_ITEMS_BULK)
+
+            if max_items != self.max_items_bulk:
+                logging.debug("Bulk size changed from %i to %i items",
+                              self.max_items_bulk, max_items)
+                self.max_items_bulk = max_items
+
+    @staticmethod
+    def get_bulk_items_status(r, items):
+        """ Get the status and error for all the items in a bulk response
+
+        :param r: response for the bulk request
+        :param items: number of items in the bulk request
+        :returns: a list with a (status, error) tuple for each item
+        """
 
-        try:
-            self.requests.put(url, data=bulk_json)
-        except UnicodeEncodeError:
-            # Related to body.encode('iso-8859-1'). mbox data
-            logging.error("Encondig error ... converting bulk to iso-8859-1")
-            bulk_json = bulk_json.encode('iso-8859-1','ignore')
-            self.requests.put(url, data=bulk_json)
+        if r.status_code != 200:
+            # The whole bulk request failed
+            return [(r.status_code, r.text)] * items
+
+        res_json = r.json()
+
+        if not res_json.get('errors'):
+            return [(200, None)] * items
+
+        items_status = []
+        for res_item in res_json['items']:
+            # Only one action per item: index, create, update or delete
+            res_action = list(res_item.values())[0]
+            items_status.append((res_action['status'], res_action.get('error')))
+        return items_status
+
+    def update_bulk_stats(self, bulks=0, ok=0, failed=0, retried=0):
+        with self.bulk_lock:
+            self.bulk_stats['bulks'] += bulks
+            self.bulk_stats['ok'] += ok
+            self.bulk_stats['failed'] += failed
+            self.bulk_stats['retried'] += retried
+
+    def get_bulk_stats(self):
+        """ Stats for the bulk requests: ok, failed and retried items """
+        with self.bulk_lock:
+            return dict(self.bulk_stats)
+
+    def _dead_letter(self, bulk_item, status, error):
+        """ Store an item that can not be indexed in the dead letter file """
+
+        logging.error("Can't index item in %s (%s): %s", self.index, status, error)
+
+        if not self.dead_letter_file:
+            return
+
+        dead_item = {
+            "index": self.index,
+            "status": status,
+            "error": error,
+            "bulk": bulk_item.decode('utf-8')
+        }
+        with self.bulk_lock:
+            with open(self.dead_letter_file, "a") as dead_file:
+                dead_file.write(json.dumps(dead_item) + "\n")
+
+    def _put_bulk(self, url, bulk_items):
+        """ Send a bulk request retrying only the rejected items
+
+        The items rejected because ES is overloaded are retried with an
+        exponential backoff. The rest of failed items are dead lettered.
+
+        :param url: bulk API url
+        :param bulk_items: list with the encoded action and document per item
+        :returns: number of items indexed
+        """
+
+        ok = 0
+        retries = 0
+
+        while bulk_items:
+            task_init = time()
+            try:
+                r = self._safe_put_bulk(url, b"".join(bulk_items))
+                items_status = self.get_bulk_items_status(r, len(bulk_items))
+            except requests.exceptions.ConnectionError as ex:
+                items_status = [(503, str(ex))] * len(bulk_items)
+            bulk_time = time() - task_init
+
+            retry_items = []
+            failed = 0
+            for bulk_item, (status, error) in zip(bulk_items, items_status):
+                if status < 300:
+                    ok += 1
+                elif status in RETRY_STATUS_BULK and retries < MAX_RETRIES_BULK:
+                    retry_items.append(bulk_item)
+                else:
+                    failed += 1
+                    self._dead_letter(bulk_item, status, error)
+
+            rejected = any(status in RETRY_STATUS_BULK for (status, error) in items_status)
+            self.adapt_bulk_size(bulk_time, len(bulk_items), rejected)
+            self.update_bulk_stats(bulks=1, failed=failed, retried=len(retry_items))
+
+            logging.debug("bulk packet sent (%.2f sec, %i items, %i to retry)",
+                          bulk_time, len(bulk_items), len(retry_items))
+
+            if retry_items:
+                # Exponential backoff with jitter
+                wait = min(MAX_RETRY_WAIT_BULK, RETRY_WAIT_BULK * 2 ** retries)
+                sleep(random.uniform(wait / 2, wait))
+                retries += 1
+            bulk_items = retry_items
 
-    def bulk_upload(self, items, field_id):
-        ''' Upload in controlled packs items to ES using bulk API '''
+        self.update_bulk_stats(ok=ok)
 
-        max_items = self.max_items_bulk
-        current = 0
-        new_items = 0  # total items added with bulk
-        bulk_json = ""
+        return ok
+
+    def send_bulk(self, url, bulk_items):
+        """ Send a bulk request directly or using the bulk writer
+
+        :param url: bulk API url
+        :param bulk_items: list with the encoded action and document per item
+        """
+
+        with self.bulk_lock:
+            self.bulk_sent += 1
+            bulk_id = self.bulk_sent
+
+        if self.bulk_writer:
+            self.bulk_writer.send(url, bulk_items, bulk_id)
+        else:
+            self._put_bulk(url, bulk_items)
+            self._bulk_written(bulk_id)
+
+    def _bulk_written(self, bulk_id):
+        """ Mark a bulk request as written and call the callbacks waiting for it
+
+        A bulk request that fails is never marked, so the callbacks for it
+        and for the later bulk requests are not called.
+        """
+
+        with self.bulk_callbacks_lock:
+            callbacks = []
+            with self.bulk_lock:
+                self.bulk_written.add(bulk_id)
+                while self.bulk_done + 1 in self.bulk_written:
+                    self.bulk_done += 1
+                    self.bulk_written.remove(self.bulk_done)
+                while self.bulk_callbacks and self.bulk_callbacks[0][0] <= self.bulk_done:
+                    callbacks.append(self.bulk_callbacks.popleft()[1])
+            for callback in callbacks:
+                callback()
+
+    def on_bulk_written(self, callback):
+        """ Call callback once all the bulk requests sent until now are written """
+
+        with self.bulk_callbacks_lock:
+            with self.bulk_lock:
+                if self.bulk_done < self.bulk_sent:
+                    self.bulk_callbacks.append((self.bulk_sent, callback))
+                    return
+            callback()
+
+    def flush_bulk(self):
+        """ Wait for the bulk requests in progress and return its stats """
+
+        if self.bulk_writer:
+            self.bulk_writer.flush()
+        return self.get_bulk_stats()
+
+    def close_bulk(self):
+        """ Stop the bulk writer and return the bulk stats """
+
+        if self.bulk_writer:
+            self.bulk_writer.close()
+            self.bulk_writer = None
+        stats = self.get_bulk_stats()
+        logging.debug("Bulk stats for %s: %i bulks, %i ok, %i failed, %i retried",
+                      self.index, stats['bulks'], stats['ok'], stats['failed'],
+                      stats['retried'])
+        return stats
+
+    def get_bulk_batcher(self, url=None):
+        """ Get a batcher to upload items to url using the bulk API """
+
+        if not url:
+            url = self.index_url+'/items/_bulk'
+
+        return BulkBatcher(self, url)
+
+    def bulk_upload(self, items, field_id, wait=True, update=False):
+        ''' Upload in controlled packs items to ES using bulk API
+            wait: wait until the bulk writer has sent all the packs
+            update: update only the fields in the items of indexed documents
+        '''
 
         url = self.index_url+'/items/_bulk'
 
-        logging.debug("Adding items to %s (in %i packs)" % (url, max_items))
+        logging.debug("Adding items to %s (in %i packs)" % (url, self.max_items_bulk))
+
+        batcher = self.get_bulk_batcher(url)
 
         for item in items:
-            if current >= max_items:
-                task_init = time()
-                self._safe_put_bulk(url, bulk_json)
-                bulk_json = ""
-                new_items += current
-                current = 0
-                logging.debug("bulk packet sent (%.2f sec, %i total)"
-                              % (time()-task_init, new_items))
-            data_json = json.dumps(item)
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % (item[field_id])
-            bulk_json += data_json +"\n"  # Bulk document
-            current += 1
-        task_init = time()
-        self._safe_put_bulk(url, bulk_json)
-        new_items += current
-        logging.debug("bulk packet sent (%.2f sec prev, %i total)"
-                      % (time()-task_init, new_items))
+            batcher.add(item[field_id], item, update)
+
+        new_items = batcher.flush(wait)
 
         return new_items
 
-    def bulk_upload_sync(self, items, field_id, sync=True):
-        ''' Upload in controlled packs items to ES using bulk API
-            and wait until the items appears in searches '''
+    def refresh(self):
+        """ Refresh the index so all the items indexed appear in searches """
+
+        self.flush_bulk()
+        r = self.requests.post(self.index_url + '/_refresh',
+                               timeout=MAINTENANCE_TIMEOUT)
+        if r.status_code != 200:
+            logging.warning("Can't refresh %s (%s)", self.index_url, r.status_code)
+
+    def get_session_options(self):
+        """ Options to create an ElasticSearch with the same session config
 
-        # After a bulk upload the searches are not refreshed real time
-        # This method waits until the upload is visible in searches
+        The url includes all the nodes used, with the ones found sniffing
+        the cluster, so other processes don't need to sniff it again.
 
-        r = self.requests.get(self.index_url+'/_search?size=1')
-        total = r.json()['hits']['total']  # Already existing items
-        new_items = self.bulk_upload(items, field_id)
-        if not sync:
+        :returns: dict with url, compress and insecure
+        """
+
+        node_pool = getattr(self.requests, 'node_pool', None)
+        nodes = node_pool.nodes if node_pool else [self.url]
+        return {
+            "url": ",".join(nodes),
+            "compress": getattr(self.requests, 'compress', False),
+            "insecure": self.requests.verify is False
+        }
+
+    def get_major_version(self):
+        """ Major version of the ElasticSearch server, None if unknown """
+
+        try:
+            version = self.requests.get(self.url).json()['version']['number']
+            return int(version.split(".")[0])
+        except Exception as ex:
+            logging.warning("Can't get the ElasticSearch version from %s: %s",
+                            self.url, ex)
+            return None
+
+    def __start_bulk_load(self):
+        """ Disable refresh and replicas and return the original settings """
+
+        r = self.requests.get(self.index_url + '/_settings')
+        # The index could be an alias so just take the first index
+        index_settings = list(r.json().values())[0]['settings']['index']
+        settings = {
+            "refresh_interval": index_settings.get('refresh_interval', '1s'),
+            "number_of_replicas": index_settings.get('number_of_replicas', 1)
+        }
+
+        bulk_settings = {"refresh_interval": "-1", "number_of_replicas": 0}
+        self.requests.put(self.index_url + '/_settings',
+                          data=json.dumps({"index": bulk_settings}))
+        logging.debug("Bulk load mode started in %s", self.index_url)
+
+        return settings
+
+    def __end_bulk_load(self, settings):
+        """ Restore the index settings after a bulk load """
+
+        self.flush_bulk()
+        r = self.requests.put(self.index_url + '/_settings',
+                              data=json.dumps({"index": settings}))
+        if r.status_code != 200:
+            logging.error("Can't restore settings for %s: %s",
+                          self.index_url, r.text)
+        self.refresh()
+        if self.force_merge:
+            logging.info("Force merging %s", self.index_url)
+            self.requests.post(self.index_url + '/_forcemerge?max_num_segments=1',
+                               timeout=MAINTENANCE_TIMEOUT)
+        logging.debug("Bulk load mode finished in %s", self.index_url)
+
+    @contextmanager
+    def bulk_load_mode(self):
+        """ Load items in a new index without refreshes and replicas
+
+        Only active if bulk_load is configured and the index is new. The
+        original settings are restored at the end, even on errors.
+        """
+
+        if not self.bulk_load or not self.new_index:
+            yield
             return
-        total += new_items
-
-        # Wait until in searches all items are returned
-        # In incremental update, some items are updates not additions so
-        # this check will fail. Exist ok in the timeout for this case.
-
-        total_search = 0  # total items found with search
-        search_start = datetime.now()
-        while total_search != total:
-            sleep(0.1)
-            r = self.requests.get(self.index_url+'/_search?size=1')
-            total_search = r.json()['hits']['total']
-            if (datetime.now()-search_start).total_seconds() > self.wait_bulk_seconds:
-                logging.debug("Bulk data does not appear as NEW after %is" % (self.wait_bulk_seconds))
-                logging.debug("Probably %i item updates" % (total-total_search))
-                break
+
+        # Only the first load in a new index is done in bulk load mode
+        self.new_index = False
+        settings = self.__start_bulk_load()
+        try:
+            yield
+        finally:
+            self.__end_bulk_load(settings)
+
+    def bulk_upload_sync(self, items, field_id, sync=True, update=False):
+        ''' Upload in controlled packs items to ES using bulk API
+            and refresh the index so the items appear in searches '''
+
+        new_items = self.bulk_upload(items, field_id, update=update)
+        if sync:
+            self.refresh()
+
+        return new_items
 
     def create_mappings(self, mappings):
 
@@ -226,6 +712,20 @@ class ElasticSearch(object):
 
         return offset
 
+    @staticmethod
+    def __get_agg_value(agg, offset=False):
+        """ Get the value (date or offset) from a max aggregation """
+
+        last_value = agg["value"]
+
+        if not offset:
+            if "value_as_string" in agg:
+                last_value = parser.parse(agg["value_as_string"])
+            elif last_value:
+                last_value = unixtime_to_datetime(last_value)
+
+        return last_value
+
     def __get_last_item_field(self, field, _filter = None, offset = False):
         '''
             :field: field with the data
@@ -233,6 +733,16 @@ class ElasticSearch(object):
             :offset: Return offset field insted of date field
         '''
 
+        cache = self.last_by_origin_cache
+        if _filter and _filter['name'] == 'origin' and cache is not None:
+            return self.__get_last_item_field_cached(cache, field, _filter['value'],
+                                                     offset)
+
+        return self.__get_last_item_field_query(field, _filter, offset)
+
+    def __get_last_item_field_query(self, field, _filter = None, offset = False):
+        """ Get the last value of field with a max aggregation """
+
         last_value = None
 
         url = self.index_url
@@ -268,14 +778,154 @@ class ElasticSearch(object):
         res_json = res.json()
 
         if 'aggregations' in res_json:
-            last_value = res_json["aggregations"]["1"]["value"]
+            last_value = self.__get_agg_value(res_json["aggregations"]["1"], offset)
 
-            if not offset:
-                if "value_as_string" in res_json["aggregations"]["1"]:
-                    last_value = res_json["aggregations"]["1"]["value_as_string"]
-                    last_value = parser.parse(last_value)
-                else:
-                    last_value = res_json["aggregations"]["1"]["value"]
-                    if last_value:
-                        last_value = unixtime_to_datetime(last_value)
         return last_value
+
+    def __get_last_item_field_cached(self, cache, field, origin, offset=False):
+        """ Get the last value for origin from the values for all origins
+
+        The first thread asking for a key gets the values, the rest wait
+        for them. Other keys are not blocked during the aggregation. If
+        not all the origins were got, the missing ones are queried alone.
+        """
+
+        key = (self.index_url, field, offset)
+
+        with self.last_by_origin_lock:
+            values = cache.get(key)
+            get_values = values is None
+            if get_values:
+                values = cache[key] = Future()
+
+        if get_values:
+            try:
+                values.set_result(self.__get_last_item_field_by_origin(field, offset))
+            except Exception as ex:
+                values.set_exception(ex)
+                with self.last_by_origin_lock:
+                    # The next call tries again
+                    cache.pop(key, None)
+
+        (last_values, complete) = values.result()
+        if origin in last_values or complete:
+            return last_values.get(origin)
+
+        _filter = {"name": "origin", "value": origin}
+        return self.__get_last_item_field_query(field, _filter, offset)
+
+    def get_last_dates_by_origin(self, field):
+        '''
+            :field: field with the date
+            :returns: dict with the last date for each origin
+        '''
+
+        return self.get_last_item_field_by_origin(field)
+
+    def get_last_offsets_by_origin(self, field):
+        '''
+            :field: field with the offset
+            :returns: dict with the last offset for each origin
+        '''
+
+        return self.get_last_item_field_by_origin(field, offset=True)
+
+    def get_last_item_field_by_origin(self, field, offset=False):
+        '''
+            Get the max value of field for all the origins in the index
+            using a composite aggregation paginated by origin.
+
+            :field: field with the data
+            :offset: Return offset field insted of date field
+            :returns: dict with the last value for each origin. Without
+                      composite aggregations (ES < 6.1) it could have only
+                      MAX_ORIGINS origins.
+        '''
+
+        (last_values, complete) = self.__get_last_item_field_by_origin(field, offset)
+        if not complete:
+            logging.warning("Last %s only for %i origins in %s", field,
+                            len(last_values), self.index_url)
+
+        return last_values
+
+    def __get_last_item_field_by_origin(self, field, offset=False):
+        """ Max value of field for each origin and if all origins are included """
+
+        last_values = {}
+        url = self.index_url + "/_search"
+
+        after = None
+        while True:
+            composite = {
+                "size": ORIGINS_PAGE,
+                "sources": [{"origin": {"terms": {"field": "origin"}}}]
+            }
+            if after:
+                composite["after"] = after
+            query = {
+                "size": 0,
+                "aggs": {
+                    "origins": {
+                        "composite": composite,
+                        "aggs": {"1": {"max": {"field": field}}}
+                    }
+                }
+            }
+
+            res = self.requests.post(url, data=json.dumps(query))
+            if res.status_code == 400:
+                # Composite aggregations are not supported (ES < 6.1)
+                return self.__get_last_item_field_by_origin_terms(field, offset)
+            res_json = res.json()
+
+            if 'aggregations' not in res_json:
+                # Error response: the origins not got are queried alone
+                complete = False
+                break
+
+            buckets = res_json["aggregations"]["origins"]["buckets"]
+            for bucket in buckets:
+                origin = bucket["key"]["origin"]
+                last_values[origin] = self.__get_agg_value(bucket["1"], offset)
+
+            after = res_json["aggregations"]["origins"].get("after_key")
+            if not after or len(buckets) < ORIGINS_PAGE:
+                complete = True
+                break
+
+        logging.debug("Last %s for %i origins in %s", field, len(last_values),
+                      self.index_url)
+
+        return (last_values, complete)
+
+    def __get_last_item_field_by_origin_terms(self, field, offset=False):
+        """ Max value of field for each origin with a terms aggregation
+
+        Only the MAX_ORIGINS origins with more items are returned, so the
+        result is not complete if other origins have items.
+        """
+
+        last_values = {}
+        complete = False
+        url = self.index_url + "/_search"
+
+        query = {
+            "size": 0,
+            "aggs": {
+                "origins": {
+                    "terms": {"field": "origin", "size": MAX_ORIGINS},
+                    "aggs": {"1": {"max": {"field": field}}}
+                }
+            }
+        }
+
+        res_json = self.requests.post(url, data=json.dumps(query)).json()
+
+        if 'aggregations' in res_json:
+            origins = res_json["aggregations"]["origins"]
+            for bucket in origins["buckets"]:
+                last_values[bucket["key"]] = self.__get_agg_value(bucket["1"], offset)
+            complete = origins.get("sum_other_doc_count", 0) == 0
+
+        return (last_values, complete)
@@ -23,19 +23,26 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-import json
 import functools
 import logging
+import multiprocessing
 import subprocess
+import threading
 
-import requests
-
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as dt
 from os import path
+from time import time
 
-from dateutil import parser
+from .dates import parse_date
 from functools import lru_cache
 
+from .elastic import ElasticSearch, encode_bulk_item
+from .projects_map import ProjectsMap
+from .reader import get_reader
+from .session import SessionFactory
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -57,9 +64,37 @@ except ImportError:
     logger.info("SortingHat not available")
     SORTINGHAT_LIBS = False
 
-DEFAULT_PROJECT = 'Main'
+ELASTIC_PAGE = 1000  # enriched items read per page from the index
+ENRICH_BATCH = 100  # raw items sent to an enrich process at once
+ENRICH_PENDING_BATCHES = 2  # batches per enrich process waiting to be enriched
 DEFAULT_DB_USER = 'root'
 
+GELK_PACKAGE = 'grimoire-elk'  # distribution with the gelk version if installed
+METADATA_RESOLUTION = 1  # seconds the enriched_on time is shared between items
+
+@lru_cache()
+def get_gelk_version():
+    """ gelk version, resolved only once per process
+
+    The version of the installed package is used. If it is not
+    installed, gelk is executed directly from a git clone.
+    """
+
+    try:
+        from importlib.metadata import version
+        return version(GELK_PACKAGE)
+    except Exception:
+        pass
+
+    try:
+        git_path = path.dirname(__file__)
+        gelk_version = subprocess.check_output(["git", "-C", git_path, "describe"],
+                                               stderr=subprocess.DEVNULL).strip()
+        return gelk_version.decode("utf-8")
+    except (subprocess.CalledProcessError, OSError):
+        logging.warning("Can't get the gelk version. %s", __file__)
+        return 'Unknown'
+
 def metadata(func):
     """Add metadata to an item.
 
@@ -70,20 +105,57 @@ def metadata(func):
     @functools.wraps(func)
     def decorator(self, *args, **kwargs):
         eitem = func(self, *args, **kwargs)
-        metadata = {
-            'metadata__gelk_version': self.gelk_version,
-            'metadata__gelk_backend_name' : self.__class__.__name__,
-            'metadata__enriched_on' : dt.utcnow().isoformat()
-        }
-        eitem.update(metadata)
+        eitem.update(self.get_metadata())
         return eitem
     return decorator
 
 
+# Enrich backend used in each enrich process
+process_enrich = None
+
+def init_enrich_process(klass, params, index, elastic_options, session_config,
+                        github_token, projects_map_cache):
+    """ Create the enrich backend for an enrich process
+
+    Each process has its own SortingHat and projects map connections
+    and caches. The sessions are configured as in the parent process.
+
+    :param elastic_options: ElasticSearch url and options (get_session_options)
+    :param session_config: SessionFactory config (SessionFactory.get_config)
+    :param projects_map_cache: directory with the compiled projects maps
+    """
+    global process_enrich
+
+    SessionFactory.configure(**session_config)
+    ProjectsMap.cache_dir = projects_map_cache
+    process_enrich = klass(*params)
+    process_enrich.set_elastic(ElasticSearch(index=index, **elastic_options))
+    if github_token:
+        process_enrich.set_github_token(github_token)
+
+def enrich_batch(items, events):
+    """ Enrich items in an enrich process
+
+    :returns: list with the encoded bulk action and document for each rich
+        item, and the updates for the enrich backend of the parent process
+    """
+    bulk_items = [encode_bulk_item(_id, rich_item)
+                  for item in items
+                  for (_id, rich_item) in process_enrich.get_rich_docs(item, events)]
+    return (bulk_items, process_enrich.get_process_updates())
+
+
 class Enrich(object):
 
     def __init__(self, db_sortinghat=None, db_projects_map=None, json_projects_map=None,
-                 db_user='', db_password='', db_host='', insecure=True):
+                 db_user='', db_password='', db_host='', insecure=True,
+                 session=None):
+        # Params to create the enrich backend in enrich processes
+        self.params = (db_sortinghat, db_projects_map, json_projects_map,
+                       db_user, db_password, db_host)
+        self.enrich_processes = 0  # processes used to enrich items
+        self.process_pool = None
+        self.process_lock = threading.Lock()
         self.sortinghat = False
         if db_user == '':
             db_user = DEFAULT_DB_USER
@@ -95,78 +167,56 @@ class Enrich(object):
             self.sortinghat = True
 
         self.prjs_map = None  # mapping beetween repositories and projects
-        json_projects = None
 
         if json_projects_map:
-            with open(json_projects_map) as data_file:
-                json_projects = json.load(data_file)
-                # If we have JSON projects always use them for mapping
-                self.prjs_map = self.__convert_json_to_projects_map(json_projects)
-        if not json_projects:
+            # If we have JSON projects always use them for mapping
+            self.prjs_map = ProjectsMap.from_json_file(json_projects_map)
+        if not self.prjs_map:
             if db_projects_map and not MYSQL_LIBS:
                 raise RuntimeError("Projects configured but MySQL libraries not available.")
-            if  db_projects_map and not json_projects:
-                self.prjs_map = self.__get_projects_map(db_projects_map,
-                                                        db_user, db_password,
-                                                        db_host)
-
-        if self.prjs_map and json_projects:
-            # logging.info("Comparing db and json projects")
-            # self.__compare_projects_map(self.prjs_map, self.json_projects)
-            pass
+            if db_projects_map:
+                self.prjs_map = ProjectsMap(self.__get_projects_map(db_projects_map,
+                                                                    db_user, db_password,
+                                                                    db_host))
 
         self.studies = []
 
-        self.requests = requests.Session()
-        if insecure:
-            requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-            self.requests.verify = False
+        if session:
+            self.requests = session
+        else:
+            self.requests = SessionFactory.get_session(insecure=insecure)
 
         self.elastic = None
         self.type_name = "items"  # type inside the index to store items enriched
 
         # To add the gelk version to enriched items
-        try:
-            # gelk is executed directly from a git clone
-            git_path = path.dirname(__file__)
-            self.gelk_version = subprocess.check_output(["git", "-C", git_path, "describe"]).strip()
-            self.gelk_version = self.gelk_version.decode("utf-8")
-        except subprocess.CalledProcessError:
-            logging.warning("Can't get the gelk version. %s", __file__)
-            self.gelk_version = 'Unknown'
+        self.gelk_version = get_gelk_version()
+        # Seconds the metadata, with its enriched_on time, is reused
+        self.metadata_resolution = METADATA_RESOLUTION
+        self.__metadata = None
+        self.__metadata_time = None
 
     def set_elastic(self, elastic):
         self.elastic = elastic
 
-    def __convert_json_to_projects_map(self, json):
-        """ Convert JSON format to the projects map format
-        map[ds][repository] = project
-        If a repository is in several projects assign to leaf
-        Check that all JSON data is in the database
+    def get_metadata(self):
+        """ Metadata fields added to all the enriched items
 
-        :param json: data with the projects to repositories mapping
-        :returns: the repositories to projects mapping per data source
+        The block is built again when it is older than metadata_resolution
+        seconds, so the enriched_on time is shared by the items enriched
+        in that period. With a resolution of 0 each item gets its own time.
         """
-        ds_repo_to_prj = {}
 
-        for project in json:
-            for ds in json[project]:
-                if ds == "meta": continue  # not a real data source
-                if ds not in ds_repo_to_prj:
-                    if not ds in ds_repo_to_prj:
-                        ds_repo_to_prj[ds] = {}
-                for repo in json[project][ds]:
-                    if repo in ds_repo_to_prj[ds]:
-                        if project == ds_repo_to_prj[ds][repo]:
-                            logging.debug("Duplicated repo: %s %s %s", ds, repo, project)
-                        else:
-                            if len(project.split(".")) > len(ds_repo_to_prj[ds][repo].split(".")):
-                                logging.debug("Changed repo project because we found a leaf: %s leaf vs %s (%s, %s)",
-                                              project, ds_repo_to_prj[ds][repo], repo, ds)
-                                ds_repo_to_prj[ds][repo] = project
-                    else:
-                        ds_repo_to_prj[ds][repo] = project
-        return  ds_repo_to_prj
+        now = time()
+        if self.__metadata is None or \
+           now - self.__metadata_time >= self.metadata_resolution:
+            self.__metadata = {
+                'metadata__gelk_version': self.gelk_version,
+                'metadata__gelk_backend_name' : self.__class__.__name__,
+                'metadata__enriched_on' : dt.utcnow().isoformat()
+            }
+            self.__metadata_time = now
+        return self.__metadata
 
     def __compare_projects_map(self, db, json):
         # Compare the projects coming from db and from a json file in eclipse
@@ -276,54 +326,158 @@ class Enrich(object):
         return self.enrich_items(items, events=True)
 
     def enrich_items(self, items, events=False):
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        total = 0
-        bulk_json = ""
+        """ Enrich the items and write the rich documents in the index
+
+        This is the only writer for the rich documents of all connectors.
+        Connectors with several documents per raw item (events, answers,
+        reviews...) yield them from get_rich_docs. The bulk batcher
+        bounds, encodes, retries and counts them.
+
+        If items is a reader with checkpoints, its read state is saved
+        once the rich documents of the items read are written.
+
+        :returns: number of rich documents written
+        """
 
         url = self.elastic.index_url+'/items/_bulk'
 
-        logging.debug("Adding items to %s (in %i packs)", url, max_items)
+        logging.debug("Adding items to %s (in %i packs)", url,
+                      self.elastic.max_items_bulk)
 
         if events:
             logging.debug("Adding events items")
 
-        for item in items:
-            if current >= max_items:
-                try:
-                    self.requests.put(url, data=bulk_json)
-                    logging.debug("Added %i items to %s", total, url)
-                except UnicodeEncodeError:
-                    # Why is requests encoding the POST data as ascii?
-                    logging.error("Unicode error in enriched items")
-                    logging.debug(bulk_json)
-                    safe_json = str(bulk_json.encode('ascii', 'ignore'), 'ascii')
-                    self.requests.put(url, data=safe_json)
-                bulk_json = ""
-                current = 0
-
-            if not events:
-                rich_item = self.get_rich_item(item)
-                data_json = json.dumps(rich_item)
-                bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                    (item[self.get_field_unique_id()])
-                bulk_json += data_json +"\n"  # Bulk document
-                current += 1
-                total += 1
-            else:
-                rich_events = self.get_rich_events(item)
-                for rich_event in rich_events:
-                    data_json = json.dumps(rich_event)
-                    bulk_json += '{"index" : {"_id" : "%s_%s" } }\n' % \
-                        (item[self.get_field_unique_id()],
-                         rich_event[self.get_field_event_unique_id()])
-                    bulk_json += data_json +"\n"  # Bulk document
-                    current += 1
-                    total += 1
-        self.requests.put(url, data = bulk_json)
+        batcher = self.elastic.get_bulk_batcher(url)
+
+        if self.enrich_processes > 1:
+            self.__enrich_in_processes(items, events, batcher)
+        else:
+            if hasattr(items, 'on_checkpoint'):
+                items.on_checkpoint = batcher.on_written
+            for item in items:
+                for (_id, rich_item) in self.get_rich_docs(item, events):
+                    batcher.add(_id, rich_item)
+        total = batcher.flush()
 
         return total
 
+    def get_rich_docs(self, item, events=False):
+        """ Generator with the (_id, rich document) for the raw item
+
+        Override it to create several rich documents from a raw item.
+        It is also used in the enrich processes.
+        """
+
+        if not events:
+            yield (item[self.get_field_unique_id()], self.get_rich_item(item))
+        else:
+            rich_events = self.get_rich_events(item)
+            for rich_event in rich_events:
+                yield ("%s_%s" % (item[self.get_field_unique_id()],
+                                  rich_event[self.get_field_event_unique_id()]),
+                       rich_event)
+
+    def __enrich_in_processes(self, items, events, batcher):
+        """ Enrich the items in processes and add them to batcher
+
+        Batches of items are enriched in the processes and the results
+        are added in the same order as the items. The checkpoints of the
+        reader are passed to batcher after the batches read before them.
+        """
+
+        with self.process_lock:
+            if not self.process_pool:
+                logging.info("Enriching with %i processes", self.enrich_processes)
+                # spawn: the bulk writer and prefetch threads can't be forked
+                context = multiprocessing.get_context("spawn")
+                session_config = SessionFactory.get_config()
+                # The nodes found sniffing are already in the elastic url
+                session_config["sniff"] = False
+                initargs = (type(self), self.params, self.elastic.index,
+                            self.elastic.get_session_options(), session_config,
+                            getattr(self, 'github_token', None), ProjectsMap.cache_dir)
+                self.process_pool = ProcessPoolExecutor(self.enrich_processes,
+                                                        mp_context=context,
+                                                        initializer=init_enrich_process,
+                                                        initargs=initargs)
+
+        pending = deque()  # (batch sent to the processes, its checkpoints), in order
+        max_pending = self.enrich_processes * ENRICH_PENDING_BATCHES
+        batch = []
+        checkpoints = []  # checkpoints reached with the items in batch
+
+        def checkpoint(save):
+            if batch:
+                checkpoints.append(save)
+            elif pending:
+                pending[-1][1].append(save)
+            else:
+                batcher.on_written(save)
+
+        def add_batch():
+            (future, batch_checkpoints) = pending.popleft()
+            (bulk_items, updates) = future.result()
+            if updates:
+                self.add_process_updates(updates)
+            for bulk_item in bulk_items:
+                batcher.add_encoded(bulk_item)
+            for save in batch_checkpoints:
+                batcher.on_written(save)
+
+        if hasattr(items, 'on_checkpoint'):
+            items.on_checkpoint = checkpoint
+
+        for item in items:
+            batch.append(item)
+            if len(batch) >= ENRICH_BATCH:
+                pending.append((self.process_pool.submit(enrich_batch, batch, events),
+                                checkpoints))
+                batch = []
+                checkpoints = []
+            if len(pending) > max_pending:
+                add_batch()
+        if batch:
+            pending.append((self.process_pool.submit(enrich_batch, batch, events),
+                            checkpoints))
+            batch = []
+        while pending:
+            add_batch()
+
+    def get_process_updates(self):
+        """ Data found enriching items in an enrich process, used by the parent
+
+        The enrich backends that find data while enriching, written at the
+        end of enrich_items, return it here. It is passed to
+        add_process_updates in the parent process.
+        """
+        return None
+
+    def add_process_updates(self, updates):
+        """ Add the data found by an enrich process (get_process_updates) """
+        pass
+
+    def clone(self):
+        """ New enrich backend with the same configuration and elastic
+
+        It has its own SortingHat and projects map connections and caches,
+        so it can enrich items in another thread. The enrich processes are
+        not shared.
+        """
+
+        enrich = type(self)(*self.params)
+        enrich.set_elastic(self.elastic)
+        if getattr(self, 'github_token', None):
+            enrich.set_github_token(self.github_token)
+        enrich.enrich_processes = self.enrich_processes
+        return enrich
+
+    def close_processes(self):
+        """ Stop the enrich processes """
+
+        if self.process_pool:
+            self.process_pool.shutdown()
+            self.process_pool = None
+
     def get_connector_name(self):
         """ Find the name for the current connector """
         from ..utils import get_connector_name
@@ -337,6 +491,14 @@ class Enrich(object):
         """ Field with the date in the JSON enriched items """
         return "metadata__updated_on"
 
+    def get_fields_identities(self):
+        """ Fields of the raw items used by get_identities, None for all """
+        return None
+
+    def get_fields_project(self):
+        """ Fields of the enriched items used by get_project_repository, None for all """
+        return None
+
     def get_fields_uuid(self):
         """ Fields with unique identities in the JSON enriched items """
         raise NotImplementedError
@@ -414,7 +576,7 @@ class Enrich(object):
 
         grimoire_date = None
         try:
-            grimoire_date = parser.parse(creation_date).isoformat()
+            grimoire_date = parse_date(creation_date).isoformat()
         except Exception as ex:
             pass
 
@@ -425,86 +587,29 @@ class Enrich(object):
             name: 1
         }
 
-    # Get items for the generator: initial scroll query
-    def __get_elastic_items(self, elastic_scroll_id=None):
-        """ Get the items from the enriched index related to the backend """
-
-        elastic_page = 1000
-        url = self.elastic.index_url
-        max_process_items_pack_time = "10m"  # 10 minutes
-        url += "/_search?scroll=%s&size=%i" % (max_process_items_pack_time,
-                                               elastic_page)
-        res_json = None # query results in JSON format
-
-        if elastic_scroll_id:
-            """ Just continue with the scrolling """
-            url = self.elastic.url
-            url += "/_search/scroll"
-            scroll_data = {
-                "scroll" : max_process_items_pack_time,
-                "scroll_id" : elastic_scroll_id
-            }
-            r = self.requests.post(url, data=json.dumps(scroll_data))
-        else:
-            filters = """
-            {
-              "query_string": {
-                "analyze_wildcard": true,
-                "query": "*"
-              }
-            }
-            """
-            order_field = self.get_field_date()
-            order_query = ''
-            order_query = ', "sort": { "%s": { "order": "asc" }} ' % order_field
-
-            query = """
-            {
-                "query": {
-                    "bool": {
-                        "must": [%s]
-                    }
-                } %s
-            }
-            """ % (filters, order_query)
-
-            logging.debug("%s %s", url, query)
-
-            r = self.requests.post(url, data=query)
-
-        try:
-            res_json = r.json()
-        except Exception as e:
-            print(e)
-            logging.error("No JSON found in %s", r.text)
-            logging.error("No results found from %s", url)
-
-        return res_json
-
-
     # Enriched items generator
-    def fetch(self):
-        logging.debug("Creating enriched items generator.")
-
-        elastic_scroll_id = None
+    def fetch(self, fields=None):
+        """ Reader with the enriched items
 
-        while True:
-            rjson = self.__get_elastic_items(elastic_scroll_id)
-
-            if rjson and "_scroll_id" in rjson:
-                elastic_scroll_id = rjson["_scroll_id"]
+        :param fields: fields to get from the items (_source includes), None for all
+        """
+        logging.debug("Creating enriched items generator.")
 
-            if rjson and "hits" in rjson:
-                if len(rjson["hits"]["hits"]) == 0:
-                    break
-                for hit in rjson["hits"]["hits"]:
-                    eitem = hit['_source']
-                    yield eitem
-            else:
-                logging.error("No results found from %s", self.elastic.index_url)
-                break
+        filters = {
+            "query_string": {
+                "analyze_wildcard": True,
+                "query": "*"
+            }
+        }
+        order_field = self.get_field_date()
+        query = {
+            "query": {"bool": {"must": [filters]}},
+            "sort": {order_field: {"order": "asc"}}
+        }
+        if fields:
+            query["_source"] = fields
 
-        return
+        return get_reader(self.elastic, query, ELASTIC_PAGE)
 
     # Project field enrichment
     def get_project_repository(self, eitem):
@@ -517,33 +622,10 @@ class Enrich(object):
 
     def get_item_project(self, eitem):
         """ Get project mapping enrichment field """
-        eitem_project = {}
         ds_name = self.get_connector_name()  # data source name in projects map
         repository = self.get_project_repository(eitem)
-        try:
-            project = (self.prjs_map[ds_name][repository])
-            # logging.debug("Project FOUND for repository %s %s", repository, project)
-        except KeyError:
-            # logging.warning("Project not found for repository %s (data source: %s)", repository, ds_name)
-            project = None
-            # Try to use always the origin in any case
-            if ds_name in self.prjs_map and eitem['origin'] in self.prjs_map[ds_name]:
-                project = self.prjs_map[ds_name][eitem['origin']]
-
-        if project is None:
-            project = DEFAULT_PROJECT
-
-        eitem_project = {"project": project}
-        # Time to add the project levels: eclipse.platform.releng.aggregator
-        eitem_path = ''
-        if project is not None:
-            subprojects = project.split('.')
-            for i in range(0, len(subprojects)):
-                if i > 0:
-                    eitem_path += "."
-                eitem_path += subprojects[i]
-                eitem_project['project_' + str(i+1)] = eitem_path
-        return eitem_project
+        # Try to use always the origin in any case
+        return self.prjs_map.get_project_fields(ds_name, repository, eitem['origin'])
 
     # Sorting Hat stuff to be moved to SortingHat class
 
@@ -651,7 +733,7 @@ class Enrich(object):
         if not roles:
             roles = [author_field]
 
-        date = parser.parse(eitem[self.get_field_date()])
+        date = parse_date(eitem[self.get_field_date()])
 
         for rol in roles:
             if rol+"_id" not in eitem:
@@ -698,7 +780,7 @@ class Enrich(object):
         if not roles:
             roles = [author_field]
 
-        item_date = parser.parse(item[self.get_field_date()])
+        item_date = parse_date(item[self.get_field_date()])
 
         users_data = self.get_users_data(item)
 
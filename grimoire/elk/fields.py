@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Declarative extraction of the raw item fields copied to rich items
+#
+# Copyright (C) 2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#   Alvaro del Castillo San Felix <acs@bitergia.com>
+#
+
+# Fields added to the raw items in ocean, copied to all the rich items
+METADATA_FIELDS = ["metadata__updated_on", "metadata__timestamp", "ocean-unique-id", "origin"]
+
+
+class Field(object):
+    """ Field of the rich item copied from a field of the raw item """
+
+    def __init__(self, name, path=None, required=False, default=None):
+        """
+        :param name: name of the field in the rich item
+        :param path: path of the field in the raw item, as a dotted string
+            ("data.commit") or a tuple of keys. By default, name in the item.
+        :param required: if the raw field is missing raise KeyError instead
+            of using default. The parents of the field are always required.
+        :param default: value used when the raw field is missing. It is
+            shared by all the rich items, so it must not be mutable.
+        """
+        self.name = name
+        if path is None:
+            path = (name,)
+        elif isinstance(path, str):
+            path = tuple(path.split("."))
+        self.path = tuple(path)
+        self.required = required
+        self.default = default
+
+    def __repr__(self):
+        return "Field(%r, %r)" % (self.name, ".".join(self.path))
+
+
+def compile_fields(fields):
+    """ Compile the fields into a function creating the rich item with them
+
+    The code of the function is generated once, so each item is built
+    with a dict display: each parent (item['data']) is got only once and
+    no loops or membership tests are run per field.
+
+    In the enrich backends it is defined once in the class, as the
+    static method rich_fields used in get_rich_item.
+
+    :param fields: list of Field
+    :returns: function(item) returning a new dict with the fields. The
+        fields are available in its fields attribute as documentation.
+    """
+
+    namespace = {}
+    parents = {(): "item"}  # path of parents to the local var with them
+    lines = []
+
+    def get_parent(path):
+        if path not in parents:
+            var = "parent%i" % len(parents)
+            lines.append("    %s = %s[%r]" % (var, get_parent(path[:-1]), path[-1]))
+            parents[path] = var
+        return parents[path]
+
+    values = []
+    for (i, field) in enumerate(fields):
+        parent = get_parent(field.path[:-1])
+        key = field.path[-1]
+        if field.required:
+            value = "%s[%r]" % (parent, key)
+        elif field.default is None:
+            value = "%s.get(%r)" % (parent, key)
+        else:
+            namespace["default%i" % i] = field.default
+            value = "%s.get(%r, default%i)" % (parent, key, i)
+        values.append("        %r: %s," % (field.name, value))
+
+    source = "def extract_fields(item):\n"
+    source += "\n".join(lines + ["    return {"] + values + ["    }"]) + "\n"
+
+    exec(compile(source, "<fields %s>" % [field.name for field in fields], "exec"),
+         namespace)
+    extract_fields = namespace["extract_fields"]
+    extract_fields.fields = list(fields)
+    extract_fields.source = source
+
+    return extract_fields
@@ -24,13 +24,14 @@
 #
 
 from datetime import datetime
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 import json
 import logging
 import time
 
 
 from grimoire.elk.enrich import Enrich, metadata
+from grimoire.elk.fields import METADATA_FIELDS, Field, compile_fields
 
 class GerritEnrich(Enrich):
 
@@ -54,11 +55,18 @@ class GerritEnrich(Enrich):
         if 'username' in user: identity['username'] = user['username']
         return identity
 
+    def get_fields_project(self):
+        return ["repository"]
+
     def get_project_repository(self, eitem):
         repo = eitem['origin']
         repo += "_" + eitem['repository']
         return repo
 
+    def get_fields_identities(self):
+        return ["data.owner", "data.patchSets.uploader", "data.patchSets.author",
+                "data.patchSets.approvals.by", "data.comments.reviewer"]
+
     def get_identities(self, item):
         ''' Return the identities from an item '''
 
@@ -143,35 +151,24 @@ class GerritEnrich(Enrich):
         return {"items":mapping}
 
 
+    # metadata fields and review fields to copy, and review fields which names are translated
+    rich_fields = staticmethod(compile_fields(
+        [Field(f) for f in METADATA_FIELDS] +
+        [Field("closed", "metadata__updated_on", required=True)] +
+        [Field(f, ("data", f), required=True) for f in ["status", "branch", "url"]] +
+        [Field("summary", "data.subject", required=True),
+         Field("githash", "data.id", required=True),
+         Field("opened", "data.createdOn", required=True),
+         Field("repository", "data.project", required=True),
+         Field("number", "data.number", required=True)]))
+
     @metadata
     def get_rich_item(self, item):
-        eitem = {}  # Item enriched
-
-        # metadata fields to copy
-        copy_fields = ["metadata__updated_on","metadata__timestamp","ocean-unique-id","origin"]
-        for f in copy_fields:
-            if f in item:
-                eitem[f] = item[f]
-            else:
-                eitem[f] = None
-        eitem['closed'] = item['metadata__updated_on']
         # The real data
         review = item['data']
         self._fix_review_dates(review)
 
-        # data fields to copy
-        copy_fields = ["status", "branch", "url"]
-        for f in copy_fields:
-            eitem[f] = review[f]
-        # Fields which names are translated
-        map_fields = {"subject": "summary",
-                      "id": "githash",
-                      "createdOn": "opened",
-                      "project": "repository",
-                      "number": "number"
-                      }
-        for fn in map_fields:
-            eitem[map_fields[fn]] = review[fn]
+        eitem = self.rich_fields(item)  # Item enriched
         eitem["summary_analyzed"] = eitem["summary"]
         eitem["name"] = None
         eitem["domain"] = None
@@ -184,10 +181,10 @@ class GerritEnrich(Enrich):
         eitem["patchsets"] = len(review["patchSets"])
 
         # Time to add the time diffs
-        createdOn_date = parser.parse(review['createdOn'])
+        createdOn_date = parse_date(review['createdOn'])
         if len(review["patchSets"]) > 0:
-            createdOn_date = parser.parse(review["patchSets"][0]['createdOn'])
-        lastUpdated_date = parser.parse(review['lastUpdated'])
+            createdOn_date = parse_date(review["patchSets"][0]['createdOn'])
+        lastUpdated_date = parse_date(review['lastUpdated'])
         seconds_day = float(60*60*24)
         if eitem['status'] in ['MERGED','ABANDONED']:
             timeopen = \
@@ -29,9 +29,10 @@ import time
 
 import requests
 
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 
 from grimoire.elk.enrich import Enrich, metadata
+from grimoire.elk.fields import METADATA_FIELDS, Field, compile_fields
 
 try:
     from grimoire.elk.sortinghat import SortingHat
@@ -89,6 +90,9 @@ class GitEnrich(Enrich):
 
         return {"items":mapping}
 
+    def get_fields_identities(self):
+        return ["origin", "data.commit", "data.Author", "data.Commit"]
+
     def get_identities(self, item):
         """ Return the identities from an item.
             If the repo is in GitHub, get the usernames from GitHub. """
@@ -152,6 +156,9 @@ class GitEnrich(Enrich):
 
         return identity
 
+    def get_fields_project(self):
+        return []
+
     def get_project_repository(self, eitem):
         return eitem['origin']
 
@@ -216,36 +223,23 @@ class GitEnrich(Enrich):
 
         return login
 
+    # metadata fields and commit fields to copy, and commit fields which names are translated
+    rich_fields = staticmethod(compile_fields(
+        [Field(f) for f in METADATA_FIELDS] +
+        [Field(f, ("data", f)) for f in ["message", "Author"]] +
+        [Field("hash", "data.commit"),
+         Field("message_analyzed", "data.message"),
+         Field("Committer", "data.Commit")]))
+
     @metadata
     def get_rich_item(self, item):
-        eitem = {}
-        # metadata fields to copy
-        copy_fields = ["metadata__updated_on","metadata__timestamp","ocean-unique-id","origin"]
-        for f in copy_fields:
-            if f in item:
-                eitem[f] = item[f]
-            else:
-                eitem[f] = None
+        eitem = self.rich_fields(item)
         # The real data
         commit = item['data']
-        # data fields to copy
-        copy_fields = ["message","Author"]
-        for f in copy_fields:
-            if f in commit:
-                eitem[f] = commit[f]
-            else:
-                eitem[f] = None
-        # Fields which names are translated
-        map_fields = {"commit": "hash","message":"message_analyzed","Commit":"Committer"}
-        for fn in map_fields:
-            if fn in commit:
-                eitem[map_fields[fn]] = commit[fn]
-            else:
-                eitem[map_fields[fn]] = None
         eitem['hash_short'] = eitem['hash'][0:6]
         # Enrich dates
-        author_date = parser.parse(commit["AuthorDate"])
-        commit_date = parser.parse(commit["CommitDate"])
+        author_date = parse_date(commit["AuthorDate"])
+        commit_date = parse_date(commit["CommitDate"])
         eitem["author_date"] = author_date.replace(tzinfo=None).isoformat()
         eitem["commit_date"] = commit_date.replace(tzinfo=None).isoformat()
         eitem["utc_author"] = (author_date-author_date.utcoffset()).replace(tzinfo=None).isoformat()
@@ -372,7 +366,7 @@ class GitEnrich(Enrich):
         }
         """ % (query)
 
-        r = self.requests.post(self.elastic.index_url+"/_search", data=es_query, verify=False)
+        r = self.elastic.requests.post(self.elastic.index_url+"/_search", data=es_query)
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError as ex:
@@ -406,7 +400,7 @@ class GitEnrich(Enrich):
             # Time to add all the commits (items) from this author
             author_query_json['query']['bool']['must'][0]['term']['Author'] = author['key']
             author_query_str = json.dumps(author_query_json)
-            r = self.requests.post(self.elastic.index_url+"/_search?size=10000", data=author_query_str, verify=False)
+            r = self.elastic.requests.post(self.elastic.index_url+"/_search?size=10000", data=author_query_str)
 
             if "hits" not in r.json():
                 logging.error("Can't find commits for %s" % (author['key']))
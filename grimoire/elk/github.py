@@ -23,7 +23,6 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-import json
 import logging
 import re
 
@@ -34,6 +33,7 @@ from dateutil import parser
 from .utils import get_time_diff_days
 
 from grimoire.elk.enrich import Enrich, metadata
+from grimoire.elk.fields import METADATA_FIELDS, Field, compile_fields
 
 GITHUB = 'https://github.com/'
 
@@ -48,6 +48,7 @@ class GitHubEnrich(Enrich):
         self.users = {}  # cache users
         self.location = {}  # cache users location
         self.location_not_found = []  # location not found in map api
+        self.geolocations_found = {}  # found in map api, not yet in Elastic
 
     def set_elastic(self, elastic):
         self.elastic = elastic
@@ -60,6 +61,9 @@ class GitHubEnrich(Enrich):
     def get_fields_uuid(self):
         return ["assignee_uuid", "user_uuid"]
 
+    def get_fields_identities(self):
+        return ["data.user", "data.assignee", "data.user_data", "data.assignee_data"]
+
     def get_identities(self, item):
         """ Return the identities from an item """
         identities = []
@@ -130,6 +134,7 @@ class GitHubEnrich(Enrich):
                     "lon": geo_code['lng']
                 }
                 self.geolocations[location] = geo_point
+                self.geolocations_found[location] = geo_point
 
 
         return geo_point
@@ -146,7 +151,7 @@ class GitHubEnrich(Enrich):
 
         url = self.elastic.url + "/"+index_github
         url += "/_search" + "?" + "size=%i" % res_size
-        r = self.requests.get(url)
+        r = self.elastic.requests.get(url)
         type_items = r.json()
 
         if 'hits' not in type_items:
@@ -158,7 +163,7 @@ class GitHubEnrich(Enrich):
                     item = hit['_source']
                     cache[item[_key]] = item
                 _from += res_size
-                r = self.requests.get(url+"&from=%i" % _from)
+                r = self.elastic.requests.get(url+"&from=%i" % _from)
                 type_items = r.json()
                 if 'hits' not in type_items:
                     break
@@ -170,35 +175,30 @@ class GitHubEnrich(Enrich):
         return self.get_github_cache("geolocations", "location")
 
     def geo_locations_to_es(self):
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        bulk_json = ""
+        """ Add to Elastic the geolocations found since the last call """
 
-        url = self.elastic.url + "/github/geolocations/_bulk"
+        (found, self.geolocations_found) = (self.geolocations_found, {})
+        if not found:
+            return
 
-        logging.debug("Adding geoloc to %s (in %i packs)" % (url, max_items))
+        url = self.elastic.url + "/github/geolocations/_bulk"
 
+        logging.debug("Adding %i geoloc to %s (in %i packs)" % (len(found), url,
+                                                                self.elastic.max_items_bulk))
 
-        for loc in self.geolocations:
-            if current >= max_items:
-                self.requests.put(url, data=bulk_json)
-                bulk_json = ""
-                current = 0
+        batcher = self.elastic.get_bulk_batcher(url)
 
-            geopoint = self.geolocations[loc]
+        for loc in found:
+            geopoint = found[loc]
             location = geopoint.copy()
             location["location"] = loc
-            # First upload the raw issue data to ES
-            data_json = json.dumps(location)
             # Don't include in URL non ascii codes
             safe_loc = str(loc.encode('ascii', 'ignore'),'ascii')
             geo_id = str("%s-%s-%s" % (location["lat"], location["lon"],
                                        safe_loc))
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % (geo_id)
-            bulk_json += data_json +"\n"  # Bulk document
-            current += 1
+            batcher.add(geo_id, location)
 
-        self.requests.put(url, data = bulk_json)
+        batcher.flush()
 
         logging.debug("Adding geoloc to ES Done")
 
@@ -228,21 +228,21 @@ class GitHubEnrich(Enrich):
     def get_field_unique_id(self):
         return "ocean-unique-id"
 
+    def get_fields_project(self):
+        return []
+
     def get_project_repository(self, eitem):
         repo = eitem['origin']
         return repo
 
+    # metadata fields to copy
+    rich_fields = staticmethod(compile_fields(
+        [Field(f) for f in METADATA_FIELDS]))
+
     @metadata
     def get_rich_item(self, item):
-        rich_issue = {}
-
-        # metadata fields to copy
-        copy_fields = ["metadata__updated_on","metadata__timestamp","ocean-unique-id","origin"]
-        for f in copy_fields:
-            if f in item:
-                rich_issue[f] = item[f]
-            else:
-                rich_issue[f] = None
+        rich_issue = self.rich_fields(item)
+
         # The real data
         issue = item['data']
 
@@ -338,11 +338,20 @@ class GitHubEnrich(Enrich):
 
         return rich_issue
 
+    def get_process_updates(self):
+        # Geolocations found, written to Elastic by the parent process
+        (found, self.geolocations_found) = (self.geolocations_found, {})
+        return found
+
+    def add_process_updates(self, updates):
+        self.geolocations.update(updates)
+        self.geolocations_found.update(updates)
+
     def enrich_items(self, items):
         total = super(GitHubEnrich, self).enrich_items(items)
 
         logging.debug("Updating GitHub users geolocations in Elastic")
-        self.geo_locations_to_es() # Update geolocations in Elastic
+        self.geo_locations_to_es() # Only the new ones, called for each fused pack
 
         return total
 
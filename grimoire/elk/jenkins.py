@@ -25,9 +25,10 @@
 import json
 import logging
 
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 
 from grimoire.elk.enrich import Enrich, metadata
+from grimoire.elk.fields import METADATA_FIELDS, Field, compile_fields
 
 class JenkinsEnrich(Enrich):
 
@@ -109,33 +110,16 @@ class JenkinsEnrich(Enrich):
         # No SH support
         return {}
 
+    # metadata fields and build fields to copy, and build fields which names are translated
+    rich_fields = staticmethod(compile_fields(
+        [Field(f) for f in METADATA_FIELDS] +
+        [Field(f, ("data", f)) for f in ["fullDisplayName", "url", "result", "duration", "builtOn"]] +
+        [Field("fullDisplayName_analyzed", "data.fullDisplayName", required=True),
+         Field("build", "data.number", required=True)]))
+
     @metadata
     def get_rich_item(self, item):
-        eitem = {}
-
-        # metadata fields to copy
-        copy_fields = ["metadata__updated_on","metadata__timestamp","ocean-unique-id","origin"]
-        for f in copy_fields:
-            if f in item:
-                eitem[f] = item[f]
-            else:
-                eitem[f] = None
-        # The real data
-        build = item['data']
-
-        # data fields to copy
-        copy_fields = ["fullDisplayName","url","result","duration","builtOn"]
-        for f in copy_fields:
-            if f in build:
-                eitem[f] = build[f]
-            else:
-                eitem[f] = None
-        # Fields which names are translated
-        map_fields = {"fullDisplayName": "fullDisplayName_analyzed",
-                      "number": "build"
-                      }
-        for fn in map_fields:
-            eitem[map_fields[fn]] = build[fn]
+        eitem = self.rich_fields(item)
 
         # Job url: remove the last /build_id from job_url/build_id/
         eitem['job_url'] = eitem['url'].rsplit("/", 2)[0]
@@ -143,7 +127,7 @@ class JenkinsEnrich(Enrich):
         eitem['job_build'] = eitem['job_name']+'/'+str(eitem['build'])
 
         # Enrich dates
-        eitem["build_date"] = parser.parse(item["metadata__updated_on"]).isoformat()
+        eitem["build_date"] = parse_date(item["metadata__updated_on"]).isoformat()
 
         # Add duration in days
         if "duration" in eitem:
@@ -32,6 +32,7 @@ from time import time
 from dateutil import parser
 
 from .enrich import Enrich, metadata
+from .fields import METADATA_FIELDS, Field, compile_fields
 
 from .utils import get_time_diff_days
 
@@ -81,6 +82,9 @@ class JiraEnrich(Enrich):
             users_data = item
         return users_data
 
+    def get_fields_identities(self):
+        return ["data.fields.assignee", "data.fields.reporter", "data.fields.creator"]
+
     def get_identities(self, item):
         ''' Return the identities from an item '''
 
@@ -94,29 +98,19 @@ class JiraEnrich(Enrich):
 
         return identities
 
+    # metadata fields to copy and fields that are the same in item and eitem
+    rich_fields = staticmethod(compile_fields(
+        [Field(f) for f in METADATA_FIELDS + ["uuid"]] +
+        [Field(f, ("data", f)) for f in ["assigned_to", "reporter"]]))
+
     @metadata
     def get_rich_item(self, item):
 
-        eitem = {}
+        eitem = self.rich_fields(item)
 
-        # metadata fields to copy
-        copy_fields = ["metadata__updated_on","metadata__timestamp","ocean-unique-id","origin","uuid"]
-        for f in copy_fields:
-            if f in item:
-                eitem[f] = item[f]
-            else:
-                eitem[f] = None
         # The real data
         issue = item['data']
 
-        # Fields that are the same in item and eitem
-        copy_fields = ["assigned_to","reporter"]
-        for f in copy_fields:
-            if f in issue:
-                eitem[f] = issue[f]
-            else:
-                eitem[f] = None
-
         # dizquierdo requirements T146
         eitem['changes'] = issue['changelog']['total']
         if issue["fields"]["assignee"]:
@@ -22,13 +22,11 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-import json
-import logging
-
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 import email.utils
 
 from grimoire.elk.enrich import Enrich, metadata
+from grimoire.elk.fields import METADATA_FIELDS, Field, compile_fields
 
 class MBoxEnrich(Enrich):
 
@@ -55,6 +53,9 @@ class MBoxEnrich(Enrich):
 
         return {"items":mapping}
 
+    def get_fields_identities(self):
+        return ["data.From"]
+
     def get_identities(self, item):
         """ Return the identities from an item """
         identities = []
@@ -90,6 +91,9 @@ class MBoxEnrich(Enrich):
             identity['name'] = identity['email'].split('@')[0]
         return identity
 
+    def get_fields_project(self):
+        return []
+
     def get_project_repository(self, eitem):
         mls_list = eitem['origin']
         # Eclipse specific yet
@@ -97,38 +101,22 @@ class MBoxEnrich(Enrich):
         repo += mls_list+".mbox/"+mls_list+".mbox"
         return repo
 
+    # metadata fields to copy, fields that are the same in message and eitem
+    # and fields which names are translated
+    rich_fields = staticmethod(compile_fields(
+        [Field(f) for f in METADATA_FIELDS] +
+        [Field(f, ("data", f)) for f in ["Date", "From", "Subject", "Message-ID"]] +
+        [Field("Subject_analyzed", "data.Subject")]))
+
     @metadata
     def get_rich_item(self, item):
-        eitem = {}
-
-        # metadata fields to copy
-        copy_fields = ["metadata__updated_on","metadata__timestamp","ocean-unique-id","origin"]
-        for f in copy_fields:
-            if f in item:
-                eitem[f] = item[f]
-            else:
-                eitem[f] = None
+        eitem = self.rich_fields(item)
+
         # The real data
         message = item['data']
 
-        # Fields that are the same in message and eitem
-        copy_fields = ["Date","From","Subject","Message-ID"]
-        for f in copy_fields:
-            if f in message:
-                eitem[f] = message[f]
-            else:
-                eitem[f] = None
-        # Fields which names are translated
-        map_fields = {"Subject": "Subject_analyzed"
-                      }
-        for fn in map_fields:
-            if fn in message:
-                eitem[map_fields[fn]] = message[fn]
-            else:
-                eitem[map_fields[fn]] = None
-
         # Enrich dates
-        eitem["email_date"] = parser.parse(item["metadata__updated_on"]).isoformat()
+        eitem["email_date"] = parse_date(item["metadata__updated_on"]).isoformat()
         eitem["list"] = item["origin"]
 
         # Root message
@@ -145,7 +133,7 @@ class MBoxEnrich(Enrich):
 
         # Time zone
         try:
-            message_date = parser.parse(message['Date'])
+            message_date = parse_date(message['Date'])
             eitem["tz"]  = int(message_date.strftime("%z")[0:3])
         except:
             eitem["tz"]  = None
@@ -159,46 +147,3 @@ class MBoxEnrich(Enrich):
         eitem.update(self.get_grimoire_fields(message['Date'], "message"))
 
         return eitem
-
-    def enrich_items(self, items):
-        # Use standard method and if fails, use the old one with Unicode control
-        total = 0
-        try:
-            total = super(MBoxEnrich, self).enrich_items(items)
-        except UnicodeEncodeError:
-            total = self.enrich_items_old(items)
-
-        return total
-
-    def enrich_items_old(self, items):
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        total = 0
-        bulk_json = ""
-
-        url = self.elastic.index_url+'/items/_bulk'
-
-        logging.debug("Adding items to %s (in %i packs)" % (url, max_items))
-
-        for item in items:
-            if current >= max_items:
-                self.requests.put(url, data=bulk_json)
-                bulk_json = ""
-                current = 0
-
-            rich_item = self.get_rich_item(item)
-            data_json = json.dumps(rich_item)
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                (rich_item[self.get_field_unique_id()])
-            bulk_json += data_json +"\n"  # Bulk document
-            current += 1
-            total += 1
-        try:
-            self.requests.put(url, data = bulk_json)
-        except UnicodeEncodeError:
-            # Related to body.encode('iso-8859-1'). mbox data
-            logging.error("Encoding error ... converting bulk to iso-8859-1")
-            bulk_json = bulk_json.encode('iso-8859-1','ignore')
-            self.requests.put(url, data=bulk_json)
-
-        return total
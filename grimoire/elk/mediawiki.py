@@ -22,10 +22,7 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-import json
-import logging
-
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 
 from grimoire.elk.enrich import Enrich, metadata
 
@@ -84,7 +81,7 @@ class MediaWikiEnrich(Enrich):
         """ Add sorting hat enrichment fields for the author of the revision """
 
         identity  = self.get_sh_identity(revision)
-        update =  parser.parse(item[self.get_field_date()])
+        update =  parse_date(item[self.get_field_date()])
         erevision = self.get_item_sh_fields(identity, update)
 
         return erevision
@@ -166,7 +163,7 @@ class MediaWikiEnrich(Enrich):
             eitem[map_fields[fn]] = page[fn]
 
         # Enrich dates
-        eitem["update_date"] = parser.parse(item["metadata__updated_on"]).isoformat()
+        eitem["update_date"] = parse_date(item["metadata__updated_on"]).isoformat()
         # Revisions
         eitem["last_edited_date"] = None
         eitem["nrevisions"] = len(page["revisions"])
@@ -179,37 +176,9 @@ class MediaWikiEnrich(Enrich):
 
         return eitem
 
-    def enrich_items(self, items):
-        if True:
-            # Hack: by default we use events in MediaWiki
-            return self.enrich_events(items)
-        else:
-            super(MediaWikiEnrich, self).enrich_items(items)
-
-
-    def enrich_events(self, items):
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        bulk_json = ""
-        total = 0
-
-        url = self.elastic.index_url+'/items/_bulk'
-
-        logging.debug("Adding items to %s (in %i packs)" % (url, max_items))
-
-        for item in items:
-            rich_item_reviews = self.get_rich_item_reviews(item)
-            for enrich_review in rich_item_reviews:
-                if current >= max_items:
-                    self.requests.put(url, data=bulk_json)
-                    bulk_json = ""
-                    current = 0
-                data_json = json.dumps(enrich_review)
-                bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                    (enrich_review[self.get_field_unique_id_review()])
-                bulk_json += data_json +"\n"  # Bulk document
-                current += 1
-                total += 1
-        self.requests.put(url, data = bulk_json)
-
-        return total
+    def get_rich_docs(self, item, events=False):
+        """ Generator with the rich reviews of the page """
+
+        # Hack: by default we use events in MediaWiki
+        for enrich_review in self.get_rich_item_reviews(item):
+            yield (enrich_review[self.get_field_unique_id_review()], enrich_review)
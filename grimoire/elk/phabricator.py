@@ -87,6 +87,9 @@ class PhabricatorEnrich(Enrich):
 
         return {"items":mapping}
 
+    def get_fields_identities(self):
+        return ["data.fields.authorData", "data.fields.ownerData"]
+
     def get_identities(self, item):
         """ Return the identities from an item """
         identities = []
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Mapping of repositories to projects
+#
+# Copyright (C) 2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#   Alvaro del Castillo San Felix <acs@bitergia.com>
+#
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+from fnmatch import translate
+
+DEFAULT_PROJECT = 'Main'
+CACHE_VERSION = 3  # change it when the format of the compiled map changes
+
+PREFIX_WILDCARD = '*'  # at the end of a repository, it is a prefix
+GLOB_PREFIX = 'glob:'  # before a repository, it is a glob pattern
+
+
+def convert_json_to_projects_map(json_projects):
+    """ Convert JSON format to the projects map format
+    map[ds][repository] = project
+    If a repository is in several projects assign to leaf
+
+    :param json_projects: data with the projects to repositories mapping
+    :returns: the repositories to projects mapping per data source
+    """
+    ds_repo_to_prj = {}
+
+    for project in json_projects:
+        for ds in json_projects[project]:
+            if ds == "meta": continue  # not a real data source
+            if ds not in ds_repo_to_prj:
+                ds_repo_to_prj[ds] = {}
+            for repo in json_projects[project][ds]:
+                if repo in ds_repo_to_prj[ds]:
+                    if project == ds_repo_to_prj[ds][repo]:
+                        logging.debug("Duplicated repo: %s %s %s", ds, repo, project)
+                    else:
+                        if len(project.split(".")) > len(ds_repo_to_prj[ds][repo].split(".")):
+                            logging.debug("Changed repo project because we found a leaf: %s leaf vs %s (%s, %s)",
+                                          project, ds_repo_to_prj[ds][repo], repo, ds)
+                            ds_repo_to_prj[ds][repo] = project
+                else:
+                    ds_repo_to_prj[ds][repo] = project
+    return ds_repo_to_prj
+
+
+def get_project_fields(project):
+    """ project field and its levels: eclipse.platform.releng gives
+        project_1 eclipse, project_2 eclipse.platform and project_3
+        eclipse.platform.releng
+    """
+    eitem_project = {"project": project}
+    subprojects = project.split('.')
+    for i in range(0, len(subprojects)):
+        eitem_project['project_' + str(i+1)] = '.'.join(subprojects[0:i+1])
+    return eitem_project
+
+
+class ProjectsMap(object):
+    """ Repositories to projects mapping per data source
+
+    Repositories are matched exactly, by prefix or by glob pattern:
+    - "https://github.com/chaoss/*" matches all the repositories whose
+      name starts with "https://github.com/chaoss/". The prefixes are
+      stored in a trie, the longest prefix found is used.
+    - "glob:*/eclipse/*.git" is a pattern checked with fnmatch, in the
+      order of the map.
+    - The rest of repositories are matched exactly, even with ? or [].
+
+    An exact repository has precedence over prefixes, and prefixes over
+    patterns. The project fields for each repository are resolved once.
+    """
+
+    _PROJECT = ''  # key for the project in a trie node, no char is ''
+
+    cache_dir = None  # directory for the compiled JSON maps, None to not cache them
+
+    def __init__(self, ds_repo_to_prj):
+        """
+        :param ds_repo_to_prj: map[ds][repository] = project
+        """
+        self.repos = {}  # map[ds][repository] = project
+        self.prefixes = {}  # map[ds] = trie with the prefixes
+        self.patterns = {}  # map[ds] = [(regex, project)]
+
+        for ds in ds_repo_to_prj:
+            self.repos[ds] = {}
+            self.prefixes[ds] = {}
+            self.patterns[ds] = []
+            for (repo, project) in ds_repo_to_prj[ds].items():
+                if repo.startswith(GLOB_PREFIX):
+                    pattern = translate(repo[len(GLOB_PREFIX):])
+                    self.patterns[ds].append((re.compile(pattern), project))
+                elif repo.endswith(PREFIX_WILDCARD):
+                    self.__add_prefix(self.prefixes[ds], repo[:-1], project)
+                else:
+                    self.repos[ds][repo] = project
+
+        self.fields = {}  # project fields per project
+        self.resolved = {}  # project fields per data source and repository
+
+    def __bool__(self):
+        return any(self.repos.values()) or any(self.prefixes.values()) or \
+            any(self.patterns.values())
+
+    def __add_prefix(self, trie, prefix, project):
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if self._PROJECT in node and node[self._PROJECT] != project:
+            # The same rule than for exact repositories: assign to leaf
+            if len(project.split(".")) <= len(node[self._PROJECT].split(".")):
+                return
+        node[self._PROJECT] = project
+
+    def __find_prefix(self, trie, repository):
+        """ Project for the longest prefix of repository in the trie """
+
+        project = trie.get(self._PROJECT)
+        node = trie
+        for char in repository:
+            node = node.get(char)
+            if node is None:
+                break
+            project = node.get(self._PROJECT, project)
+        return project
+
+    def find_project(self, ds, repository):
+        """ Project for the repository of the data source ds, None if not found """
+
+        if ds not in self.repos:
+            return None
+        project = self.repos[ds].get(repository)
+        if project is None and self.prefixes[ds]:
+            project = self.__find_prefix(self.prefixes[ds], repository)
+        if project is None:
+            for (regex, pattern_project) in self.patterns[ds]:
+                if regex.match(repository):
+                    project = pattern_project
+                    break
+        return project
+
+    def get_project_fields(self, ds, repository, origin=None):
+        """ Project fields for the repository, using origin if it is not found
+
+        :returns: dict with project and project_1..N fields
+        """
+
+        key = (repository, origin)
+        resolved = self.resolved.setdefault(ds, {})
+        if key not in resolved:
+            project = self.find_project(ds, repository)
+            if project is None and origin is not None:
+                # Try to use always the origin in any case
+                project = self.find_project(ds, origin)
+            if project is None:
+                project = DEFAULT_PROJECT
+            if project not in self.fields:
+                self.fields[project] = get_project_fields(project)
+            resolved[key] = self.fields[project]
+        return dict(resolved[key])
+
+    def __get_state(self):
+        """ Compiled map as JSON data """
+
+        patterns = {ds: [(regex.pattern, project) for (regex, project) in self.patterns[ds]]
+                    for ds in self.patterns}
+        return {"repos": self.repos, "prefixes": self.prefixes, "patterns": patterns}
+
+    @classmethod
+    def __from_state(cls, state):
+        """ Projects map from the compiled map JSON data """
+
+        projects_map = cls({})
+        projects_map.repos = state["repos"]
+        projects_map.prefixes = state["prefixes"]
+        projects_map.patterns = {ds: [(re.compile(pattern), project)
+                                      for (pattern, project) in state["patterns"][ds]]
+                                 for ds in state["patterns"]}
+        return projects_map
+
+    @classmethod
+    def from_json_file(cls, json_projects_map):
+        """ Projects map from a JSON file
+
+        With cache_dir, the compiled map is stored there as JSON, and it
+        is used while the sha256 of the JSON file is the same.
+        """
+
+        with open(json_projects_map, 'rb') as data_file:
+            data = data_file.read()
+
+        cache_file = None
+        cache_key = None
+        if cls.cache_dir:
+            path = os.path.abspath(json_projects_map)
+            cache_file = os.path.join(cls.cache_dir, "projects_map_%s.json" %
+                                      hashlib.sha256(path.encode('utf-8')).hexdigest()[:16])
+            cache_key = {"version": CACHE_VERSION, "source": path,
+                         "sha256": hashlib.sha256(data).hexdigest()}
+            try:
+                with open(cache_file) as f_cache:
+                    cache = json.load(f_cache)
+                if cache["key"] == cache_key:
+                    logging.debug("Projects map read from %s", cache_file)
+                    return cls.__from_state(cache["map"])
+            except Exception as ex:
+                # Missing, partial or from other version: build it again
+                logging.debug("Can't read the projects map cache %s: %s", cache_file, ex)
+
+        json_projects = json.loads(data.decode('utf-8'))
+        projects_map = cls(convert_json_to_projects_map(json_projects))
+
+        if cache_file:
+            projects_map.__write_cache(cache_file, cache_key)
+
+        return projects_map
+
+    def __write_cache(self, cache_file, cache_key):
+        """ Write the compiled map in cache_file """
+
+        # Written in a temporary file renamed at the end, so other processes
+        # reading the cache at the same time get the old or the new one
+        tmp_file = None
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=self.cache_dir,
+                                             prefix=os.path.basename(cache_file),
+                                             delete=False) as f_cache:
+                tmp_file = f_cache.name
+                json.dump({"key": cache_key, "map": self.__get_state()}, f_cache)
+            os.replace(tmp_file, cache_file)
+        except OSError as ex:
+            logging.debug("Can't write the projects map cache %s: %s", cache_file, ex)
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
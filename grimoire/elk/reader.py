@@ -0,0 +1,365 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Readers for the items stored in ElasticSearch indexes
+#
+# Copyright (C) 2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#   Alvaro del Castillo San Felix <acs@bitergia.com>
+#
+
+import abc
+import functools
+import json
+import logging
+import queue
+import threading
+
+# 1 minute to process the results of size items
+# In gerrit enrich with 500 items per page we need >1 min
+# In Mozilla ES in Amazon we need 10m
+SCROLL_TIME = "10m"
+SCROLL_SIZE = 100  # items per page
+
+
+class ElasticReader(abc.ABC):
+    """ Base class for the readers of the items stored in an index
+
+    The items are returned in the order of the query sort. The next
+    page can be prefetched in a background thread while the items of
+    the current one are processed.
+    """
+
+    _END = object()  # no more pages to prefetch
+
+    def __init__(self, elastic, query, page_size=SCROLL_SIZE, prefetch=False):
+        """
+        :param elastic: ElasticSearch object with the index to read
+        :param query: dict with the search body (query and sort)
+        :param page_size: items to get in each request
+        :param prefetch: get the next page while processing the current one
+        """
+        self.elastic = elastic
+        self.query = query
+        self.page_size = page_size
+        self.prefetch = prefetch
+        # Function called with the function saving the read state once a page
+        # is processed, so it is saved only when the items are written
+        self.on_checkpoint = None
+
+    def __iter__(self):
+        for page in self.pages():
+            for item in page:
+                yield item
+
+    def pages(self):
+        """ Generator with the pages of items """
+
+        pages = self.fetch_pages()
+        if self.prefetch:
+            pages = self.__prefetch(pages)
+
+        for hits in pages:
+            yield [hit['_source'] for hit in hits]
+            # The consumer has processed all the items in the page
+            self.page_done(hits)
+        self.read_done()
+
+    @abc.abstractmethod
+    def fetch_pages(self):
+        """ Generator with the pages of hits from ElasticSearch """
+
+    def page_done(self, hits):
+        """ Called once the items of a page are processed """
+        pass
+
+    def read_done(self):
+        """ Called once all the items are processed """
+        pass
+
+    def __prefetch(self, pages):
+        """ Get the pages in a background thread, one page ahead """
+
+        prefetched = queue.Queue(maxsize=1)
+        done = threading.Event()  # the consumer does not need more pages
+
+        def put(page):
+            while not done.is_set():
+                try:
+                    prefetched.put(page, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch():
+            try:
+                for page in pages:
+                    if not put(page):
+                        break
+            except Exception as ex:
+                put(ex)
+            finally:
+                pages.close()
+                put(self._END)
+
+        thread = threading.Thread(target=fetch, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                page = prefetched.get()
+                if page is self._END:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            done.set()
+            thread.join()
+
+
+class ScrollReader(ElasticReader):
+    """ Read the items from an index using the scroll API
+
+    The scroll is cleared at the end. With slices, only the items in the
+    slice slice_id of the index are read (sliced scroll, ElasticSearch >= 5.0).
+    """
+
+    def __init__(self, elastic, query, page_size=SCROLL_SIZE, prefetch=False,
+                 slice_id=None, slices=None):
+        """
+        :param slice_id: slice of the index to read, from 0 to slices - 1
+        :param slices: number of slices in which the index is read
+        """
+        super().__init__(elastic, query, page_size, prefetch)
+        if slices and slices > 1:
+            self.query = dict(query)
+            self.query["slice"] = {"id": slice_id, "max": slices}
+
+    def fetch_pages(self):
+        """ Generator with the pages of hits from ElasticSearch """
+
+        url = self.elastic.index_url
+        url += "/_search?scroll=%s&size=%i" % (SCROLL_TIME, self.page_size)
+        query = json.dumps(self.query)
+
+        logging.debug("%s %s", url, query)
+
+        scroll_id = None
+        try:
+            r = self.elastic.requests.post(url, data=query)
+            while True:
+                try:
+                    rjson = r.json()
+                except ValueError:
+                    logging.error("No JSON found in %s", r.text)
+                    rjson = {}
+
+                scroll_id = rjson.get("_scroll_id", scroll_id)
+
+                if "hits" not in rjson:
+                    if "slice" in self.query:
+                        # A missing slice would lose items silently
+                        raise RuntimeError("Can't read slice %s from %s: %s" %
+                                           (self.query["slice"], url, r.text))
+                    logging.error("No results found from %s", url)
+                    break
+                if not rjson["hits"]["hits"]:
+                    break
+
+                yield rjson["hits"]["hits"]
+
+                scroll_data = {
+                    "scroll": SCROLL_TIME,
+                    "scroll_id": scroll_id
+                }
+                r = self.elastic.requests.post(self.elastic.url + "/_search/scroll",
+                                               data=json.dumps(scroll_data))
+        finally:
+            if scroll_id:
+                self.__clear_scroll(scroll_id)
+
+    def __clear_scroll(self, scroll_id):
+        """ Free the scroll context in the server """
+
+        url = self.elastic.url + "/_search/scroll"
+        try:
+            self.elastic.requests.delete(url, data=json.dumps({"scroll_id": [scroll_id]}))
+        except Exception as ex:
+            logging.warning("Can't clear scroll in %s: %s", url, ex)
+
+
+class SearchAfterReader(ElasticReader):
+    """ Read the items from an index using search_after (ElasticSearch >= 5.0)
+
+    No context is kept in the server: each page is a new search starting
+    after the sort values of the last item read. The query sort is
+    completed with the _uid, as the items _id is their unique id, so
+    the order is total.
+
+    With a state_file, the sort values of the last processed page are
+    stored in it, and a new reader with the same index and query filters
+    resumes the read from them. The state is removed once all items are
+    read. The ranges in the query (the from date of incremental reads)
+    are not part of the state key, so the next run finds the state.
+
+    The state is saved through on_checkpoint, which must call the save
+    function once the items of the page are written. Without it only
+    the end of the read is saved: the read can't be resumed.
+    """
+
+    TIEBREAK_FIELD = "_uid"
+
+    def __init__(self, elastic, query, page_size=SCROLL_SIZE, prefetch=False,
+                 state_file=None):
+        """
+        :param state_file: JSON file with the last sort values read per index and query
+        """
+        super().__init__(elastic, query, page_size, prefetch)
+        self.query = dict(query)
+        sort = query.get("sort", [])
+        if isinstance(sort, dict):
+            sort = [{field: order} for field, order in sort.items()]
+        self.query["sort"] = sort + [{self.TIEBREAK_FIELD: "asc"}]
+        self.state_file = state_file
+        self.state_key = self.elastic.index_url + " " + \
+            json.dumps(self.__without_ranges(query.get("query")), sort_keys=True)
+
+    @classmethod
+    def __without_ranges(cls, query):
+        """ Query without its range filters """
+
+        if isinstance(query, dict):
+            return {key: cls.__without_ranges(value)
+                    for key, value in query.items() if key != "range"}
+        if isinstance(query, list):
+            return [cls.__without_ranges(value) for value in query
+                    if not (isinstance(value, dict) and "range" in value)]
+        return query
+
+    def fetch_pages(self):
+        """ Generator with the pages of hits from ElasticSearch """
+
+        url = self.elastic.index_url + "/_search?size=%i" % self.page_size
+
+        search_after = self.__load_state()
+        if search_after:
+            logging.info("Resuming read of %s after %s", url, search_after)
+
+        while True:
+            query = dict(self.query)
+            if search_after:
+                query["search_after"] = search_after
+            query = json.dumps(query)
+
+            logging.debug("%s %s", url, query)
+
+            r = self.elastic.requests.post(url, data=query)
+            try:
+                rjson = r.json()
+            except ValueError:
+                logging.error("No JSON found in %s", r.text)
+                rjson = {}
+
+            if "hits" not in rjson:
+                # Stop with an error so the read can be resumed
+                raise RuntimeError("Can't read items from %s: %s" % (url, r.text))
+            hits = rjson["hits"]["hits"]
+            if not hits:
+                break
+
+            yield hits
+
+            search_after = hits[-1]["sort"]
+
+    def page_done(self, hits):
+        if self.on_checkpoint:
+            self.on_checkpoint(functools.partial(self.__save_state, hits[-1]["sort"]))
+
+    def read_done(self):
+        if self.on_checkpoint:
+            self.on_checkpoint(functools.partial(self.__save_state, None))
+        else:
+            self.__save_state(None)
+
+    def __load_state(self):
+        if not self.state_file:
+            return None
+        try:
+            with open(self.state_file) as f_state:
+                return json.load(f_state).get(self.state_key)
+        except FileNotFoundError:
+            return None
+
+    def __save_state(self, search_after):
+        """ Store the sort values of the last item read, None to remove them """
+
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file) as f_state:
+                state = json.load(f_state)
+        except FileNotFoundError:
+            state = {}
+        if search_after is None:
+            state.pop(self.state_key, None)
+        else:
+            state[self.state_key] = search_after
+        with open(self.state_file, "w") as f_state:
+            json.dump(state, f_state)
+
+
+class SlicedScrollReader(object):
+    """ Read the items from an index in parallel slices
+
+    Each slice is read with its own ScrollReader, so several workers can
+    process the items of the index at the same time. The items are
+    sorted inside each slice, but not between slices.
+    """
+
+    def __init__(self, elastic, query, slices, page_size=SCROLL_SIZE, prefetch=False):
+        """
+        :param elastic: ElasticSearch object with the index to read
+        :param query: dict with the search body (query and sort)
+        :param slices: number of slices in which the index is read
+        :param page_size: items to get in each scroll request
+        :param prefetch: get the next page while processing the current one
+        """
+        self.elastic = elastic
+        self.query = query
+        self.slices = slices
+        self.page_size = page_size
+        self.prefetch = prefetch
+
+    def readers(self):
+        """ List with the reader for each slice """
+
+        return [ScrollReader(self.elastic, self.query, self.page_size,
+                             self.prefetch, slice_id, self.slices)
+                for slice_id in range(0, self.slices)]
+
+
+def get_reader(elastic, query, page_size):
+    """ Reader for the items in elastic using the cursor configured in it """
+
+    page_size = elastic.scroll_size or page_size
+    if elastic.cursor == "search_after":
+        return SearchAfterReader(elastic, query, page_size,
+                                 elastic.scroll_prefetch, elastic.cursor_state)
+    return ScrollReader(elastic, query, page_size, elastic.scroll_prefetch)
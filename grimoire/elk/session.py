@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# HTTP sessions shared by all the ElasticSearch clients
+#
+# Copyright (C) 2015 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#   Alvaro del Castillo San Felix <acs@bitergia.com>
+#
+
+import gzip
+import logging
+import threading
+
+from time import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+from requests.packages.urllib3.util.retry import Retry
+
+COMPRESS_LEVEL = 3  # gzip level for request bodies, fast with good ratio
+POOL_SIZE = 10  # connections kept alive per host
+CONNECT_TIMEOUT = 10  # seconds to connect to the server
+READ_TIMEOUT = 300  # seconds to wait for the server response
+# Refresh and force merge requests: they end when the server completes them
+MAINTENANCE_TIMEOUT = (CONNECT_TIMEOUT, None)
+RETRIES = 3  # retries for failed connections
+DEAD_NODE_SECONDS = 60  # seconds before retrying a dead node
+
+
+class NodePool(object):
+    """ ElasticSearch nodes used in round robin
+
+    Nodes with connection errors are marked as dead and they are not
+    used until DEAD_NODE_SECONDS have passed.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.dead = {}  # dead nodes with the time they were marked
+        self.current = 0
+        self.lock = threading.Lock()
+
+    def get_node(self):
+        """ Next live node. If all are dead, the one dead for longer. """
+
+        with self.lock:
+            now = time()
+            for i in range(0, len(self.nodes)):
+                node = self.nodes[(self.current + i) % len(self.nodes)]
+                if node not in self.dead or \
+                   now - self.dead[node] > DEAD_NODE_SECONDS:
+                    self.current = (self.current + i + 1) % len(self.nodes)
+                    return node
+            return min(self.dead, key=self.dead.get)
+
+    def mark_dead(self, node):
+        with self.lock:
+            if node not in self.dead:
+                logging.warning("ElasticSearch node %s marked as dead", node)
+            self.dead[node] = time()
+
+    def mark_live(self, node):
+        with self.lock:
+            if node in self.dead:
+                logging.info("ElasticSearch node %s is alive again", node)
+                del self.dead[node]
+
+
+def sniff_nodes(url, session):
+    """ Get the HTTP urls for all the nodes in the cluster of url """
+
+    scheme = url.split("://")[0]
+    r = session.get(url + "/_nodes/http")
+    nodes = []
+    for node in r.json()['nodes'].values():
+        if 'http' not in node:
+            continue  # node without HTTP enabled
+        # Formats: "host/ip:port", "ip:port" or "inet[/ip:port]"
+        address = node['http']['publish_address']
+        address = address.split("/")[-1].strip("[]")
+        nodes.append(scheme + "://" + address)
+    return nodes
+
+
+class ElasticSession(requests.Session):
+    """ HTTP session for ElasticSearch requests
+
+    With compress enabled, the bodies of bulk, search, scroll and mget
+    requests are sent compressed with gzip. Compressed responses are
+    always accepted and decompressed by requests.
+
+    With several nodes, the requests to the first node are sent to all
+    of them in round robin. If a node fails the next one is used.
+    """
+
+    COMPRESS_APIS = ['/_bulk', '/_search', '/_mget']
+
+    def __init__(self, compress=False, timeout=None, nodes=None):
+        super().__init__()
+        self.compress = compress
+        self.timeout = timeout
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.base_url = None
+        self.node_pool = None
+        if nodes and len(nodes) > 1:
+            self.base_url = nodes[0]
+            self.node_pool = NodePool(nodes)
+
+    def request(self, method, url, data=None, headers=None, **kwargs):
+        if self.compress and data and \
+           any(api in url for api in self.COMPRESS_APIS):
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            data = gzip.compress(data, COMPRESS_LEVEL)
+            headers = dict(headers) if headers else {}
+            headers['Content-Encoding'] = 'gzip'
+        if self.timeout:
+            kwargs.setdefault('timeout', self.timeout)
+
+        if not self.node_pool or not url.startswith(self.base_url):
+            return super().request(method, url, data=data, headers=headers, **kwargs)
+
+        path = url[len(self.base_url):]
+        for i in range(0, len(self.node_pool.nodes)):
+            node = self.node_pool.get_node()
+            try:
+                r = super().request(method, node + path, data=data,
+                                    headers=headers, **kwargs)
+            except requests.exceptions.ConnectionError as ex:
+                self.node_pool.mark_dead(node)
+                error = ex
+                continue
+            self.node_pool.mark_live(node)
+            return r
+        raise error
+
+
+class SessionFactory(object):
+    """ Pooled HTTP sessions shared in the process (singleton)
+
+    All the clients with the same compress, insecure and nodes config
+    share the same session, so the connections to ElasticSearch are
+    reused. The config must be done before getting the first session.
+    """
+
+    pool_size = POOL_SIZE
+    timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = RETRIES
+    sniff = False
+    sessions = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, pool_size=None, timeout=None, retries=None, sniff=None):
+        """ Config for the sessions. Already created sessions are dropped.
+
+        :param pool_size: connections kept alive per host
+        :param timeout: seconds to wait for the server
+        :param retries: retries for failed connections
+        :param sniff: find all the nodes of the cluster using the first one
+        """
+
+        with cls.lock:
+            if pool_size is not None:
+                cls.pool_size = pool_size
+            if timeout is not None:
+                cls.timeout = timeout
+            if retries is not None:
+                cls.retries = retries
+            if sniff is not None:
+                cls.sniff = sniff
+            cls.sessions = {}
+
+    @classmethod
+    def get_config(cls):
+        """ Config for the sessions, to configure them in other processes """
+
+        with cls.lock:
+            return {"pool_size": cls.pool_size, "timeout": cls.timeout,
+                    "retries": cls.retries, "sniff": cls.sniff}
+
+    @classmethod
+    def get_session(cls, compress=False, insecure=True, nodes=None):
+        """ Get the shared session for the compress, insecure and nodes config
+
+        :param compress: send gzip compressed bulk and search requests
+        :param insecure: support https with invalid certificates
+        :param nodes: urls of the ElasticSearch nodes to use in round robin
+        """
+
+        with cls.lock:
+            key = (compress, insecure, tuple(nodes) if nodes else None)
+            if key not in cls.sessions:
+                cls.sessions[key] = cls.__create_session(compress, insecure, nodes)
+            return cls.sessions[key]
+
+    @classmethod
+    def __create_session(cls, compress, insecure, nodes):
+        if nodes and cls.sniff:
+            sniffer = cls.__create_session(False, insecure, None)
+            try:
+                cluster_nodes = sniff_nodes(nodes[0], sniffer)
+                logging.info("Nodes found in %s: %s", nodes[0], cluster_nodes)
+                # The first node is kept as the base url for the requests
+                nodes = nodes[:1] + [node for node in cluster_nodes if node not in nodes[:1]]
+            except Exception as ex:
+                logging.warning("Can't get the nodes from %s: %s", nodes[0], ex)
+
+        session = ElasticSession(compress, cls.timeout, nodes)
+
+        # Only connection errors are retried: ES requests are not idempotent
+        retries = Retry(total=cls.retries, connect=cls.retries, read=0,
+                        status=0, backoff_factor=0.5)
+        adapter = HTTPAdapter(pool_connections=cls.pool_size,
+                              pool_maxsize=cls.pool_size,
+                              max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        if insecure:
+            requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+            session.verify = False
+
+        logging.debug("HTTP session created (pool %i, compress %s, insecure %s, nodes %s)",
+                      cls.pool_size, compress, insecure, nodes)
+
+        return session
@@ -25,7 +25,7 @@
 import json
 import logging
 
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 
 from grimoire.elk.enrich import Enrich, metadata
 
@@ -101,7 +101,7 @@ class SupybotEnrich(Enrich):
             eitem[map_fields[fn]] = message[fn]
 
         # Enrich dates
-        eitem["update_date"] = parser.parse(item["metadata__updated_on"]).isoformat()
+        eitem["update_date"] = parse_date(item["metadata__updated_on"]).isoformat()
         eitem["channel"] = eitem["origin"]
 
         if self.sortinghat:
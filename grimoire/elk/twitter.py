@@ -22,7 +22,7 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-from dateutil import parser
+from grimoire.elk.dates import parse_date
 
 from grimoire.elk.enrich import Enrich, metadata
 
@@ -94,7 +94,7 @@ class TwitterEnrich(Enrich):
             else:
                 eitem[f] = None
         # Date fields
-        eitem["created_at"]  = parser.parse(tweet["created_at"]).isoformat()
+        eitem["created_at"]  = parse_date(tweet["created_at"]).isoformat()
         # Fields which names are translated
         map_fields = {"@timestamp": "timestamp",
                       "@version": "version"
@@ -27,19 +27,14 @@
 
 import json
 import logging
-import requests
 
 class ConfOcean(object):
 
     conf_index = "conf"
     conf_repos = conf_index+"/repos"
+    conf_checkpoints = conf_index+"/checkpoints"
     elastic = None
-    requests_session = requests.Session()
-
-    # Support working with https insecure
-    requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-    requests_session.verify = False
-
+    requests_session = None  # shared HTTP session from the elastic object
 
     @classmethod
     def get_index(cls):
@@ -48,6 +43,7 @@ class ConfOcean(object):
     @classmethod
     def set_elastic(cls, elastic):
         cls.elastic = elastic
+        cls.requests_session = elastic.requests
 
         # Check conf index
         url = elastic.url + "/" + cls.conf_index
@@ -72,6 +68,40 @@ class ConfOcean(object):
 
         cls.requests_session.post(url, data = json.dumps(repo))
 
+    @classmethod
+    def set_checkpoint(cls, unique_id, checkpoint):
+        ''' Store the feed checkpoint for a repository '''
+
+        if cls.elastic is None:
+            logging.error("Can't store checkpoint. Ocean elastic is not configured")
+            return False
+
+        url = cls.elastic.url + "/" + cls.conf_checkpoints + "/"
+        url += cls.elastic.safe_index(unique_id)
+
+        r = cls.requests_session.put(url, data=json.dumps(checkpoint))
+        if r.status_code not in [200, 201]:
+            logging.error("Can't store checkpoint %s: %s", url, r.text)
+            return False
+        return True
+
+    @classmethod
+    def get_checkpoint(cls, unique_id):
+        ''' Last feed checkpoint stored for a repository, None if there is none '''
+
+        if cls.elastic is None:
+            logging.error("Can't get checkpoint. Ocean elastic is not configured")
+            return None
+
+        url = cls.elastic.url + "/" + cls.conf_checkpoints + "/"
+        url += cls.elastic.safe_index(unique_id)
+
+        r = cls.requests_session.get(url)
+        if r.status_code != 200:
+            return None
+
+        return r.json().get('_source')
+
     @classmethod
     def get_repos(cls):
         ''' List of repos data in Ocean '''
@@ -26,13 +26,26 @@
 """Ocean feeder for Elastic from  Perseval data"""
 
 
+import functools
+import hashlib
 import inspect
 import json
 import logging
-import requests
+import queue
+import threading
 
+from contextlib import ExitStack
 from datetime import datetime
+from dateutil import parser
+from time import time
+from grimoire.elk.reader import SlicedScrollReader, get_reader
+from grimoire.elk.session import SessionFactory
 from grimoire.elk.utils import unixtime_to_datetime
+from grimoire.ocean.conf import ConfOcean
+
+ELASTIC_PAGE = 100  # items read per page from the index
+FEED_PENDING_PACKS = 2  # packs of items fetched waiting to be uploaded
+CONTENT_HASH_FIELD = "ocean-content-hash"  # hash of the data of the items
 
 
 class ElasticOcean(object):
@@ -44,13 +57,16 @@ class ElasticOcean(object):
         parser = cmdline_parser
 
         parser.add_argument("-e", "--elastic_url",  default="http://127.0.0.1:9200",
-                            help="Host with elastic search" +
-                            "(default: http://127.0.0.1:9200)")
+                            help="Host with elastic search, several nodes " +
+                            "separated by commas (default: http://127.0.0.1:9200)")
         parser.add_argument("--elastic_url-enrich",
-                            help="Host with elastic search and enriched indexes")
+                            help="Host with elastic search and enriched indexes, " +
+                            "several nodes separated by commas")
+        parser.add_argument("--elastic-sniff", action='store_true',
+                            help="Find all the nodes of the elastic search cluster")
 
     def __init__(self, perceval_backend, from_date=None, fetch_cache=False,
-                 project=None, insecure=True, offset=None):
+                 project=None, insecure=True, offset=None, session=None):
 
         self.perceval_backend = perceval_backend
         self.last_update = None  # Last update in ocean items index for feed
@@ -58,17 +74,32 @@ class ElasticOcean(object):
         self.offset = offset  # fetch from offset
         self.fetch_cache = fetch_cache  # fetch from cache
         self.project = project  # project to be used for this data source
-
-        self.requests = requests.Session()
-        if insecure:
-            requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-            self.requests.verify = False
+        self.checkpoint_id = None  # id of the feed checkpoint in ConfOcean
+        self.checkpoint_failed = 0  # items not indexed before the checkpoints
+        self.checkpoint_stopped = False  # items not indexed after the checkpoints
+        self.skip_unchanged = False  # don't upload items already in the index
+        self.enrich_backend = None  # enrich the items while feeding
+        self.enrich_events = False
+        self.on_checkpoint = None  # checkpoints of the reader used in __iter__
+
+        if session:
+            self.requests = session
+        else:
+            self.requests = SessionFactory.get_session(insecure=insecure)
 
 
     def set_elastic(self, elastic):
         """ Elastic used to store last data source state """
         self.elastic = elastic
 
+    def set_enrich(self, enrich_backend, events=False):
+        """ Enrich the items with enrich_backend while they are fed
+
+        :param events: enrich the events in the items instead of the items
+        """
+        self.enrich_backend = enrich_backend
+        self.enrich_events = events
+
     def get_field_date(self):
         """ Field with the update in the JSON items. Now the same in all. """
         return "metadata__updated_on"
@@ -110,6 +141,12 @@ class ElasticOcean(object):
         """ Some buggy data sources need fixing (like mbox and message-id) """
         pass
 
+    def get_content_hash(self, item):
+        """ Hash of the data of the item, the same while it does not change """
+
+        data = json.dumps(item['data'], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(data.encode('utf-8', 'backslashreplace')).hexdigest()
+
     def add_update_date(self, item):
         """ All item['updated_on'] from perceval is epoch """
         updated = unixtime_to_datetime(item['updated_on'])
@@ -127,10 +164,15 @@ class ElasticOcean(object):
         # Check if backend supports from_date
         signature = inspect.signature(self.perceval_backend.fetch)
 
+        checkpoint = self.__get_checkpoint()
+
         last_update = None
         if 'from_date' in signature.parameters:
             if from_date:
                 last_update = from_date
+            elif checkpoint and checkpoint['last_date']:
+                self.last_update = parser.parse(checkpoint['last_date'])
+                last_update = self.last_update
             else:
                 # Always filter by origin to support multi origin indexes
                 filter_ = {"name":"origin",
@@ -144,6 +186,8 @@ class ElasticOcean(object):
         if 'offset' in signature.parameters:
             if from_offset:
                 offset = from_offset
+            elif checkpoint and checkpoint['last_offset'] is not None:
+                offset = checkpoint['last_offset']
             else:
                 # Always filter by origin to support multi origin indexes
                 filter_ = {"name":"origin",
@@ -157,9 +201,6 @@ class ElasticOcean(object):
 
         task_init = datetime.now()
 
-        items_pack = []  # to feed item in packs
-        drop = 0
-        added = 0
         if self.fetch_cache:
             items = self.perceval_backend.fetch_from_cache()
         else:
@@ -183,32 +224,243 @@ class ElasticOcean(object):
                 else:
                     items = self.perceval_backend.fetch()
 
-        for item in items:
-            # print("%s %s" % (item['url'], item['lastUpdated_date']))
-            # Add date field for incremental analysis if needed
-            self.add_update_date(item)
-            self._fix_item(item)
-            if self.project:
-                item['project'] = self.project
-            if len(items_pack) >= self.elastic.max_items_bulk:
-                self._items_to_es(items_pack)
-                items_pack = []
-            if not self.drop_item(item):
-                items_pack.append(item)
-                added += 1
-            else:
-                drop +=1
-        self._items_to_es(items_pack)
-
+        # Seconds used in each stage and items dropped or unchanged
+        stats = {"fetch": 0, "queue": 0, "upload": 0, "enrich": 0, "wait": 0,
+                 "drop": 0, "unchanged": 0}
+        added = 0
+        # The bulk load mode ends the new index state, read it before
+        new_index = self.elastic.new_index
+
+        with ExitStack() as bulk_load:
+            bulk_load.enter_context(self.elastic.bulk_load_mode())
+            if self.enrich_backend:
+                bulk_load.enter_context(self.enrich_backend.elastic.bulk_load_mode())
+            for items_pack in self.__fetch_packs(items, stats):
+                upload_start = time()
+                new_items = items_pack
+                if self.skip_unchanged and not new_index:
+                    new_items = self.__get_changed_items(items_pack)
+                    stats["unchanged"] += len(items_pack) - len(new_items)
+                self._items_to_es(new_items)
+                if checkpoint is not None:
+                    checkpoint = self.__set_checkpoint(checkpoint, items_pack)
+                stats["upload"] += time() - upload_start
+                if self.enrich_backend:
+                    enrich_start = time()
+                    self.__enrich_items(new_items)
+                    stats["enrich"] += time() - enrich_start
+                added += len(new_items)
+
+        # Make the new items visible in searches, needed by the enrichment
+        self.elastic.refresh()
+        if self.enrich_backend:
+            self.enrich_backend.elastic.refresh()
+        bulk_stats = self.elastic.flush_bulk()
+        logging.debug("Bulk items: %i ok, %i failed, %i retried",
+                      bulk_stats['ok'], bulk_stats['failed'],
+                      bulk_stats['retried'])
 
         total_time_min = (datetime.now()-task_init).total_seconds()/60
 
         logging.debug("Added %i items to ocean", added)
-        logging.debug("Dropped %i items using drop_item filter" % (drop))
-        logging.info("Finished in %.2f min" % (total_time_min))
+        logging.debug("Dropped %i items using drop_item filter" % (stats["drop"]))
+        if self.skip_unchanged:
+            logging.debug("Skipped %i unchanged items", stats["unchanged"])
+        if self.enrich_backend:
+            logging.debug("Enrich in %.2f s", stats["enrich"])
+        logging.info("Finished in %.2f min (fetch %.2f s, waiting upload %.2f s, "
+                     "upload %.2f s, waiting fetch %.2f s)", total_time_min,
+                     stats["fetch"], stats["queue"], stats["upload"], stats["wait"])
 
         return self
 
+    def __enrich_items(self, items):
+        """ Enrich the items already in memory, adding first their identities """
+
+        if not items:
+            return
+
+        if self.enrich_backend.sortinghat:
+            from grimoire.elk.sortinghat import SortingHat
+
+            identities = []
+            for item in items:
+                for identity in self.enrich_backend.get_identities(item):
+                    if identity not in identities:
+                        identities.append(identity)
+            SortingHat.add_identities(self.enrich_backend.sh_db, identities,
+                                      self.enrich_backend.get_connector_name())
+
+        if self.enrich_events:
+            self.enrich_backend.enrich_events(items)
+        else:
+            self.enrich_backend.enrich_items(items)
+
+    def __get_changed_items(self, items):
+        """ Items which are not in the index with the same content hash """
+
+        field_id = self.get_field_unique_id()
+        ids = [str(item[field_id]) for item in items]
+
+        url = self.elastic.index_url + "/items/_mget"
+        params = {"_source": CONTENT_HASH_FIELD}
+        r = self.elastic.requests.post(url, data=json.dumps({"ids": ids}),
+                                       params=params)
+        if r.status_code != 200:
+            logging.warning("Can't get the items hashes from %s: %s", url, r.text)
+            return items
+
+        hashes = {}
+        for doc in r.json()['docs']:
+            if doc.get('found'):
+                hashes[doc['_id']] = doc['_source'].get(CONTENT_HASH_FIELD)
+
+        return [item for item in items
+                if hashes.get(str(item[field_id])) != item[CONTENT_HASH_FIELD]]
+
+    def __get_checkpoint(self):
+        """ Feed checkpoint to resume from, an empty one to start a new one,
+            or None if checkpoints are not used """
+
+        if not self.checkpoint_id:
+            return None
+
+        # Items not indexed before the checkpoints
+        self.checkpoint_failed = self.elastic.get_bulk_stats()['failed']
+        self.checkpoint_stopped = False
+
+        checkpoint = None
+        if not self.elastic.new_index:
+            checkpoint = ConfOcean.get_checkpoint(self.checkpoint_id)
+        if checkpoint:
+            logging.info("Resuming feed from checkpoint %s (batch %i, %i items)",
+                         self.checkpoint_id, checkpoint['batch'], checkpoint['items'])
+        else:
+            checkpoint = {"last_date": None, "last_offset": None, "items": 0,
+                          "batch": 0}
+        return checkpoint
+
+    def __set_checkpoint(self, checkpoint, items_pack):
+        """ Store the checkpoint once the items_pack is indexed
+
+        The checkpoint is stored when the bulk requests with the items_pack
+        are written, so the feed doesn't wait for them.
+
+        :returns: the new checkpoint
+        """
+
+        checkpoint = dict(checkpoint)
+        dates = [item['metadata__updated_on'] for item in items_pack]
+        if checkpoint['last_date']:
+            dates.append(checkpoint['last_date'])
+        # All the dates are isoformat in UTC so they sort as strings
+        checkpoint['last_date'] = max(dates)
+        offsets = [item['offset'] for item in items_pack if item.get('offset') is not None]
+        if offsets:
+            if checkpoint['last_offset'] is not None:
+                offsets.append(checkpoint['last_offset'])
+            checkpoint['last_offset'] = max(offsets)
+        checkpoint['items'] += len(items_pack)
+        checkpoint['batch'] += 1
+        checkpoint['updated'] = datetime.now().isoformat()
+
+        self.elastic.on_bulk_written(functools.partial(self.__save_checkpoint,
+                                                       checkpoint))
+
+        return checkpoint
+
+    def __save_checkpoint(self, checkpoint):
+        """ Store the checkpoint if all the items before it are indexed
+
+        If some item can not be indexed the checkpoint is not updated
+        anymore in this feed, so the next one starts before the failed item.
+        """
+
+        if self.checkpoint_stopped:
+            return
+
+        if self.elastic.get_bulk_stats()['failed'] > self.checkpoint_failed:
+            logging.warning("Items not indexed. Checkpoint %s not updated.",
+                            self.checkpoint_id)
+            self.checkpoint_stopped = True
+            return
+
+        ConfOcean.set_checkpoint(self.checkpoint_id, checkpoint)
+
+    def __fetch_packs(self, items, stats):
+        """ Generator with the packs of items fetched in a background thread
+
+        The items are fetched from Perceval and prepared in a thread while
+        the packs already fetched are uploaded, so the remote data source
+        and ElasticSearch are used at the same time. The queue of packs is
+        bounded so the fetch waits if the upload is slower.
+
+        :param items: Perceval items generator
+        :param stats: dict where the seconds used in each stage are added
+        """
+
+        end = object()  # no more packs
+        packs = queue.Queue(maxsize=FEED_PENDING_PACKS)
+        done = threading.Event()  # the upload stage has finished
+
+        def put(pack):
+            start = time()
+            while not done.is_set():
+                try:
+                    packs.put(pack, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            stats["queue"] += time() - start
+            return not done.is_set()
+
+        def fetch():
+            items_pack = []  # to feed item in packs
+            try:
+                start = time()
+                for item in items:
+                    # Add date field for incremental analysis if needed
+                    self.add_update_date(item)
+                    self._fix_item(item)
+                    if self.project:
+                        item['project'] = self.project
+                    if not self.drop_item(item):
+                        if self.skip_unchanged:
+                            item[CONTENT_HASH_FIELD] = self.get_content_hash(item)
+                        items_pack.append(item)
+                    else:
+                        stats["drop"] += 1
+                    if len(items_pack) >= self.elastic.max_items_bulk:
+                        stats["fetch"] += time() - start
+                        if not put(items_pack):
+                            return
+                        items_pack = []
+                        start = time()
+                stats["fetch"] += time() - start
+                if items_pack:
+                    put(items_pack)
+            except Exception as ex:
+                put(ex)
+            finally:
+                put(end)
+
+        thread = threading.Thread(target=fetch, daemon=True, name="feed-fetch")
+        thread.start()
+
+        try:
+            while True:
+                start = time()
+                pack = packs.get()
+                stats["wait"] += time() - start
+                if pack is end:
+                    break
+                if isinstance(pack, Exception):
+                    raise pack
+                yield pack
+        finally:
+            done.set()
+            thread.join()
+
 
     def _items_to_es(self, json_items):
         """ Append items JSON to ES (data source state) """
@@ -221,114 +473,57 @@ class ElasticOcean(object):
 
         field_id = self.get_field_unique_id()
 
-        self.elastic.bulk_upload_sync(json_items, field_id)
+        # Don't wait for the bulk requests, feed refreshes the index at the end
+        self.elastic.bulk_upload(json_items, field_id, wait=False)
 
     # Iterator
-    def _get_elastic_items(self):
-        """ Get the items from the index related to the backend """
-
-        url = self.elastic.index_url
-        # 1 minute to process the results of size items
-        # In gerrit enrich with 500 items per page we need >1 min
-        # In Mozilla ES in Amazon we need 10m
-        max_process_items_pack_time = "10m"  # 10 minutes
-        url += "/_search?scroll=%s&size=%i" % (max_process_items_pack_time,
-                                               self.elastic_page)
-
-        if self.elastic_scroll_id:
-            """ Just continue with the scrolling """
-            url = self.elastic.url
-            url += "/_search/scroll"
-            scroll_data = {
-                "scroll" : max_process_items_pack_time,
-                "scroll_id" : self.elastic_scroll_id
-                }
-            r = self.requests.post(url, data=json.dumps(scroll_data))
-        else:
-            filters = "{}"
-            # If origin Always filter by origin to support multi origin indexes
-            if self.perceval_backend and self.perceval_backend.origin:
-                filters = '''
-                    {"term":
-                        { "origin" : "%s"  }
-                    }
-                ''' % (self.perceval_backend.origin)
-
-            if self.from_date:
-                date_field = self.get_field_date()
-                from_date = self.from_date.isoformat()
-
-                filters += '''
-                    , {"range":
-                        {"%s": {"gte": "%s"}}
-                    }
-                ''' % (date_field, from_date)
-            elif self.offset:
-                filters += '''
-                    , {"range":
-                        {"offset": {"gte": %i}}
-                    }
-                ''' % (self.offset)
+    def _get_elastic_query(self):
+        """ Query for the items in the index related to the backend """
 
+        filters = []
+        # If origin Always filter by origin to support multi origin indexes
+        if self.perceval_backend and self.perceval_backend.origin:
+            filters.append({"term": {"origin": self.perceval_backend.origin}})
 
+        if self.from_date:
+            date_field = self.get_field_date()
+            from_date = self.from_date.isoformat()
+            filters.append({"range": {date_field: {"gte": from_date}}})
+        elif self.offset:
+            filters.append({"range": {"offset": {"gte": self.offset}}})
+
+        query = {"query": {"bool": {"must": filters}}}
+
+        if self.perceval_backend:
+            # logstash backends does not have the order_field
             order_field = 'metadata__updated_on'
-            order_query = ''
-            if self.perceval_backend:
-                # logstash backends does not have the order_field
-                order_query = ', "sort": { "%s": { "order": "asc" }} ' % order_field
-
-            query = """
-            {
-                "query": {
-                    "bool": {
-                        "must": [%s]
-                    }
-                } %s
-            }
-            """ % (filters, order_query)
-
-            logging.debug("%s %s", url, query)
-
-            r = self.requests.post(url, data=query)
-
-        items = []
-        try:
-            rjson = r.json()
-        except:
-            logging.error("No JSON found in %s" % (r.text))
-            logging.error("No results found from %s" % (url))
+            query["sort"] = {order_field: {"order": "asc"}}
 
-        if rjson and "_scroll_id" in rjson:
-            self.elastic_scroll_id = rjson["_scroll_id"]
-        else:
-            self.elastic_scroll_id = None
+        return query
 
-        if rjson and "hits" in rjson:
-            for hit in rjson["hits"]["hits"]:
-                items.append(hit['_source'])
-        else:
-            logging.error("No results found from %s" % (url))
+    def fetch(self, fields=None):
+        """ Reader with the items in the index related to the backend
 
-        return items
+        :param fields: fields to get from the items (_source includes), None for all
+        """
+
+        query = self._get_elastic_query()
+        if fields:
+            query["_source"] = fields
+
+        return get_reader(self.elastic, query, ELASTIC_PAGE)
 
     def __iter__(self):
 
-        self.elastic_scroll_id = None
-        # In large projects like Eclipse commits, 100 is too much
-        # self.elastic_page = 100
-        self.elastic_page = 10
-        self.iter_items = self._get_elastic_items()
+        reader = self.fetch()
+        reader.on_checkpoint = self.on_checkpoint
+        return iter(reader)
 
-        return self
+    def slices(self, slices):
+        """ Readers with the items in each of the slices of the index """
 
-    def __next__(self):
+        page_size = self.elastic.scroll_size or ELASTIC_PAGE
+        reader = SlicedScrollReader(self.elastic, self._get_elastic_query(),
+                                    slices, page_size, self.elastic.scroll_prefetch)
 
-        if len(self.iter_items) > 0:
-            return self.iter_items.pop()
-        else:
-            if self.elastic_scroll_id:
-                self.iter_items = self._get_elastic_items()
-            if len(self.iter_items) > 0:
-                return self.__next__()
-            else:
-                raise StopIteration
+        return reader.readers()
@@ -28,15 +28,13 @@ import logging
 
 from os import sys
 
-import requests
-
 from grimoire.elk.elastic import ElasticSearch
 
 
 def get_dashboard_json(elastic, dashboard):
     dash_json_url = elastic.index_url+"/dashboard/"+dashboard
 
-    r = requests.get(dash_json_url, verify=False)
+    r = elastic.requests.get(dash_json_url)
 
     dash_json = r.json()
     if "_source" not in dash_json:
@@ -49,7 +47,7 @@ def get_dashboard_json(elastic, dashboard):
 def get_vis_json(elastic, vis):
     vis_json_url = elastic.index_url+"/visualization/"+vis
 
-    r = requests.get(vis_json_url, verify=False)
+    r = elastic.requests.get(vis_json_url)
 
     vis_json = r.json()
     if "_source" not in vis_json:
@@ -61,7 +59,7 @@ def get_vis_json(elastic, vis):
 def get_search_json(elastic, search_id):
     search_json_url = elastic.index_url+"/search/"+search_id
 
-    r = requests.get(search_json_url, verify=False)
+    r = elastic.requests.get(search_json_url)
 
     search_json = r.json()
     if "_source" not in search_json:
@@ -72,7 +70,7 @@ def get_search_json(elastic, search_id):
 def get_index_pattern_json(elastic, index_pattern):
     index_pattern_json_url = elastic.index_url+"/index-pattern/"+index_pattern
 
-    r = requests.get(index_pattern_json_url, verify=False)
+    r = elastic.requests.get(index_pattern_json_url)
 
     index_pattern_json = r.json()
     if "_source" not in index_pattern_json:
@@ -140,7 +138,7 @@ def create_search(elastic_url, dashboard, index_pattern, es_index=None):
     new_search_id = search_id+"__"+index_pattern
 
     url = elastic.index_url+"/search/"+new_search_id
-    requests.post(url, data = json.dumps(search_json), verify=False)
+    elastic.requests.post(url, data = json.dumps(search_json))
 
     logging.debug("New search created: %s", url)
 
@@ -166,7 +164,7 @@ def get_index_pattern_from_vis(elastic, vis):
     # First search for it in saved search
     if "savedSearchId" in vis_json:
         search_json_url = elastic.index_url+"/search/"+vis_json["savedSearchId"]
-        search_json = requests.get(search_json_url, verify=False).json()["_source"]
+        search_json = elastic.requests.get(search_json_url).json()["_source"]
         index_pattern = get_index_pattern_from_meta(search_json["kibanaSavedObjectMeta"])
     elif "kibanaSavedObjectMeta" in vis_json:
         index_pattern = get_index_pattern_from_meta(vis_json["kibanaSavedObjectMeta"])
@@ -217,7 +215,7 @@ def create_index_pattern(elastic_url, dashboard, enrich_index, es_index=None):
 
     new_index_pattern_json['title'] = enrich_index
     url = elastic.index_url+"/index-pattern/"+enrich_index
-    requests.post(url, data = json.dumps(new_index_pattern_json), verify=False)
+    elastic.requests.post(url, data = json.dumps(new_index_pattern_json))
 
     logging.debug("New index pattern created: %s", url)
 
@@ -255,7 +253,7 @@ def create_dashboard(elastic_url, dashboard, enrich_index, kibana_host, es_index
         # Hack: Get all vis if they are <10000. Use scroll API to get all.
         # Better: use mget to get all vis in dash_vis_ids
         item_template_url_search = item_template_url+"/_search?size=10000"
-        r = requests.get(item_template_url_search, verify=False)
+        r = elastic.requests.get(item_template_url_search)
         all_visualizations =r.json()['hits']['hits']
 
         visualizations = []
@@ -278,7 +276,7 @@ def create_dashboard(elastic_url, dashboard, enrich_index, kibana_host, es_index
 
             url = item_template_url+"/"+vis_id
 
-            r = requests.post(url, data = json.dumps(vis_data), verify=False)
+            r = elastic.requests.post(url, data = json.dumps(vis_data))
             logging.debug("Created new vis %s", url)
 
     if not es_index:
@@ -299,7 +297,7 @@ def create_dashboard(elastic_url, dashboard, enrich_index, kibana_host, es_index
     dash_data['panelsJSON'] = json.dumps(new_panels(elastic, panels, search_id))
     dash_path = "/dashboard/"+dashboard+"__"+enrich_index
     url = elastic.index_url + dash_path
-    requests.post(url, data = json.dumps(dash_data), verify=False)
+    elastic.requests.post(url, data = json.dumps(dash_data))
 
     dash_url = kibana_host+"/app/kibana#"+dash_path
     return dash_url
@@ -314,7 +312,7 @@ def list_dashboards(elastic_url, es_index=None):
 
     print (dash_json_url)
 
-    r = requests.get(dash_json_url, verify=False)
+    r = elastic.requests.get(dash_json_url)
 
     res_json = r.json()
 
@@ -346,22 +344,22 @@ def import_dashboard(elastic_url, import_file, es_index=None):
         elastic = ElasticSearch(elastic_url, es_index)
 
         url = elastic.index_url+"/dashboard/"+kibana['dashboard']['id']
-        requests.post(url, data = json.dumps(kibana['dashboard']['value']), verify=False)
+        elastic.requests.post(url, data = json.dumps(kibana['dashboard']['value']))
 
         if 'searches' in kibana:
             for search in kibana['searches']:
                 url = elastic.index_url+"/search/"+search['id']
-                requests.post(url, data = json.dumps(search['value']), verify=False)
+                elastic.requests.post(url, data = json.dumps(search['value']))
 
         if 'index_patterns' in kibana:
             for index in kibana['index_patterns']:
                 url = elastic.index_url+"/index-pattern/"+index['id']
-                requests.post(url, data = json.dumps(index['value']), verify=False)
+                elastic.requests.post(url, data = json.dumps(index['value']))
 
         if 'visualizations' in kibana:
             for vis in kibana['visualizations']:
                 url = elastic.index_url+"/visualization"+"/"+vis['id']
-                requests.post(url, data = json.dumps(vis['value']), verify=False)
+                elastic.requests.post(url, data = json.dumps(vis['value']))
 
         logging.debug("Done")
 
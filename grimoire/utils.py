@@ -149,7 +149,9 @@ def get_connectors():
              "twitter":[None, TwitterOcean, TwitterEnrich, None]
             }  # Will come from Registry
 
-def get_elastic(url, es_index, clean = None, backend = None):
+def get_elastic(url, es_index, clean = None, backend = None, bulk_workers=0,
+                dead_letter_file=None, compress=False, bulk_load=False,
+                force_merge=False):
 
     mapping = None
 
@@ -158,7 +160,9 @@ def get_elastic(url, es_index, clean = None, backend = None):
         analyzers = backend.get_elastic_analyzers()
     try:
         insecure = True
-        elastic = ElasticSearch(url, es_index, mapping, clean, insecure, analyzers)
+        elastic = ElasticSearch(url, es_index, mapping, clean, insecure, analyzers,
+                                bulk_workers, dead_letter_file, compress,
+                                bulk_load, force_merge)
 
     except ElasticConnectException:
         logging.error("Can't connect to Elastic Search. Is it running?")
@@ -220,7 +224,10 @@ def get_params_parser():
     parser.add_argument('--db-host', help="Host for db connection (default to mariadb)",
                         default="mariadb")
     parser.add_argument('--db-projects-map', help="Projects Mapping DB")
-    parser.add_argument('--json-projects-map', help="Projects Mapping JSON file")
+    parser.add_argument('--json-projects-map',
+                        help="Projects Mapping JSON file. Repositories can be prefixes (https://github.com/org/*) or glob patterns (glob:*/org/*.git)")
+    parser.add_argument('--projects-map-cache',
+                        help="Directory to cache the compiled JSON projects maps")
     parser.add_argument('--project', help="Project for the repository (origin)")
     parser.add_argument('--refresh-projects', action='store_true', help="Refresh projects in enriched items")
     parser.add_argument('--db-sortinghat', help="SortingHat DB")
@@ -229,7 +236,51 @@ def get_params_parser():
     parser.add_argument('--github-token', help="If provided, github usernames will be retrieved in git enrich.")
     parser.add_argument('--studies', action='store_true', help="Execute studies after enrichment.")
     parser.add_argument('--only-studies', action='store_true', help="Execute only studies.")
-    parser.add_argument('backend', help=argparse.SUPPRESS)
+    parser.add_argument('--bulk-workers', type=int, default=0,
+                        help="Threads sending bulk requests to ES (default 0, no threads)")
+    parser.add_argument('--bulk-dead-letter',
+                        help="File to store the items that ES can not index")
+    parser.add_argument('--compress', action='store_true',
+                        help="Send gzip compressed bulk and search requests to ES")
+    parser.add_argument('--bulk-load', action='store_true',
+                        help="Disable refresh and replicas while loading new indexes")
+    parser.add_argument('--force-merge', action='store_true',
+                        help="Force merge new indexes after a bulk load")
+    parser.add_argument('--checkpoints', action='store_true',
+                        help="Store feed checkpoints in the conf index to resume failed feeds")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="Don't upload items with the same content already in ES")
+    parser.add_argument('--fused-enrich', action='store_true',
+                        help="With --enrich, enrich the items while feeding them")
+    parser.add_argument('--repos-file',
+                        help="JSON file with the repositories to feed at the same time")
+    parser.add_argument('--all-repos', action='store_true',
+                        help="Feed at the same time all the repositories in the conf index")
+    parser.add_argument('--repo-workers', type=int, default=4,
+                        help="Repositories fed at the same time (default 4)")
+    parser.add_argument('--backend-workers',
+                        help="Max repositories fed at the same time per backend " +
+                        "(default gerrit:2)")
+    parser.add_argument('--http-pool-size', type=int,
+                        help="HTTP connections kept alive per ES host")
+    parser.add_argument('--http-timeout', type=float,
+                        help="Seconds to wait for ES responses")
+    parser.add_argument('--http-retries', type=int,
+                        help="Retries for failed connections to ES")
+    parser.add_argument('--scroll-size', type=int,
+                        help="Items per page when reading items from ES")
+    parser.add_argument('--scroll-prefetch', action='store_true',
+                        help="Read the next page of items from ES in background")
+    parser.add_argument('--enrich-processes', type=int, default=0,
+                        help="Processes enriching the items (default 0, no processes)")
+    parser.add_argument('--cursor', choices=['scroll', 'search_after'], default='scroll',
+                        help="How to read items from ES (search_after needs ES >= 5)")
+    parser.add_argument('--cursor-state',
+                        help="File to resume interrupted search_after reads")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Threads enriching slices of the raw index in parallel (ES >= 5)")
+    # Not needed when feeding a list of repositories (--repos-file, --all-repos)
+    parser.add_argument('backend', nargs='?', help=argparse.SUPPRESS)
     parser.add_argument('backend_args', nargs=argparse.REMAINDER,
                         help=argparse.SUPPRESS)
 
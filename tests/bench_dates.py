@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Microbenchmark of the parsing of the dates in the test data items
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import sys
+
+from timeit import timeit
+
+from dateutil import parser
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.elk.dates import parse_date, _parse_str
+from test_dates import get_data_dates
+
+ROUNDS = 5
+
+
+def parse_all(parse, dates):
+    for date in dates:
+        parse(date)
+
+
+def parse_all_uncached(dates):
+    for date in dates:
+        _parse_str.__wrapped__(date)
+
+
+if __name__ == '__main__':
+    dates = get_data_dates()
+    print("%i dates from the test data, %i different" % (len(dates), len(set(dates))))
+
+    dateutil_time = timeit(lambda: parse_all(parser.parse, dates), number=ROUNDS)
+    uncached_time = timeit(lambda: parse_all_uncached(dates), number=ROUNDS)
+    cached_time = timeit(lambda: parse_all(parse_date, dates), number=ROUNDS)
+
+    print("dateutil.parser.parse: %.3fs" % dateutil_time)
+    print("parse_date (no cache): %.3fs (%.1fx)" % (uncached_time, dateutil_time / uncached_time))
+    print("parse_date:            %.3fs (%.1fx)" % (cached_time, dateutil_time / cached_time))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+
+class ElasticStubHandler(BaseHTTPRequestHandler):
+    """ Minimal ElasticSearch answering all the requests without data
+
+    The tests extend it with the requests they check. The data shared
+    with the tests is stored in the server attributes.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def _answer(self, answer, status=200):
+        data = json.dumps(answer).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._answer({})
+
+    def do_POST(self):
+        self._read_body()
+        self._answer({})
+
+    def do_PUT(self):
+        self._read_body()
+        self._answer({"acknowledged": True})
+
+
+def start_server(handler, threaded=False):
+    """ Start a stub server in a thread and return it with its url """
+
+    server_class = ThreadingHTTPServer if threaded else HTTPServer
+    server = server_class(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return (server, "http://127.0.0.1:%i" % server.server_port)
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+class ElasticStubTestCase(unittest.TestCase):
+    """ Tests using a stub ElasticSearch in self.server and self.url """
+
+    handler = ElasticStubHandler
+    threaded = False  # answer the requests in threads
+
+    @classmethod
+    def setUpClass(cls):
+        (cls.server, cls.url) = start_server(cls.handler, cls.threaded)
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_server(cls.server)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+import grimoire.elk.elastic
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch, encode_bulk_item, \
+    MAX_ITEMS_BULK, MIN_ITEMS_BULK, TARGET_SECONDS_BULK
+
+
+class BulkStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch answering bulk requests with the given status
+
+    server.bulk_status has, for each bulk request, the status of the
+    whole request or a list with the status of each item.
+    """
+
+    def do_PUT(self):
+        body = self._read_body().decode('utf-8')
+        if '/_bulk' not in self.path:
+            self._answer({"acknowledged": True})
+            return
+
+        ids = [json.loads(line)["index"]["_id"]
+               for line in body.splitlines()[0::2]]
+        self.server.bulk_ids.append(ids)
+        status = self.server.bulk_status.pop(0) if self.server.bulk_status else 200
+
+        if not isinstance(status, list):
+            if status == 200:
+                self._answer({"errors": False})
+            else:
+                self._answer({"error": "bulk failed"}, status)
+            return
+
+        items = []
+        for item_status in status:
+            item = {"status": item_status}
+            if item_status >= 300:
+                item["error"] = {"type": "error_%i" % item_status}
+            items.append({"index": item})
+        self._answer({"errors": any(s >= 300 for s in status), "items": items})
+
+
+class TestBulk(ElasticStubTestCase):
+    """Bulk requests retrying the rejected items"""
+
+    handler = BulkStubHandler
+
+    def setUp(self):
+        self.server.bulk_ids = []
+        self.server.bulk_status = []
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dead_letter_file = os.path.join(self.tmp_dir.name, "dead.json")
+        # Don't wait between retries
+        self.retry_wait = grimoire.elk.elastic.RETRY_WAIT_BULK
+        grimoire.elk.elastic.RETRY_WAIT_BULK = 0.001
+
+    def tearDown(self):
+        grimoire.elk.elastic.RETRY_WAIT_BULK = self.retry_wait
+        self.tmp_dir.cleanup()
+
+    def __upload(self, items=5, bulk_workers=0):
+        elastic = ElasticSearch(self.url, "test_bulk", bulk_workers=bulk_workers,
+                                dead_letter_file=self.dead_letter_file)
+        elastic.bulk_upload([{"id": str(i)} for i in range(0, items)], "id")
+        return elastic
+
+    def __dead_letters(self):
+        if not os.path.exists(self.dead_letter_file):
+            return []
+        with open(self.dead_letter_file) as f_dead:
+            return [json.loads(line) for line in f_dead]
+
+    def test_retry_rejected_items(self):
+        """Test that only the items rejected with 429 or 503 are retried"""
+
+        self.server.bulk_status = [[200, 429, 200, 503, 200], [429, 200], [200]]
+        elastic = self.__upload()
+
+        self.assertEqual(self.server.bulk_ids, [["0", "1", "2", "3", "4"],
+                                                ["1", "3"], ["1"]])
+        self.assertEqual(elastic.get_bulk_stats(),
+                         {"bulks": 3, "ok": 5, "failed": 0, "retried": 3})
+        self.assertEqual(self.__dead_letters(), [])
+
+    def test_retry_request(self):
+        """Test that a rejected bulk request is retried as a whole"""
+
+        self.server.bulk_status = [503, 429, 200]
+        elastic = self.__upload()
+
+        self.assertEqual(len(self.server.bulk_ids), 3)
+        self.assertEqual(elastic.get_bulk_stats()["ok"], 5)
+
+    def test_dead_letter(self):
+        """Test that the failed items are stored in the dead letter file"""
+
+        self.server.bulk_status = [[200, 400, 200, 200, 409]]
+        elastic = self.__upload()
+
+        # Errors not caused by an overloaded server are not retried
+        self.assertEqual(len(self.server.bulk_ids), 1)
+        self.assertEqual(elastic.get_bulk_stats(),
+                         {"bulks": 1, "ok": 3, "failed": 2, "retried": 0})
+
+        dead = self.__dead_letters()
+        self.assertEqual([item["status"] for item in dead], [400, 409])
+        self.assertEqual([json.loads(item["bulk"].splitlines()[1]) for item in dead],
+                         [{"id": "1"}, {"id": "4"}])
+        self.assertEqual(dead[0]["index"], "test_bulk")
+        self.assertEqual(dead[0]["error"], {"type": "error_400"})
+
+    def test_max_retries(self):
+        """Test that the items still rejected after the retries are dead lettered"""
+
+        retries = grimoire.elk.elastic.MAX_RETRIES_BULK
+        self.server.bulk_status = [[200, 429]] + [[429]] * retries
+        elastic = self.__upload(items=2)
+
+        self.assertEqual(len(self.server.bulk_ids), retries + 1)
+        self.assertEqual(elastic.get_bulk_stats(),
+                         {"bulks": retries + 1, "ok": 1, "failed": 1, "retried": retries})
+        self.assertEqual([item["status"] for item in self.__dead_letters()], [429])
+
+    def test_retry_with_writers(self):
+        """Test the retries in the bulk writer threads"""
+
+        self.server.bulk_status = [[429] * 5, 503, 200]
+        elastic = self.__upload(bulk_workers=2)
+        stats = elastic.close_bulk()
+
+        self.assertEqual(len(self.server.bulk_ids), 3)
+        self.assertEqual(stats, {"bulks": 3, "ok": 5, "failed": 0, "retried": 10})
+
+    def test_bulk_bytes(self):
+        """Test that a pack is sent when it reaches the max bytes"""
+
+        items = [{"id": str(i), "body": "x" * 100} for i in range(0, 10)]
+        elastic = ElasticSearch(self.url, "test_bulk")
+        elastic.max_bytes_bulk = 3 * len(encode_bulk_item("0", items[0]))
+        elastic.bulk_upload(items, "id")
+
+        self.assertEqual([len(ids) for ids in self.server.bulk_ids], [3, 3, 3, 1])
+        self.assertEqual(elastic.max_items_bulk, 100)
+
+    def test_encode_surrogates(self):
+        """Test that lone surrogates are encoded as JSON unicode escapes"""
+
+        bulk_item = encode_bulk_item("caf\udce9", {"title": "caf\udce9 ñ"})
+        (action, doc) = bulk_item.decode('utf-8').splitlines()
+
+        self.assertIn("\\udce9", doc)
+        self.assertIn("ñ".encode('utf-8'), bulk_item)
+        self.assertEqual(json.loads(action)["index"]["_id"], "caf\udce9")
+        self.assertEqual(json.loads(doc), {"title": "caf\udce9 ñ"})
+
+    def test_adapt_bulk_size(self):
+        """Test the items per pack adapted to the bulk requests time"""
+
+        elastic = ElasticSearch(self.url, "test_bulk")
+        fast = TARGET_SECONDS_BULK / 4
+        slow = TARGET_SECONDS_BULK * 2
+
+        # Full packs written fast grow
+        elastic.adapt_bulk_size(fast, 100)
+        self.assertEqual(elastic.max_items_bulk, 200)
+        # Packs full in bytes don't grow
+        elastic.adapt_bulk_size(fast, 50)
+        self.assertEqual(elastic.max_items_bulk, 200)
+        # Slow packs shrink to the target time
+        elastic.adapt_bulk_size(slow, 200)
+        self.assertEqual(elastic.max_items_bulk, 100)
+        # Rejected items halve the pack
+        elastic.adapt_bulk_size(fast, 100, rejected=True)
+        self.assertEqual(elastic.max_items_bulk, 50)
+
+        # Always between the min and max items
+        elastic.max_items_bulk = MIN_ITEMS_BULK + 1
+        elastic.adapt_bulk_size(fast, 100, rejected=True)
+        self.assertEqual(elastic.max_items_bulk, MIN_ITEMS_BULK)
+        elastic.max_items_bulk = MAX_ITEMS_BULK
+        elastic.adapt_bulk_size(fast, MAX_ITEMS_BULK)
+        self.assertEqual(elastic.max_items_bulk, MAX_ITEMS_BULK)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import sys
+import unittest
+
+from urllib.parse import urlparse
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+
+INDEX = "test_bulk_load"
+SETTINGS = {"refresh_interval": "5s", "number_of_replicas": "2"}
+
+
+class SettingsStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch recording the index settings changes """
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/' + INDEX + '/_settings':
+            self._answer({INDEX: {"settings": {"index": SETTINGS}}})
+        elif path == '/' + INDEX and not self.server.created:
+            self._answer({"error": "index_not_found_exception"}, 404)
+        else:
+            self._answer({})
+
+    def do_POST(self):
+        self._read_body()
+        self.server.requests.append(urlparse(self.path).path)
+        self._answer({})
+
+    def do_PUT(self):
+        body = self._read_body().decode('utf-8')
+        path = urlparse(self.path).path
+        if path.endswith('/_settings'):
+            self.server.settings.append(json.loads(body)["index"])
+        elif path == '/' + INDEX:
+            self.server.created = True
+        self._answer({"acknowledged": True})
+
+
+class TestBulkLoad(ElasticStubTestCase):
+    """New indexes loaded without refreshes and replicas"""
+
+    handler = SettingsStubHandler
+
+    def setUp(self):
+        self.server.created = False
+        self.server.settings = []
+        self.server.requests = []
+
+    def test_restore_on_error(self):
+        """Test that the index settings are restored after an error"""
+
+        elastic = ElasticSearch(self.url, INDEX, bulk_load=True, force_merge=True)
+        self.assertTrue(elastic.new_index)
+
+        with self.assertRaisesRegex(RuntimeError, "Load failed"):
+            with elastic.bulk_load_mode():
+                self.assertEqual(self.server.settings,
+                                 [{"refresh_interval": "-1", "number_of_replicas": 0}])
+                raise RuntimeError("Load failed")
+
+        self.assertEqual(self.server.settings[1], SETTINGS)
+        self.assertEqual(self.server.requests,
+                         ["/" + INDEX + "/_refresh", "/" + INDEX + "/_forcemerge"])
+
+    def test_existing_index(self):
+        """Test that the settings of existing indexes are not changed"""
+
+        self.server.created = True
+        elastic = ElasticSearch(self.url, INDEX, bulk_load=True)
+
+        with elastic.bulk_load_mode():
+            pass
+
+        self.assertEqual(self.server.settings, [])
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import gzip
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+
+
+class CompressionStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch counting the bytes received """
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        path = self.path.split('?')[0]
+        self.server.wire_bytes[path] = self.server.wire_bytes.get(path, 0) + length
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def do_PUT(self):
+        body = self._read_body()
+        if '/_bulk' in self.path:
+            self.server.bulk_bodies.append(body)
+            self._answer({"errors": False})
+        else:
+            self._answer({"acknowledged": True})
+
+
+class TestCompression(ElasticStubTestCase):
+    """Bytes sent to ElasticSearch with and without gzip compression"""
+
+    handler = CompressionStubHandler
+
+    def setUp(self):
+        self.server.wire_bytes = {}
+        self.server.bulk_bodies = []
+
+    def __items(self):
+        body = "From the mailing list archives. " * 50
+        return [{"id": str(i), "body": body, "subject": "Message ñ %i" % i}
+                for i in range(0, 200)]
+
+    def __upload(self, compress):
+        elastic = ElasticSearch(self.url, "test_compression", compress=compress)
+        elastic.bulk_upload(self.__items(), "id")
+        bulk_url = "/" + elastic.index + "/items/_bulk"
+        return self.server.wire_bytes[bulk_url], b"".join(self.server.bulk_bodies)
+
+    def test_bulk_compressed(self):
+        """Test that compressed bulk requests send less bytes"""
+
+        plain_bytes, plain_body = self.__upload(False)
+        self.setUp()
+        gzip_bytes, gzip_body = self.__upload(True)
+
+        # The stub receives the same documents
+        self.assertEqual(plain_body, gzip_body)
+        self.assertEqual(plain_bytes, len(plain_body))
+        self.assertLess(gzip_bytes * 10, plain_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
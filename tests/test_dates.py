@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import datetime
+import json
+import os
+import re
+import sys
+import unittest
+import warnings
+
+from dateutil import parser, tz
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.elk.dates import parse_date
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Strings in the items that look like dates
+DATE_LIKE = re.compile(r'^(\d{4}-\d{2}-\d{2}|[A-Z][a-z]{2},? |\d{1,2} [A-Z][a-z]{2} \d{4})')
+
+
+def get_data_dates():
+    """ Date strings found in the items of the test data files """
+
+    def strings(value):
+        if isinstance(value, dict):
+            value = list(value.values())
+        if isinstance(value, list):
+            for v in value:
+                yield from strings(v)
+        elif isinstance(value, str):
+            yield value
+
+    dates = []
+    for data_file in sorted(os.listdir(DATA_DIR)):
+        if not data_file.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(DATA_DIR, data_file)) as f:
+                items = json.load(f)
+        except ValueError:
+            continue
+        for value in strings(items):
+            if not DATE_LIKE.match(value) or len(value) > 40:
+                continue
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")  # unknown time zone names
+                    parser.parse(value)
+            except ValueError:
+                continue  # not a date
+            dates.append(value)
+    return dates
+
+
+class TestDates(unittest.TestCase):
+    """Dates parsed with the fast paths and with dateutil"""
+
+    def __check_date(self, date):
+        expected = parser.parse(date)
+        parsed = parse_date(date)
+        self.assertEqual(parsed, expected, date)
+        self.assertEqual(parsed.isoformat(), expected.isoformat(), date)
+        self.assertEqual(parsed.utcoffset(), expected.utcoffset(), date)
+
+    def test_formats(self):
+        """Test the formats with fast path"""
+
+        dates = ["2016-04-27T07:36:19Z",                # bugzillarest, kitsune
+                 "2016-05-16 07:44:00 -0400",           # bugzilla
+                 "2016-07-26T14:25:28.000-0700",        # jira
+                 "2016-07-18T22:09:52",                 # gerrit
+                 "2016-05-16",
+                 "2016-05-16T10:00",
+                 "2016-05-16T10:00:00+02",
+                 "2016-05-16T10:00:00.1234567+05:30",
+                 "Mon, 1 Dec 2014 21:52:45 +0100",      # mbox
+                 "1 Dec 2014 21:52:45 -0000",
+                 "Fri Jul 1 17:48:15 2016 +0200",       # git
+                 "Thu Jul 21 06:47:23 +0000 2016"]      # twitter
+        for date in dates:
+            self.__check_date(date)
+
+    def test_data_dates(self):
+        """Test the dates in the items of the test data"""
+
+        dates = get_data_dates()
+        self.assertTrue(dates)
+        for date in dates:
+            self.__check_date(date)
+
+    def test_fallback(self):
+        """Test dates parsed with dateutil"""
+
+        self.__check_date("July 1st, 2016 at 17:48")
+        self.__check_date("2016-02-28T10:00:00 UTC")
+        with self.assertRaises(ValueError):
+            parse_date("2016-02-30T10:00:00Z")
+        with self.assertRaises(ValueError):
+            parse_date("not a date")
+
+    def test_epoch(self):
+        """Test unix timestamps"""
+
+        expected = datetime.datetime(2016, 7, 18, 22, 9, 52, tzinfo=tz.tzutc())
+        self.assertEqual(parse_date(1468879792), expected)
+        self.assertEqual(parse_date(1468879792.0), expected)
+        self.assertEqual(parse_date(expected), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
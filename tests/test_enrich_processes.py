@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import os
+import sys
+import time
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+import grimoire.elk.enrich
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.elk.enrich import Enrich
+
+
+class ProcessEnrich(Enrich):
+    """ Enrich backend recording the process enriching each item """
+
+    def __init__(self, *params):
+        super().__init__(*params)
+        self.found = {}  # data found enriching, as the GitHub geolocations
+
+    def get_rich_item(self, item):
+        # The first batches are slower, so they end after the next ones
+        time.sleep(0.002 * (10 - int(item["uuid"]) // 10 % 10))
+        if item["value"] % 7 == 0:
+            self.found[item["uuid"]] = item["value"]
+        return {"id": item["uuid"], "value": item["value"] * 2,
+                "pid": os.getpid()}
+
+    def get_process_updates(self):
+        (found, self.found) = (self.found, {})
+        return found
+
+    def add_process_updates(self, updates):
+        self.found.update(updates)
+
+
+class CheckpointReader(object):
+    """ Items reader calling on_checkpoint every 7 items, as ElasticReader """
+
+    def __init__(self, items, server):
+        self.items = items
+        self.server = server
+        self.on_checkpoint = None
+        self.checkpoints = []  # (items read, items uploaded) when saved
+
+    def __iter__(self):
+        for (i, item) in enumerate(self.items):
+            yield item
+            if (i + 1) % 7 == 0 and self.on_checkpoint:
+                self.on_checkpoint(self.__save(i + 1))
+
+    def __save(self, read):
+        def save():
+            self.checkpoints.append((read, len(self.server.uploaded)))
+        return save
+
+
+class UploadStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch recording the documents uploaded in order """
+
+    def do_PUT(self):
+        body = self._read_body().decode('utf-8')
+        if '/_bulk' in self.path:
+            self.server.uploaded += [json.loads(doc) for doc in body.splitlines()[1::2]]
+            self._answer({"errors": False})
+        else:
+            self._answer({"acknowledged": True})
+
+
+class TestEnrichProcesses(ElasticStubTestCase):
+    """Enrich the items in several processes"""
+
+    handler = UploadStubHandler
+    threaded = True
+
+    def setUp(self):
+        self.server.uploaded = []
+        # Several batches with a few items
+        self.enrich_batch = grimoire.elk.enrich.ENRICH_BATCH
+        grimoire.elk.enrich.ENRICH_BATCH = 10
+        self.items = [{"uuid": str(i), "value": i} for i in range(0, 95)]
+        self.enrich_backend = ProcessEnrich()
+        self.enrich_backend.set_elastic(ElasticSearch(self.url, "test_enrich_processes"))
+        self.enrich_backend.elastic.max_items_bulk = 15
+
+    def tearDown(self):
+        self.enrich_backend.close_processes()
+        grimoire.elk.enrich.ENRICH_BATCH = self.enrich_batch
+
+    def test_order(self):
+        """Test that the rich items are written in the order of the items"""
+
+        self.enrich_backend.enrich_processes = 2
+        total = self.enrich_backend.enrich_items(self.items)
+
+        self.assertEqual(total, 95)
+        uploaded = self.server.uploaded
+        self.assertEqual([doc["id"] for doc in uploaded],
+                         [item["uuid"] for item in self.items])
+        self.assertEqual([doc["value"] for doc in uploaded], [i * 2 for i in range(0, 95)])
+        pids = set(doc["pid"] for doc in uploaded)
+        self.assertLessEqual(len(pids), 2)
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_process_updates(self):
+        """Test that the data found in the processes is added in the parent"""
+
+        self.enrich_backend.enrich_processes = 2
+        self.enrich_backend.enrich_items(self.items)
+
+        self.assertEqual(self.enrich_backend.found,
+                         {str(i): i for i in range(0, 95) if i % 7 == 0})
+
+    def test_checkpoints(self):
+        """Test that the checkpoints are saved after their items are written"""
+
+        self.enrich_backend.enrich_processes = 2
+        reader = CheckpointReader(self.items, self.server)
+        self.enrich_backend.enrich_items(reader)
+
+        self.assertEqual([read for (read, uploaded) in reader.checkpoints],
+                         list(range(7, 95, 7)))
+        for (read, uploaded) in reader.checkpoints:
+            self.assertGreaterEqual(uploaded, read)
+
+    def test_serial(self):
+        """Test that the serial enrichment writes the same items"""
+
+        reader = CheckpointReader(self.items, self.server)
+        self.enrich_backend.enrich_items(reader)
+
+        self.assertEqual([doc["id"] for doc in self.server.uploaded],
+                         [item["uuid"] for item in self.items])
+        self.assertEqual(set(doc["pid"] for doc in self.server.uploaded), {os.getpid()})
+        self.assertEqual(len(reader.checkpoints), 13)
+        for (read, uploaded) in reader.checkpoints:
+            self.assertGreaterEqual(uploaded, read)
+
+
+if __name__ == "__main__":
+    unittest.main()
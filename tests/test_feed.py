@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import sys
+import unittest
+
+from datetime import datetime
+from urllib.parse import urlparse
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.ocean.conf import ConfOcean
+from grimoire.ocean.git import GitOcean
+
+ORIGIN = "https://github.com/chaoss/grimoirelab"
+INDEX = "test_feed"
+
+
+class FeedStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch storing the documents and the checkpoints """
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith('/conf/checkpoints/'):
+            checkpoint = self.server.checkpoints.get(path.split('/')[-1])
+            if checkpoint is None:
+                self._answer({"found": False}, 404)
+            else:
+                self._answer({"found": True, "_source": checkpoint})
+        elif path.endswith('/_settings'):
+            self._answer({INDEX: {"settings": {"index": {}}}})
+        else:
+            self._answer({})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body().decode('utf-8')
+        if path.endswith('/_search'):
+            # Last date of the items: no items
+            self._answer({"aggregations": {"1": {"value": None}}})
+        elif path.endswith('/_mget'):
+            self.server.mgets.append(json.loads(body)["ids"])
+            docs = []
+            for _id in json.loads(body)["ids"]:
+                if _id in self.server.docs:
+                    docs.append({"_id": _id, "found": True,
+                                 "_source": self.server.docs[_id]})
+                else:
+                    docs.append({"_id": _id, "found": False})
+            self._answer({"docs": docs})
+        else:
+            self._answer({})
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        body = self._read_body().decode('utf-8')
+        if path.startswith('/conf/checkpoints/'):
+            self.server.checkpoints[path.split('/')[-1]] = json.loads(body)
+            self.server.saved.append((json.loads(body)["items"], len(self.server.uploaded)))
+            self._answer({"created": True}, 201)
+        elif path.endswith('/_bulk'):
+            lines = body.splitlines()
+            items = []
+            for (action, doc) in zip(lines[0::2], lines[1::2]):
+                _id = json.loads(action)["index"]["_id"]
+                if _id in self.server.fail_ids:
+                    items.append({"index": {"status": 400, "error": "failed"}})
+                else:
+                    self.server.docs[_id] = json.loads(doc)
+                    self.server.uploaded.append(_id)
+                    items.append({"index": {"status": 201}})
+            self._answer({"errors": bool(self.server.fail_ids), "items": items})
+        else:
+            self._answer({"acknowledged": True})
+
+    def do_DELETE(self):
+        self.server.docs = {}
+        self._answer({"acknowledged": True})
+
+
+class PercevalBackend(object):
+    """ Perceval backend returning the items it is created with """
+
+    def __init__(self, items):
+        self.origin = ORIGIN
+        self.items = items
+        self.from_date = None
+
+    def fetch(self, from_date=None):
+        self.from_date = from_date
+        for item in self.items:
+            yield dict(item, data=dict(item['data']))
+
+
+def get_items(count, message="Initial commit"):
+    return [{"origin": ORIGIN,
+             "updated_on": 1451606400 + i * 3600,
+             "timestamp": 1451606400 + i * 3600,
+             "data": {"commit": "%040x" % i, "message": message}}
+            for i in range(0, count)]
+
+
+def get_id(i):
+    return "%040x_%s" % (i, ORIGIN)
+
+
+class TestFeed(ElasticStubTestCase):
+    """Feed raw items from Perceval to the ocean index"""
+
+    handler = FeedStubHandler
+
+    def setUp(self):
+        self.server.docs = {}
+        self.server.uploaded = []
+        self.server.mgets = []
+        self.server.checkpoints = {}
+        self.server.saved = []  # (items in checkpoint, items uploaded) when saved
+        self.server.fail_ids = set()
+        ConfOcean.set_elastic(ElasticSearch(self.url, ConfOcean.get_index()))
+
+    def tearDown(self):
+        ConfOcean.elastic = None
+        ConfOcean.requests_session = None
+
+    def __feed(self, items, checkpoints=False, skip_unchanged=False, bulk_workers=0,
+               clean=False):
+        perceval_backend = PercevalBackend(items)
+        ocean = GitOcean(perceval_backend)
+        elastic = ElasticSearch(self.url, INDEX, clean=clean, bulk_workers=bulk_workers,
+                                bulk_load=True)
+        elastic.max_items_bulk = 10
+        ocean.set_elastic(elastic)
+        if checkpoints:
+            ocean.checkpoint_id = INDEX + "_" + ORIGIN
+        ocean.skip_unchanged = skip_unchanged
+        ocean.feed()
+        elastic.close_bulk()
+        return perceval_backend
+
+    def test_feed(self):
+        """Test that all the items are uploaded in order with their dates"""
+
+        self.__feed(get_items(35))
+
+        self.assertEqual(self.server.uploaded, [get_id(i) for i in range(0, 35)])
+        doc = self.server.docs[get_id(1)]
+        self.assertEqual(doc["metadata__updated_on"], "2016-01-01T01:00:00+00:00")
+        self.assertEqual(doc["metadata__timestamp"], "2016-01-01T01:00:00+00:00")
+        self.assertEqual(doc["ocean-unique-id"], get_id(1))
+
+    def test_feed_error(self):
+        """Test that the errors fetching the items are raised"""
+
+        class FailingBackend(PercevalBackend):
+            def fetch(self, from_date=None):
+                yield from super().fetch(from_date)
+                raise RuntimeError("Fetch failed")
+
+        ocean = GitOcean(FailingBackend(get_items(15)))
+        ocean.set_elastic(ElasticSearch(self.url, INDEX))
+        with self.assertRaisesRegex(RuntimeError, "Fetch failed"):
+            ocean.feed()
+
+    def test_checkpoint(self):
+        """Test that the checkpoint is stored with the items indexed"""
+
+        self.__feed(get_items(35), checkpoints=True)
+
+        checkpoint = self.server.checkpoints[INDEX + "_" + ORIGIN.replace("/", "_")]
+        self.assertEqual(checkpoint["items"], 35)
+        self.assertGreater(checkpoint["batch"], 1)
+        self.assertEqual(checkpoint["last_date"], "2016-01-02T10:00:00+00:00")
+        self.assertIsNone(checkpoint["last_offset"])
+
+    def test_checkpoint_writers(self):
+        """Test that the bulk writers store the checkpoints after their items"""
+
+        self.__feed(get_items(35), checkpoints=True, bulk_workers=2)
+
+        self.assertEqual([items for (items, uploaded) in self.server.saved], [10, 20, 30, 35])
+        for (items, uploaded) in self.server.saved:
+            self.assertGreaterEqual(uploaded, items)
+
+    def test_resume(self):
+        """Test that a feed resumes from the last date of the checkpoint"""
+
+        checkpoint_id = INDEX + "_" + ORIGIN.replace("/", "_")
+        self.server.checkpoints[checkpoint_id] = {
+            "last_date": "2016-01-01T05:00:00+00:00", "last_offset": None,
+            "items": 6, "batch": 1
+        }
+        perceval_backend = self.__feed(get_items(10)[5:], checkpoints=True)
+
+        self.assertEqual(perceval_backend.from_date, datetime(2016, 1, 1, 5, 0))
+        checkpoint = self.server.checkpoints[checkpoint_id]
+        self.assertEqual(checkpoint["items"], 11)
+        self.assertEqual(checkpoint["batch"], 2)
+        self.assertEqual(checkpoint["last_date"], "2016-01-01T09:00:00+00:00")
+
+        # Without checkpoints the last date comes from the index
+        perceval_backend = self.__feed(get_items(10))
+        self.assertIsNone(perceval_backend.from_date)
+
+    def test_checkpoint_failed(self):
+        """Test that the checkpoint is not updated after items not indexed"""
+
+        self.server.fail_ids = {get_id(15)}
+        self.__feed(get_items(35), checkpoints=True)
+
+        checkpoint = self.server.checkpoints[INDEX + "_" + ORIGIN.replace("/", "_")]
+        # Only the pack before the failed item
+        self.assertEqual(checkpoint["items"], 10)
+        self.assertEqual(checkpoint["last_date"], "2016-01-01T09:00:00+00:00")
+        self.assertEqual(len(self.server.uploaded), 34)
+
+    def test_skip_unchanged(self):
+        """Test that the items with the same content hash are not uploaded"""
+
+        self.__feed(get_items(15), skip_unchanged=True)
+        self.assertEqual(len(self.server.uploaded), 15)
+        self.assertIn("ocean-content-hash", self.server.docs[get_id(0)])
+
+        # The same items with a new update date and two changed ones
+        items = get_items(15)
+        for item in items:
+            item["updated_on"] += 86400
+        items[3]["data"]["message"] = "Fix typo"
+        items[12]["data"]["message"] = "Fix typo"
+        self.server.uploaded = []
+        self.__feed(items + get_items(17)[15:], skip_unchanged=True)
+
+        self.assertEqual(self.server.uploaded, [get_id(3), get_id(12), get_id(15), get_id(16)])
+        self.assertEqual(sum(len(ids) for ids in self.server.mgets), 15 + 17)
+
+    def test_skip_unchanged_new_index(self):
+        """Test that the items are not checked in a new index in bulk load mode"""
+
+        self.__feed(get_items(15), skip_unchanged=True, clean=True)
+
+        self.assertEqual(len(self.server.uploaded), 15)
+        self.assertEqual(self.server.mgets, [])
+
+    def test_content_hash(self):
+        """Test that the hash depends only on the data of the item"""
+
+        ocean = GitOcean(PercevalBackend([]))
+        (item1, item2) = get_items(2)
+        item2["data"]["commit"] = item1["data"]["commit"]
+
+        self.assertEqual(ocean.get_content_hash(item1), ocean.get_content_hash(item2))
+        item2["data"] = dict(reversed(list(item2["data"].items())))
+        self.assertEqual(ocean.get_content_hash(item1), ocean.get_content_hash(item2))
+        item2["data"]["message"] = "Initial commit ñ"
+        self.assertNotEqual(ocean.get_content_hash(item1), ocean.get_content_hash(item2))
+
+
+if __name__ == "__main__":
+    unittest.main()
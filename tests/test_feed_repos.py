@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import sys
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.arthur import feed_repos
+from grimoire.ocean.conf import ConfOcean
+
+
+class FeedRecorder(object):
+    """ feed_backend replacement recording the repositories fed at once """
+
+    def __init__(self, failing=None):
+        self.failing = failing
+        self.lock = threading.Lock()
+        self.running = []
+        self.max_running = {}  # max repositories fed at once per backend
+        self.max_total = 0
+        self.fed = []
+        self.kwargs = []
+
+    def __call__(self, url, clean, fetch_cache, backend_name, backend_params,
+                 es_index=None, es_index_enrich=None, project=None, **kwargs):
+        with self.lock:
+            self.running.append(backend_name)
+            self.max_running[backend_name] = max(self.max_running.get(backend_name, 0),
+                                                 self.running.count(backend_name))
+            self.max_total = max(self.max_total, len(self.running))
+            self.kwargs.append(kwargs)
+        time.sleep(0.05)
+        with self.lock:
+            self.running.remove(backend_name)
+            self.fed.append(backend_params[0])
+        if backend_params[0] == self.failing:
+            raise RuntimeError("Can't feed %s" % self.failing)
+        return {"success": True}
+
+
+def get_repos(backend_name, count):
+    return [{"backend_name": backend_name,
+             "backend_params": ["%s-%i" % (backend_name, i)],
+             "index": backend_name, "index_enrich": backend_name + "_enrich",
+             "project": None}
+            for i in range(0, count)]
+
+
+class TestFeedRepos(unittest.TestCase):
+    """Feed several repositories at the same time"""
+
+    def setUp(self):
+        # Configured once before feeding the repositories
+        self.conf_elastic = object()
+        ConfOcean.elastic = self.conf_elastic
+
+    def tearDown(self):
+        ConfOcean.elastic = None
+
+    def test_dispatch(self):
+        """Test the limits of repositories fed at once per backend"""
+
+        repos = get_repos("gerrit", 4) + get_repos("git", 4) + get_repos("jira", 2)
+        recorder = FeedRecorder(failing="git-2")
+
+        with mock.patch('grimoire.arthur.feed_backend', recorder):
+            ok = feed_repos("http://localhost:9200", False, repos, workers=4,
+                            backend_workers={"git": 2}, checkpoints=True)
+
+        self.assertEqual(ok, 9)
+        self.assertEqual(sorted(recorder.fed),
+                         sorted(repo["backend_params"][0] for repo in repos))
+        self.assertEqual(recorder.max_total, 4)
+        self.assertEqual(recorder.max_running["gerrit"], 2)
+        self.assertEqual(recorder.max_running["git"], 2)
+        # The feeds don't configure ConfOcean again
+        self.assertTrue(all(kwargs == {"set_conf": False, "checkpoints": True}
+                            for kwargs in recorder.kwargs))
+        self.assertIs(ConfOcean.elastic, self.conf_elastic)
+
+    def test_one_backend(self):
+        """Test that the other workers wait for a backend with a limit"""
+
+        recorder = FeedRecorder()
+
+        with mock.patch('grimoire.arthur.feed_backend', recorder):
+            ok = feed_repos("http://localhost:9200", False, get_repos("git", 3),
+                            workers=4, backend_workers={"git": 0})
+
+        self.assertEqual(ok, 3)
+        self.assertEqual(recorder.max_total, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.elk.fields import METADATA_FIELDS, Field, compile_fields
+
+
+class TestFields(unittest.TestCase):
+    """Rich item fields extracted with compiled fields"""
+
+    def setUp(self):
+        self.item = {
+            "origin": "https://github.com/grimoirelab/perceval",
+            "metadata__updated_on": "2016-07-01T17:48:15+00:00",
+            "data": {
+                "commit": "456a68ee1407a77f3e804a30dff245bb6c6b872f",
+                "message": "Update README",
+                "files": {"README": {"added": 3}}
+            }
+        }
+
+    def test_copy(self):
+        """Test copied, translated and nested fields"""
+
+        extract_fields = compile_fields(
+            [Field(f) for f in METADATA_FIELDS] +
+            [Field("message", "data.message"),
+             Field("hash", ("data", "commit")),
+             Field("readme_added", "data.files.README.added")])
+
+        eitem = extract_fields(self.item)
+        self.assertEqual(eitem, {
+            "metadata__updated_on": "2016-07-01T17:48:15+00:00",
+            "metadata__timestamp": None,
+            "ocean-unique-id": None,
+            "origin": "https://github.com/grimoirelab/perceval",
+            "message": "Update README",
+            "hash": "456a68ee1407a77f3e804a30dff245bb6c6b872f",
+            "readme_added": 3
+        })
+        # A new rich item is created for each item
+        self.assertIsNot(extract_fields(self.item), eitem)
+        self.assertEqual([field.name for field in extract_fields.fields][-1], "readme_added")
+
+    def test_missing(self):
+        """Test defaults and required fields"""
+
+        extract_fields = compile_fields([Field("author", "data.Author", default="Unknown"),
+                                         Field("committer", "data.Commit")])
+        self.assertEqual(extract_fields(self.item), {"author": "Unknown", "committer": None})
+
+        extract_fields = compile_fields([Field("author", "data.Author", required=True)])
+        with self.assertRaises(KeyError):
+            extract_fields(self.item)
+
+        # Parents are always required
+        extract_fields = compile_fields([Field("title", "issue.title")])
+        with self.assertRaises(KeyError):
+            extract_fields(self.item)
+
+
+if __name__ == "__main__":
+    unittest.main()
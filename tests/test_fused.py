@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import sys
+import unittest
+
+from urllib.parse import urlparse
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.elk.github import GitHubEnrich
+from grimoire.ocean.git import GitOcean
+
+ORIGIN = "https://github.com/chaoss/grimoirelab"
+INDEX = "test_fused"
+INDEX_ENRICH = "test_fused_enrich"
+
+
+class BulkStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch recording the bulk requests per url """
+
+    def do_PUT(self):
+        body = self._read_body().decode('utf-8')
+        path = urlparse(self.path).path
+        if path.endswith('/_bulk'):
+            docs = [json.loads(doc) for doc in body.splitlines()[1::2]]
+            self.server.bulks.setdefault(path, []).append(docs)
+            self._answer({"errors": False})
+        else:
+            self._answer({"acknowledged": True})
+
+
+class PercevalBackend(object):
+    """ Perceval backend returning commits of users in several locations """
+
+    origin = ORIGIN
+
+    def fetch(self, from_date=None):
+        for i in range(0, 25):
+            yield {"origin": ORIGIN,
+                   "updated_on": 1451606400 + i * 3600,
+                   "timestamp": 1451606400 + i * 3600,
+                   "data": {"commit": "%040x" % i, "location": "City %i" % (i % 12)}}
+
+
+class MapsResponse(object):
+
+    def __init__(self, location):
+        self.location = location
+
+    def json(self):
+        lat = int(self.location.split()[1])
+        return {"results": [{"geometry": {"location": {"lat": lat, "lng": 0}}}]}
+
+
+class MapsSession(object):
+    """ Maps API answering a geocode for all the locations """
+
+    def __init__(self):
+        self.locations = []
+
+    def get(self, url, params=None):
+        self.locations.append(params['address'])
+        return MapsResponse(params['address'])
+
+
+class LocationEnrich(GitHubEnrich):
+    """ GitHub enrich backend adding only the geolocation of the user """
+
+    def get_rich_item(self, item):
+        return {"ocean-unique-id": item["ocean-unique-id"],
+                "user_geolocation": self.get_geo_point(item["data"]["location"])}
+
+
+class TestFused(ElasticStubTestCase):
+    """Feed and enrich the items in the same pipeline"""
+
+    handler = BulkStubHandler
+
+    def setUp(self):
+        self.server.bulks = {}
+
+    def test_fused(self):
+        """Test that the packs are enriched and only new geolocations are written"""
+
+        ocean = GitOcean(PercevalBackend())
+        elastic = ElasticSearch(self.url, INDEX)
+        elastic.max_items_bulk = 10
+        ocean.set_elastic(elastic)
+
+        enrich = LocationEnrich()
+        enrich.requests = MapsSession()
+        enrich.set_elastic(ElasticSearch(self.url, INDEX_ENRICH))
+        ocean.set_enrich(enrich)
+        ocean.feed()
+
+        raw = [doc for docs in self.server.bulks["/%s/items/_bulk" % INDEX] for doc in docs]
+        rich = [doc for docs in self.server.bulks["/%s/items/_bulk" % INDEX_ENRICH]
+                for doc in docs]
+        self.assertEqual(len(raw), 25)
+        self.assertEqual([doc["ocean-unique-id"] for doc in rich],
+                         [doc["ocean-unique-id"] for doc in raw])
+        self.assertEqual(rich[13]["user_geolocation"], {"lat": 1, "lon": 0})
+
+        # The maps API is used once per location
+        self.assertEqual(len(enrich.requests.locations), 12)
+        # Each pack writes only the geolocations found enriching it
+        geolocations = self.server.bulks["/github/geolocations/_bulk"]
+        self.assertEqual([len(docs) for docs in geolocations], [10, 2])
+        self.assertEqual(geolocations[1], [{"lat": 10, "lon": 0, "location": "City 10"},
+                                           {"lat": 11, "lon": 0, "location": "City 11"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import sys
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+import grimoire.elk.elastic
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+
+FIELD = "metadata__updated_on"
+
+# Origin, items and day of the last item
+ORIGINS = [("origin-%i" % i, 10 - i, i + 1) for i in range(0, 5)]
+
+
+def get_date(day):
+    return datetime(2016, 1, day, tzinfo=timezone.utc)
+
+
+def get_max(day):
+    date = get_date(day)
+    return {"value": date.timestamp() * 1000, "value_as_string": date.isoformat()}
+
+
+class OriginsStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch answering the max date per origin queries
+
+    server.composite is False to answer the composite aggregations with
+    an error, as ES < 6.1.
+    """
+
+    def do_POST(self):
+        query = json.loads(self._read_body().decode('utf-8'))
+        self.server.queries.append(query)
+        aggs = query["aggs"]
+
+        if "query" in query:
+            # Last date for one origin
+            origin = query["query"]["term"]["origin"]
+            days = [day for (name, items, day) in ORIGINS if name == origin]
+            self._answer({"aggregations": {"1": get_max(days[0])}})
+        elif "composite" in aggs["origins"]:
+            if not self.server.composite:
+                self._answer({"error": "unknown aggregation [composite]"}, 400)
+                return
+            composite = aggs["origins"]["composite"]
+            after = composite.get("after", {}).get("origin", "")
+            origins = [origin for origin in ORIGINS if origin[0] > after]
+            origins = origins[:composite["size"]]
+            buckets = [{"key": {"origin": name}, "1": get_max(day)}
+                       for (name, items, day) in origins]
+            answer = {"buckets": buckets}
+            if buckets:
+                answer["after_key"] = buckets[-1]["key"]
+            self._answer({"aggregations": {"origins": answer}})
+        else:
+            # terms aggregation: the origins with more items
+            size = aggs["origins"]["terms"]["size"]
+            origins = sorted(ORIGINS, key=lambda origin: -origin[1])
+            buckets = [{"key": name, "doc_count": items, "1": get_max(day)}
+                       for (name, items, day) in origins[:size]]
+            other = sum(items for (name, items, day) in origins[size:])
+            self._answer({"aggregations": {"origins": {
+                "buckets": buckets, "sum_other_doc_count": other}}})
+
+
+class TestLastByOrigin(ElasticStubTestCase):
+    """Last date of all the origins in an index"""
+
+    handler = OriginsStubHandler
+    threaded = True
+
+    def setUp(self):
+        self.server.queries = []
+        self.server.composite = True
+        self.origins_page = grimoire.elk.elastic.ORIGINS_PAGE
+        self.max_origins = grimoire.elk.elastic.MAX_ORIGINS
+        grimoire.elk.elastic.ORIGINS_PAGE = 2
+        self.elastic = ElasticSearch(self.url, "test_last_by_origin")
+
+    def tearDown(self):
+        grimoire.elk.elastic.ORIGINS_PAGE = self.origins_page
+        grimoire.elk.elastic.MAX_ORIGINS = self.max_origins
+
+    def __get_last_date(self, origin):
+        return self.elastic.get_last_date(FIELD, {"name": "origin", "value": origin})
+
+    def test_composite(self):
+        """Test that the origins are read in pages with a composite aggregation"""
+
+        last_dates = self.elastic.get_last_dates_by_origin(FIELD)
+
+        self.assertEqual(last_dates, {name: get_date(day) for (name, items, day) in ORIGINS})
+        afters = [query["aggs"]["origins"]["composite"].get("after")
+                  for query in self.server.queries]
+        self.assertEqual(afters, [None, {"origin": "origin-1"}, {"origin": "origin-3"}])
+
+    def test_terms(self):
+        """Test the terms aggregation if composite aggregations are not supported"""
+
+        self.server.composite = False
+        last_dates = self.elastic.get_last_dates_by_origin(FIELD)
+
+        self.assertEqual(last_dates, {name: get_date(day) for (name, items, day) in ORIGINS})
+        self.assertEqual(len(self.server.queries), 2)
+        self.assertIn("terms", self.server.queries[1]["aggs"]["origins"])
+
+    def test_cache(self):
+        """Test that the cached last dates are got once for all the origins"""
+
+        with ElasticSearch.cache_last_by_origin():
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                last_dates = list(executor.map(self.__get_last_date,
+                                               [name for (name, items, day) in ORIGINS]))
+            # Nested blocks share the cache
+            with ElasticSearch.cache_last_by_origin():
+                self.assertEqual(self.__get_last_date("origin-2"), get_date(3))
+            self.assertEqual(self.__get_last_date("unknown"), None)
+
+        self.assertEqual(last_dates, [get_date(day) for (name, items, day) in ORIGINS])
+        # The three pages of the composite aggregation
+        self.assertEqual(len(self.server.queries), 3)
+        self.assertIsNone(ElasticSearch.last_by_origin_cache)
+
+        # Without cache each origin is queried
+        self.server.queries = []
+        self.assertEqual(self.__get_last_date("origin-2"), get_date(3))
+        self.assertEqual(len(self.server.queries), 1)
+
+    def test_cache_truncated(self):
+        """Test that the origins not in a truncated terms aggregation are queried"""
+
+        self.server.composite = False
+        grimoire.elk.elastic.MAX_ORIGINS = 3
+
+        with ElasticSearch.cache_last_by_origin():
+            self.assertEqual(self.__get_last_date("origin-0"), get_date(1))
+            self.assertEqual(len(self.server.queries), 2)
+            # Not in the terms aggregation: the origin is queried alone
+            self.assertEqual(self.__get_last_date("origin-4"), get_date(5))
+            self.assertEqual(self.server.queries[2]["query"],
+                             {"term": {"origin": "origin-4"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import sys
+import time
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.elk.enrich import Enrich, get_gelk_version, metadata
+
+
+class MetadataEnrich(Enrich):
+
+    @metadata
+    def get_rich_item(self, item):
+        return {"id": item["id"]}
+
+
+class TestMetadata(unittest.TestCase):
+    """Metadata added to the enriched items"""
+
+    def setUp(self):
+        self.items = [{"id": i} for i in range(0, 100)]
+
+    def test_gelk_version(self):
+        """Test that the version is resolved once for all the enrichers"""
+
+        get_gelk_version.cache_clear()
+        versions = [MetadataEnrich().gelk_version for i in range(0, 10)]
+        self.assertEqual(len(set(versions)), 1)
+        self.assertEqual(get_gelk_version.cache_info().misses, 1)
+
+    def test_enriched_on(self):
+        """Test the enriched_on time shared in the metadata resolution"""
+
+        enrich_backend = MetadataEnrich()
+        enrich_backend.metadata_resolution = 3600
+        eitems = [enrich_backend.get_rich_item(item) for item in self.items]
+        self.assertEqual(len(set(eitem['metadata__enriched_on'] for eitem in eitems)), 1)
+        self.assertEqual(eitems[0]['metadata__gelk_backend_name'], 'MetadataEnrich')
+        self.assertEqual(eitems[0]['metadata__gelk_version'], get_gelk_version())
+
+        enrich_backend.metadata_resolution = 0
+        first = enrich_backend.get_rich_item(self.items[0])
+        time.sleep(0.01)
+        second = enrich_backend.get_rich_item(self.items[0])
+        self.assertNotEqual(first['metadata__enriched_on'], second['metadata__enriched_on'])
+
+
+if __name__ == "__main__":
+    unittest.main()
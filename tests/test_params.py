@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.utils import get_params_parser
+
+
+class TestParams(unittest.TestCase):
+    """p2o command line params"""
+
+    def setUp(self):
+        self.parser = get_params_parser()
+
+    def test_all_repos(self):
+        """Test feeding all the repositories without backend"""
+
+        args = self.parser.parse_args(['-e', 'http://localhost:9200', '--all-repos'])
+        self.assertTrue(args.all_repos)
+        self.assertIsNone(args.backend)
+        self.assertEqual(args.backend_args, [])
+
+    def test_repos_file(self):
+        """Test feeding the repositories in a file without backend"""
+
+        args = self.parser.parse_args(['-e', 'http://localhost:9200',
+                                       '--repos-file', 'repos.json',
+                                       '--repo-workers', '8',
+                                       '--backend-workers', 'gerrit:1'])
+        self.assertEqual(args.repos_file, 'repos.json')
+        self.assertEqual(args.repo_workers, 8)
+        self.assertEqual(args.backend_workers, 'gerrit:1')
+        self.assertIsNone(args.backend)
+
+    def test_backend(self):
+        """Test feeding one backend"""
+
+        args = self.parser.parse_args(['-e', 'http://localhost:9200', '--enrich',
+                                       'git', 'https://github.com/grimoirelab/perceval.git'])
+        self.assertEqual(args.backend, 'git')
+        self.assertEqual(args.backend_args, ['https://github.com/grimoirelab/perceval.git'])
+        self.assertFalse(args.all_repos)
+        self.assertIsNone(args.repos_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
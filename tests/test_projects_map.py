@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.elk.projects_map import ProjectsMap
+
+PROJECTS = {
+    "eclipse": {
+        "meta": {"title": "Eclipse"},
+        "git": ["https://github.com/eclipse/*"],
+        "gerrit": ["git.eclipse.org_*"]
+    },
+    "eclipse.platform": {
+        "git": ["https://github.com/eclipse/platform*"],
+        "pipermail": ["https://dev.eclipse.org/mailman/listinfo/platform-dev"]
+    },
+    "eclipse.platform.releng": {
+        "git": ["https://github.com/eclipse/platform.releng"],
+        "pipermail": ["https://dev.eclipse.org/mailman/listinfo/platform-dev"]
+    },
+    "chaoss": {
+        "git": ["glob:https://*/chaoss/*.git"]
+    },
+    "mailman": {
+        "pipermail": ["https://lists.example.org/archives/list?id=[dev]"]
+    }
+}
+
+
+class TestProjectsMap(unittest.TestCase):
+    """Repositories mapped to projects"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        os.mkdir(self.cache_dir)
+        self.json_file = os.path.join(self.tmp_dir, "projects.json")
+        with open(self.json_file, "w") as f:
+            json.dump(PROJECTS, f)
+
+    def tearDown(self):
+        ProjectsMap.cache_dir = None
+        shutil.rmtree(self.tmp_dir)
+
+    def __cache_files(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+
+    def test_matching(self):
+        """Test exact, prefix and pattern matching"""
+
+        prjs_map = ProjectsMap.from_json_file(self.json_file)
+        self.assertTrue(prjs_map)
+
+        find = prjs_map.find_project
+        self.assertEqual(find("git", "https://github.com/eclipse/platform.releng"),
+                         "eclipse.platform.releng")
+        # The longest prefix
+        self.assertEqual(find("git", "https://github.com/eclipse/platform.ui"), "eclipse.platform")
+        self.assertEqual(find("git", "https://github.com/eclipse/jetty"), "eclipse")
+        self.assertEqual(find("gerrit", "git.eclipse.org_jgit"), "eclipse")
+        self.assertEqual(find("git", "https://gitlab.com/chaoss/grimoirelab.git"), "chaoss")
+        self.assertIsNone(find("git", "https://gitlab.com/chaoss/grimoirelab"))
+        # Only glob: repositories are patterns
+        self.assertEqual(find("pipermail", "https://lists.example.org/archives/list?id=[dev]"),
+                         "mailman")
+        self.assertIsNone(find("pipermail", "https://lists.example.org/archives/list?id=d"))
+        self.assertIsNone(find("jira", "https://github.com/eclipse/jetty"))
+        # A repository in several projects is assigned to the leaf
+        self.assertEqual(find("pipermail", "https://dev.eclipse.org/mailman/listinfo/platform-dev"),
+                         "eclipse.platform.releng")
+
+    def test_project_fields(self):
+        """Test the project fields with the origin and the default project"""
+
+        prjs_map = ProjectsMap.from_json_file(self.json_file)
+
+        fields = prjs_map.get_project_fields("git", "https://github.com/eclipse/platform.releng")
+        self.assertEqual(fields, {"project": "eclipse.platform.releng",
+                                  "project_1": "eclipse",
+                                  "project_2": "eclipse.platform",
+                                  "project_3": "eclipse.platform.releng"})
+        # The fields are not shared between items
+        fields["project"] = None
+        self.assertEqual(prjs_map.get_project_fields("git", "https://github.com/eclipse/platform.releng")["project"],
+                         "eclipse.platform.releng")
+
+        fields = prjs_map.get_project_fields("git", "/tmp/perceval", "https://github.com/eclipse/jetty")
+        self.assertEqual(fields, {"project": "eclipse", "project_1": "eclipse"})
+        fields = prjs_map.get_project_fields("git", "/tmp/perceval", "https://github.com/chaoss/perceval")
+        self.assertEqual(fields, {"project": "Main", "project_1": "Main"})
+
+    def test_no_cache(self):
+        """Test that the compiled map is not stored without cache_dir"""
+
+        ProjectsMap.from_json_file(self.json_file)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["cache", "projects.json"])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_cache(self):
+        """Test the compiled map reused while the JSON file is not changed"""
+
+        ProjectsMap.cache_dir = self.cache_dir
+        ProjectsMap.from_json_file(self.json_file)
+        (cache_file,) = self.__cache_files()
+
+        # The map is read from the compiled one in the cache
+        with open(cache_file) as f:
+            cache = json.load(f)
+        cache["map"]["repos"]["git"]["https://github.com/eclipse/jetty"] = "jetty"
+        with open(cache_file, "w") as f:
+            json.dump(cache, f)
+        prjs_map = ProjectsMap.from_json_file(self.json_file)
+        self.assertEqual(prjs_map.find_project("git", "https://github.com/eclipse/jetty"), "jetty")
+        self.assertEqual(prjs_map.find_project("git", "https://github.com/eclipse/platform.ui"),
+                         "eclipse.platform")
+        self.assertEqual(prjs_map.find_project("git", "https://gitlab.com/chaoss/grimoirelab.git"),
+                         "chaoss")
+
+        # A modified JSON file is read again, even with the same mtime and size
+        stat = os.stat(self.json_file)
+        projects = dict(PROJECTS, chaoss={"git": ["glob:https://*/chaoss/*.gix"]})
+        with open(self.json_file, "w") as f:
+            json.dump(projects, f)
+        os.utime(self.json_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        prjs_map = ProjectsMap.from_json_file(self.json_file)
+        self.assertEqual(prjs_map.find_project("git", "https://github.com/eclipse/jetty"), "eclipse")
+        self.assertIsNone(prjs_map.find_project("git", "https://gitlab.com/chaoss/grimoirelab.git"))
+        self.assertEqual(self.__cache_files(), [cache_file])
+
+    def test_cache_invalid(self):
+        """Test that an invalid cache is built again from the JSON file"""
+
+        ProjectsMap.cache_dir = self.cache_dir
+        ProjectsMap.from_json_file(self.json_file)
+        (cache_file,) = self.__cache_files()
+
+        for data in ["", "not JSON", "42", '{"key": null}', '{"key": {}, "map": {}}']:
+            with open(cache_file, "w") as f:
+                f.write(data)
+            prjs_map = ProjectsMap.from_json_file(self.json_file)
+            self.assertEqual(prjs_map.find_project("git", "https://github.com/eclipse/jetty"),
+                             "eclipse")
+
+        # The cache is replaced, no temporary files are left
+        self.assertEqual(self.__cache_files(), [cache_file])
+        with open(cache_file) as f:
+            self.assertEqual(json.load(f)["key"]["source"], os.path.abspath(self.json_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
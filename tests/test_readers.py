@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from urllib.parse import parse_qs, urlparse
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.elk.reader import ScrollReader, SearchAfterReader, SlicedScrollReader
+from grimoire.ocean.elastic import ElasticOcean
+
+ORIGIN = "https://github.com/chaoss/grimoirelab"
+
+ITEMS = [{"id": "%02i" % i, "date": "2016-01-%02iT00:00:00" % (i // 2 + 1)}
+         for i in range(0, 10)]
+
+
+class ReadersStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch answering searches, scrolls and bulk requests """
+
+    def _hits(self, items):
+        return {"hits": {"hits": [{"_id": item["id"], "_source": item,
+                                   "sort": [item["date"], "items#" + item["id"]]}
+                                  for item in items]}}
+
+    def _scroll_page(self, offset, size):
+        answer = self._hits(self.server.items[offset:offset + size])
+        answer["_scroll_id"] = "%i:%i" % (offset + size, size)
+        return answer
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        body = json.loads(self._read_body().decode('utf-8') or '{}')
+        self.server.searches.append(body)
+        if url.path == '/_search/scroll':
+            (offset, size) = body["scroll_id"].split(':')
+            self._answer(self._scroll_page(int(offset), int(size)))
+        elif 'scroll' in params:
+            self._answer(self._scroll_page(0, int(params['size'][0])))
+        else:
+            # search_after
+            items = self.server.items
+            if "search_after" in body:
+                items = [item for item in items
+                         if [item["date"], "items#" + item["id"]] > body["search_after"]]
+            self._answer(self._hits(items[:int(params['size'][0])]))
+
+    def do_DELETE(self):
+        body = json.loads(self._read_body().decode('utf-8'))
+        self.server.cleared += body["scroll_id"]
+        self._answer({"succeeded": True})
+
+    def do_PUT(self):
+        self._read_body()
+        if '/_bulk' in self.path:
+            # Wait until the test lets the bulk requests be written
+            self.server.bulk_allowed.wait()
+            self._answer({"errors": False})
+        else:
+            self._answer({"acknowledged": True})
+
+
+class TestReaders(ElasticStubTestCase):
+    """Read the items of an index with scroll and search_after"""
+
+    handler = ReadersStubHandler
+    threaded = True
+
+    def setUp(self):
+        self.server.items = ITEMS
+        self.server.searches = []
+        self.server.cleared = []
+        self.server.bulk_allowed = threading.Event()
+        self.server.bulk_allowed.set()
+        self.elastic = ElasticSearch(self.url, "test_readers")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.tmp_dir.name, "cursor.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def __query(self, from_date="2016-01-01"):
+        return {
+            "query": {"bool": {"must": [{"range": {"date": {"gte": from_date}}}]}},
+            "sort": {"date": {"order": "asc"}}
+        }
+
+    def __read_state(self):
+        with open(self.state_file) as f_state:
+            return json.load(f_state)
+
+    def test_scroll(self):
+        """Test that all the items are read in pages and the scroll is cleared"""
+
+        reader = ScrollReader(self.elastic, self.__query(), page_size=3)
+        pages = list(reader.pages())
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual([item["id"] for page in pages for item in page],
+                         [item["id"] for item in ITEMS])
+        self.assertEqual(self.server.cleared, ["15:3"])
+
+    def test_scroll_prefetch(self):
+        """Test that prefetching the pages returns the same items"""
+
+        reader = ScrollReader(self.elastic, self.__query(), page_size=4, prefetch=True)
+        self.assertEqual(list(reader), ITEMS)
+
+    def test_sliced_scroll(self):
+        """Test that each slice reader asks for its slice"""
+
+        reader = SlicedScrollReader(self.elastic, self.__query(), 3, page_size=20)
+        for slice_reader in reader.readers():
+            list(slice_reader)
+        self.assertEqual([search["slice"] for search in self.server.searches
+                          if "query" in search],
+                         [{"id": 0, "max": 3}, {"id": 1, "max": 3}, {"id": 2, "max": 3}])
+
+    def test_ocean_items(self):
+        """Test the items of an ocean backend read in pages sorted by date"""
+
+        class PercevalBackend(object):
+            origin = ORIGIN
+
+        self.elastic.scroll_size = 4
+        self.elastic.scroll_prefetch = True
+        ocean = ElasticOcean(PercevalBackend())
+        ocean.set_elastic(self.elastic)
+
+        self.assertEqual(list(ocean), ITEMS)
+        search = self.server.searches[0]
+        self.assertEqual(search["query"], {"bool": {"must": [{"term": {"origin": ORIGIN}}]}})
+        self.assertEqual(search["sort"], {"metadata__updated_on": {"order": "asc"}})
+        # 3 pages and the empty one
+        self.assertEqual(len(self.server.searches), 4)
+
+        self.elastic.cursor = "search_after"
+        self.server.searches = []
+        self.assertEqual(list(ocean.fetch(["id"])), ITEMS)
+        self.assertEqual(self.server.searches[0]["_source"], ["id"])
+        self.assertIn("search_after", self.server.searches[1])
+
+    def test_search_after(self):
+        """Test that all the items are read in order with a total sort"""
+
+        reader = SearchAfterReader(self.elastic, self.__query(), page_size=4)
+
+        self.assertEqual(list(reader), ITEMS)
+        self.assertEqual(self.server.searches[0]["sort"],
+                         [{"date": {"order": "asc"}}, {"_uid": "asc"}])
+        self.assertEqual(self.server.searches[1]["search_after"],
+                         ["2016-01-02T00:00:00", "items#03"])
+
+    def test_search_after_state_written(self):
+        """Test that the read state is saved only once the items are written"""
+
+        self.server.bulk_allowed.clear()
+        writer = ElasticSearch(self.url, "test_readers_out", bulk_workers=1)
+        writer.max_items_bulk = 2
+        batcher = writer.get_bulk_batcher()
+
+        reader = SearchAfterReader(self.elastic, self.__query(), page_size=2,
+                                   state_file=self.state_file)
+        reader.on_checkpoint = batcher.on_written
+        items = iter(reader)
+        for i in range(0, 3):
+            item = next(items)
+            batcher.add(item["id"], item)
+
+        # The first page is processed but its bulk request is not written
+        self.assertFalse(os.path.exists(self.state_file))
+
+        self.server.bulk_allowed.set()
+        writer.flush_bulk()
+        state = self.__read_state()
+        self.assertEqual(list(state.values()), [["2016-01-01T00:00:00", "items#01"]])
+
+        # Other from date, as in an incremental read, resumes the read
+        reader = SearchAfterReader(self.elastic, self.__query("2016-01-02"),
+                                   page_size=2, state_file=self.state_file)
+        reader.on_checkpoint = batcher.on_written
+        self.assertEqual(list(reader), ITEMS[2:])
+        batcher.flush()
+        writer.close_bulk()
+
+        # The state is removed once all the items are read
+        self.assertEqual(self.__read_state(), {})
+
+    def test_search_after_no_checkpoints(self):
+        """Test that without checkpoints only the end of the read is saved"""
+
+        reader = SearchAfterReader(self.elastic, self.__query(), page_size=3,
+                                   state_file=self.state_file)
+        items = iter(reader)
+        for i in range(0, 7):
+            next(items)
+        self.assertFalse(os.path.exists(self.state_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
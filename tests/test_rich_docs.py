@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import os
+import sys
+import unittest
+
+from datetime import datetime
+from urllib.parse import urlparse
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, ElasticStubTestCase
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.elk.kitsune import KitsuneEnrich
+from grimoire.elk.mediawiki import MediaWikiEnrich
+from grimoire.elk.stackexchange import StackExchangeEnrich
+
+INDEX = "test_rich_docs"
+
+
+class BulkStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch recording the ids and docs of bulk requests """
+
+    def do_PUT(self):
+        body = self._read_body().decode('utf-8')
+        if urlparse(self.path).path.endswith('/_bulk'):
+            lines = body.splitlines()
+            for (action, doc) in zip(lines[0::2], lines[1::2]):
+                _id = json.loads(action)["index"]["_id"]
+                self.server.docs.append((_id, json.loads(doc)))
+            self._answer({"errors": False})
+        else:
+            self._answer({"acknowledged": True})
+
+
+def read_items(name):
+    """ Read the raw items of a data source as read from the ocean index """
+
+    with open(os.path.join("data", name + ".json")) as f:
+        items = json.load(f)
+    for item in items:
+        item['ocean-unique-id'] = item['uuid']
+        item['metadata__updated_on'] = \
+            datetime.fromtimestamp(item['updated_on']).isoformat()
+        item['metadata__timestamp'] = \
+            datetime.fromtimestamp(item['timestamp']).isoformat()
+    return items
+
+
+def connector(enrich_class, name):
+    """ Enrich backend with its connector name, without the connectors map """
+
+    class ConnectorEnrich(enrich_class):
+        def get_connector_name(self):
+            return name
+
+    return ConnectorEnrich()
+
+
+class TestRichDocs(ElasticStubTestCase):
+    """Several rich documents per raw item written by enrich_items"""
+
+    handler = BulkStubHandler
+
+    def setUp(self):
+        self.server.docs = []
+
+    def __enrich(self, enrich, name):
+        enrich.set_elastic(ElasticSearch(self.url, INDEX))
+        items = read_items(name)
+        total = enrich.enrich_items(items)
+        self.assertEqual(total, len(self.server.docs))
+        return items
+
+    def test_kitsune(self):
+        """Test that the questions and their answers are written"""
+
+        items = self.__enrich(connector(KitsuneEnrich, "kitsune"), "kitsune")
+
+        expected = []
+        for item in items:
+            expected.append(item['ocean-unique-id'])
+            expected += ["%s_%i" % (item['ocean-unique-id'], answer['id'])
+                         for answer in item['data'].get('answers_data', [])]
+        self.assertGreater(len(expected), len(items))
+        self.assertEqual([_id for (_id, doc) in self.server.docs], expected)
+
+        answers = [doc for (_id, doc) in self.server.docs if doc['type'] == 'answer']
+        self.assertEqual(len(answers), len(expected) - len(items))
+        self.assertEqual(answers[0]['title'], items[0]['data']['title'])
+
+    def test_stackexchange(self):
+        """Test that the questions and their answers are written"""
+
+        items = self.__enrich(connector(StackExchangeEnrich, "stackexchange"),
+                             "stackexchange")
+
+        expected = []
+        for item in items:
+            question_id = item['data']['question_id']
+            expected.append(str(question_id))
+            expected += ["%i_%i" % (question_id, answer['answer_id'])
+                         for answer in item['data'].get('answers', [])]
+        self.assertGreater(len(expected), len(items))
+        self.assertEqual([_id for (_id, doc) in self.server.docs], expected)
+
+        answers = [doc for (_id, doc) in self.server.docs if doc['type'] == 'answer']
+        self.assertEqual(len(answers), len(expected) - len(items))
+
+    def test_mediawiki(self):
+        """Test that a rich document is written for each page review"""
+
+        items = self.__enrich(connector(MediaWikiEnrich, "mediawiki"), "mediawiki")
+
+        revisions = [str(revision['revid']) for item in items
+                     for revision in item['data']['revisions']]
+        self.assertGreater(len(revisions), len(items))
+        self.assertEqual([_id for (_id, doc) in self.server.docs], revisions)
+
+
+if __name__ == "__main__":
+    unittest.main()
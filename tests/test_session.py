@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import socket
+import sys
+import unittest
+
+from time import time
+
+import requests
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from elastic_stub import ElasticStubHandler, start_server, stop_server
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.elk.session import DEAD_NODE_SECONDS, ElasticSession, NodePool, \
+    SessionFactory
+
+
+class NodeStubHandler(ElasticStubHandler):
+    """ Minimal ElasticSearch node recording the requests it gets """
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path == '/_nodes/http':
+            answer = {"nodes": {node: {"http": {"publish_address": address}}
+                                for (node, address) in self.server.cluster.items()}}
+            answer["nodes"]["no_http"] = {}
+        else:
+            answer = {}
+        self._answer(answer)
+
+
+def get_dead_url():
+    """ url of a port where nobody listens """
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return "http://127.0.0.1:%i" % port
+
+
+class TestNodePool(unittest.TestCase):
+    """Nodes used in round robin skipping the dead ones"""
+
+    def test_round_robin(self):
+        """Test that the nodes are used in order"""
+
+        pool = NodePool(["a", "b", "c"])
+        self.assertEqual([pool.get_node() for i in range(0, 5)], ["a", "b", "c", "a", "b"])
+
+    def test_dead_nodes(self):
+        """Test that the dead nodes are not used until they are retried"""
+
+        pool = NodePool(["a", "b", "c"])
+        pool.mark_dead("b")
+        self.assertEqual([pool.get_node() for i in range(0, 4)], ["a", "c", "a", "c"])
+
+        # All dead: the one dead for longer
+        pool.mark_dead("a")
+        pool.mark_dead("c")
+        pool.dead["c"] -= 10
+        self.assertEqual(pool.get_node(), "c")
+
+        # A node is retried after DEAD_NODE_SECONDS
+        pool.dead["a"] = time() - DEAD_NODE_SECONDS - 1
+        self.assertEqual(pool.get_node(), "a")
+        pool.mark_live("a")
+        self.assertNotIn("a", pool.dead)
+
+
+class TestFailover(unittest.TestCase):
+    """Requests sent to the live nodes of the cluster"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = []
+        cls.urls = []
+        for i in range(0, 2):
+            (server, url) = start_server(NodeStubHandler)
+            cls.servers.append(server)
+            cls.urls.append(url)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            stop_server(server)
+
+    def setUp(self):
+        for server in self.servers:
+            server.paths = []
+            server.cluster = {}
+        self.config = SessionFactory.get_config()
+        # Connection errors are not retried in the same node
+        SessionFactory.configure(retries=0)
+
+    def tearDown(self):
+        SessionFactory.configure(**self.config)
+
+    def test_failover(self):
+        """Test that the requests to a dead node are sent to the live ones"""
+
+        dead_url = get_dead_url()
+        session = ElasticSession(nodes=[dead_url] + self.urls)
+
+        for i in range(0, 4):
+            r = session.get(dead_url + "/index/_search?q=%i" % i)
+            self.assertEqual(r.status_code, 200)
+
+        self.assertIn(dead_url, session.node_pool.dead)
+        self.assertEqual(self.servers[0].paths, ["/index/_search?q=0", "/index/_search?q=2"])
+        self.assertEqual(self.servers[1].paths, ["/index/_search?q=1", "/index/_search?q=3"])
+
+    def test_all_dead(self):
+        """Test that the connection error is raised if all the nodes are dead"""
+
+        session = ElasticSession(nodes=[get_dead_url(), get_dead_url()])
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.get(session.base_url + "/index")
+        self.assertEqual(len(session.node_pool.dead), 2)
+
+    def test_other_urls(self):
+        """Test that the urls of other servers are not balanced"""
+
+        session = ElasticSession(nodes=[get_dead_url(), self.urls[0]])
+        session.get(self.urls[1] + "/other")
+        self.assertEqual(self.servers[1].paths, ["/other"])
+        self.assertEqual(self.servers[0].paths, [])
+
+    def test_elastic_nodes(self):
+        """Test an ElasticSearch with several nodes separated by commas"""
+
+        dead_url = get_dead_url()
+        elastic = ElasticSearch(dead_url + ", " + self.urls[1] + "/", "test_session")
+
+        self.assertEqual(elastic.index_url, dead_url + "/test_session")
+        self.assertEqual(self.servers[1].paths, ["/test_session"])
+        self.assertEqual(elastic.get_session_options()["url"],
+                         dead_url + "," + self.urls[1])
+
+    def test_sniff(self):
+        """Test that the nodes of the cluster are found with the first one"""
+
+        self.servers[0].cluster = {"node1": self.urls[0].split("//")[1],
+                                   "node2": "localhost/" + self.urls[1].split("//")[1]}
+        SessionFactory.configure(sniff=True)
+        session = SessionFactory.get_session(nodes=[self.urls[0]])
+
+        # The node without HTTP is not used
+        self.assertEqual(session.node_pool.nodes, self.urls)
+        for i in range(0, 2):
+            session.get(self.urls[0] + "/index")
+        self.assertEqual(self.servers[0].paths, ["/_nodes/http", "/index"])
+        self.assertEqual(self.servers[1].paths, ["/index"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#     Alvaro del Castillo <acs@bitergia.com>
+#
+
+import json
+import os
+import sys
+import unittest
+
+if not '..' in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire.elk.gerrit import GerritEnrich
+from grimoire.elk.git import GitEnrich
+from grimoire.elk.github import GitHubEnrich
+from grimoire.elk.jira import JiraEnrich
+from grimoire.elk.mbox import MBoxEnrich
+from grimoire.elk.phabricator import PhabricatorEnrich
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def source_includes(item, fields):
+    """ Filter item like ElasticSearch does with _source includes """
+
+    def filter_path(value, path):
+        if isinstance(value, list):
+            return [filter_path(v, path) for v in value]
+        if not isinstance(value, dict):
+            return value
+        key = path[0]
+        if key not in value:
+            return {}
+        if len(path) == 1:
+            return {key: value[key]}
+        return {key: filter_path(value[key], path[1:])}
+
+    def merge(target, source):
+        for key, value in source.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            elif isinstance(value, list) and isinstance(target.get(key), list):
+                for (t, s) in zip(target[key], value):
+                    if isinstance(s, dict):
+                        merge(t, s)
+            else:
+                target[key] = value
+        return target
+
+    filtered = {}
+    for field in fields:
+        merge(filtered, filter_path(item, field.split(".")))
+    return filtered
+
+
+class TestSourceFields(unittest.TestCase):
+    """Identities from the raw items filtered with the declared fields"""
+
+    def __check_identities(self, enrich_backend, data_file):
+        with open(os.path.join(DATA_DIR, data_file)) as f:
+            items = json.load(f)
+
+        fields = enrich_backend.get_fields_identities()
+        self.assertIsNotNone(fields)
+
+        for item in items:
+            filtered = source_includes(item, fields)
+            self.assertEqual(enrich_backend.get_identities(filtered),
+                             enrich_backend.get_identities(item))
+
+    def test_mbox(self):
+        """Test mbox identities with the declared fields"""
+        self.__check_identities(MBoxEnrich(), "mbox.json")
+
+    def test_gerrit(self):
+        """Test gerrit identities with the declared fields"""
+        self.__check_identities(GerritEnrich(), "gerrit.json")
+
+    def test_git(self):
+        """Test git identities with the declared fields"""
+        self.__check_identities(GitEnrich(), "git.json")
+
+    def test_github(self):
+        """Test github identities with the declared fields"""
+        self.__check_identities(GitHubEnrich(), "github.json")
+
+    def test_jira(self):
+        """Test jira identities with the declared fields"""
+        self.__check_identities(JiraEnrich(), "jira.json")
+
+    def test_phabricator(self):
+        """Test phabricator identities with the declared fields"""
+        self.__check_identities(PhabricatorEnrich(), "phabricator.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
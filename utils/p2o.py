@@ -24,12 +24,16 @@
 #
 
 from datetime import datetime
+import json
 import logging
 from os import sys
 from time import time, sleep
 
-from grimoire.arthur import feed_backend, enrich_backend
+from grimoire.arthur import feed_backend, enrich_backend, feed_repos
 
+from grimoire.elk.elastic import ElasticSearch
+from grimoire.elk.projects_map import ProjectsMap
+from grimoire.elk.session import SessionFactory, POOL_SIZE
 from grimoire.ocean.conf import ConfOcean
 
 from grimoire.utils import get_elastic
@@ -45,22 +49,35 @@ def get_params():
     return args
 
 
-def feed_backends(url, clean, debug = False, redis = None):
-    ''' Update Ocean for all existing backends '''
+def get_backend_workers(backend_workers):
+    ''' Dict with the max workers per backend from "backend:workers,..." '''
+
+    limits = {}
+    if backend_workers:
+        for limit in backend_workers.split(","):
+            (backend, workers) = limit.split(":")
+            limits[backend.strip()] = int(workers)
+    return limits
+
+def feed_backends(url, clean, repos_file=None, workers=4, backend_workers=None,
+                  **feed_params):
+    ''' Update Ocean for all existing backends, or the ones in repos_file,
+        feeding several repositories at the same time '''
 
     logging.info("Updating all Ocean")
-    elastic = get_elastic(url, ConfOcean.get_index(), clean)
+    # Never clean the conf index: it has the repositories to be fed
+    elastic = get_elastic(url, ConfOcean.get_index())
     ConfOcean.set_elastic(elastic)
-    fetch_cache = False
 
-    q = Queue('update', connection=Redis(redis), async=async_)
+    if repos_file:
+        with open(repos_file) as f:
+            repos = json.load(f)
+    else:
+        repos = ConfOcean.get_repos()
 
-    for repo in ConfOcean.get_repos():
-        task_feed = q.enqueue(feed_backend, url, clean, fetch_cache,
-                              repo['backend_name'], repo['backend_params'],
-                              repo['index'], repo['index_enrich'], repo['project'])
-        logging.info("Queued job")
-        logging.info(task_feed)
+    # All repos sharing an index get its last update with one query
+    with ElasticSearch.cache_last_by_origin():
+        feed_repos(url, clean, repos, workers, backend_workers, **feed_params)
 
 def enrich_backends(url, clean, debug = False, redis = None,
                     db_projects_map=None, db_sortinghat=None):
@@ -87,7 +104,7 @@ def loop_update(min_update_time, url, clean, debug, redis, enrich=False,
 
     while True:
         ustart_feed = time()
-        feed_backends(url, clean, debug, redis)
+        feed_backends(url, clean)
         update_time_feed = int(time()-ustart_feed)
         logging.info("Ocean update time: %i minutes" % (update_time_feed/60))
         update_sleep = min_update_time - update_time_feed
@@ -113,31 +130,87 @@ if __name__ == '__main__':
 
     config_logging(args.debug)
 
+    pool_size = args.http_pool_size
+    if not pool_size and (args.repos_file or args.all_repos):
+        # A connection for each repository fed at the same time
+        pool_size = max(POOL_SIZE, args.repo_workers)
+
+    SessionFactory.configure(pool_size, args.http_timeout,
+                             args.http_retries, args.elastic_sniff)
+
+    ProjectsMap.cache_dir = args.projects_map_cache
+
     url = args.elastic_url
 
     clean = args.no_incremental
     if args.fetch_cache:
         clean = True
 
+    # Enrich the items while feeding, the other enrich modes work over ES
+    fused_enrich = args.fused_enrich and args.enrich and \
+        not (args.enrich_only or args.only_identities or args.only_studies or
+             args.refresh_projects or args.refresh_identities)
+
+    enrich_params = None
+    if fused_enrich:
+        enrich_params = {
+            "db_projects_map": args.db_projects_map,
+            "json_projects_map": args.json_projects_map,
+            "db_sortinghat": args.db_sortinghat,
+            "db_user": args.db_user,
+            "db_password": args.db_password,
+            "db_host": args.db_host,
+            "github_token": args.github_token,
+            "url_enrich": args.elastic_url_enrich,
+            "events_enrich": args.events_enrich,
+            "enrich_processes": args.enrich_processes
+        }
+
     try:
-        if args.backend:
+        if args.repos_file or args.all_repos:
+            if (args.enrich or args.enrich_only) and not fused_enrich:
+                # The repositories are only enriched while they are fed
+                logging.error("Use --fused-enrich to enrich the repositories")
+                sys.exit(1)
+            feed_backends(url, clean, args.repos_file, args.repo_workers,
+                          get_backend_workers(args.backend_workers),
+                          bulk_workers=args.bulk_workers,
+                          dead_letter_file=args.bulk_dead_letter,
+                          compress=args.compress, bulk_load=args.bulk_load,
+                          force_merge=args.force_merge,
+                          checkpoints=args.checkpoints,
+                          skip_unchanged=args.skip_unchanged,
+                          enrich_params=enrich_params)
+            logging.info("Repositories feed completed")
+        elif args.backend:
             if not args.enrich_only:
                 feed_backend(url, clean, args.fetch_cache,
                              args.backend, args.backend_args,
-                             args.index, args.index_enrich, args.project)
+                             args.index, args.index_enrich, args.project,
+                             args.bulk_workers, args.bulk_dead_letter,
+                             args.compress, args.bulk_load, args.force_merge,
+                             args.checkpoints, args.skip_unchanged,
+                             enrich_params)
                 logging.info("Backed feed completed")
 
-            if args.enrich or args.enrich_only:
+            if fused_enrich and not args.studies:
+                logging.info("Items enriched while feeding")
+            elif args.enrich or args.enrich_only:
                 enrich_backend(url, clean, args.backend, args.backend_args,
                                args.index, args.index_enrich,
                                args.db_projects_map, args.json_projects_map,
                                args.db_sortinghat,
                                args.no_incremental, args.only_identities,
                                args.github_token,
-                               args.studies, args.only_studies,
+                               args.studies, args.only_studies or fused_enrich,
                                args.elastic_url_enrich, args.events_enrich,
                                args.db_user, args.db_password, args.db_host,
-                               args.refresh_projects, args.refresh_identities)
+                               args.refresh_projects, args.refresh_identities,
+                               args.bulk_workers, args.bulk_dead_letter,
+                               args.compress, args.bulk_load, args.force_merge,
+                               args.scroll_size, args.scroll_prefetch,
+                               args.workers, args.cursor, args.cursor_state,
+                               args.enrich_processes)
                 logging.info("Enrich backend completed")
             elif args.events_enrich:
                 logging.info("Enrich option is needed for events_enrich")